@@ -153,6 +153,21 @@ else:
         },
     }
 
+# Shared by all the web processes, cached values invalidated by one are gone for all
+if DEBUG_ENV:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL', 'redis://'),
+        }
+    }
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
@@ -239,6 +254,36 @@ else:
                 # ... other options like 'location', 'default_acl', etc.
             },
         },
+        "videos": {
+            # Video files and HLS renditions: private objects outside the
+            # public media prefix, streamed through presigned URLs only
+            # (`manage.py move_videos_to_private_storage` moves older ones)
+            "BACKEND": "storages.backends.s3.S3Storage",
+            "OPTIONS": {
+                "bucket_name": AWS_STORAGE_BUCKET_NAME,
+                "access_key": AWS_ACCESS_KEY_ID,
+                "secret_key": AWS_SECRET_ACCESS_KEY,
+                "location": "private",
+                "default_acl": "private",
+                "querystring_auth": True,
+                "custom_domain": None,
+                "signature_version": "s3v4",
+            },
+        },
+        "whatsapp_media": {
+            # Cached WhatsApp media: private objects shared by the web and
+            # worker processes, served through the media endpoint
+            "BACKEND": "storages.backends.s3.S3Storage",
+            "OPTIONS": {
+                "bucket_name": AWS_STORAGE_BUCKET_NAME,
+                "access_key": AWS_ACCESS_KEY_ID,
+                "secret_key": AWS_SECRET_ACCESS_KEY,
+                "location": "private",
+                "default_acl": "private",
+                "querystring_auth": True,
+                "custom_domain": None,
+            },
+        },
         "staticfiles": {
             "BACKEND": "storages.backends.s3.S3Storage",
             "OPTIONS": {
@@ -309,7 +354,50 @@ CKEDITOR_CONFIGS = {
 }
 
 DJANGO_IMAGE_URL = os.getenv('DJANGO_IMAGE_URL', 'http://127.0.0.1:8000')
-FILE_UPLOAD_MAX_MEMORY_SIZE = 100 * 1024 * 1024
+# Larger multipart files are spooled to a temporary file instead of worker memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024
+
+# Resumable uploads of video and product files (ICCapp/uploads.py): chunk
+# size (S3 multipart parts need at least 5 MB), largest file, and the
+# directory holding unfinished uploads when the storage is local
+RESUMABLE_UPLOAD_CHUNK_SIZE = int(os.getenv('RESUMABLE_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+RESUMABLE_UPLOAD_MAX_SIZE = int(os.getenv('RESUMABLE_UPLOAD_MAX_SIZE', 10 * 1024 * 1024 * 1024))
+RESUMABLE_UPLOAD_DIR = os.getenv('RESUMABLE_UPLOAD_DIR', os.path.join(BASE_DIR, 'resumable_uploads'))
+
+# Seconds a user's set of bought services, products and videos stays cached
+# (ICCapp/entitlements.py), purchases invalidate it right away
+ENTITLEMENT_CACHE_SECONDS = int(os.getenv('ENTITLEMENT_CACHE_SECONDS', 3600))
+
+# Days after which a purchase counts half in the trending listings
+# (`manage.py recompute_trending` rebuilds the scores after a change)
+TRENDING_HALF_LIFE_DAYS = float(os.getenv('TRENDING_HALF_LIFE_DAYS', 7))
+TRENDING_RECOMPUTE_INTERVAL = int(os.getenv('TRENDING_RECOMPUTE_INTERVAL', 3600))
+
+# Resized image variants (`manage.py generate_image_variants`): widths in px,
+# WebP quality, AVIF output (needs pillow-avif-plugin) and worker processes
+IMAGE_VARIANT_WIDTHS = [int(w) for w in os.getenv('IMAGE_VARIANT_WIDTHS', '320,640,1280').split(',')]
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', 80))
+IMAGE_VARIANT_AVIF = os.getenv('IMAGE_VARIANT_AVIF', 'False') == 'True'
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+
+# Video streaming (vidoes/streaming.py): lifetime of signed stream links and
+# presigned S3 URLs, and optional hand-off of local files to the web server
+# (nginx `internal` location prefix for X-Accel-Redirect, or X-Sendfile)
+VIDEO_STREAM_URL_MAX_AGE = int(os.getenv('VIDEO_STREAM_URL_MAX_AGE', 300))
+# How long a started stream keeps playing (seeks, HLS segments) on the playback
+# token its link was exchanged for
+VIDEO_STREAM_PLAYBACK_MAX_AGE = int(os.getenv('VIDEO_STREAM_PLAYBACK_MAX_AGE', 6 * 3600))
+VIDEO_STREAM_ACCEL_REDIRECT_PREFIX = os.getenv('VIDEO_STREAM_ACCEL_REDIRECT_PREFIX', '')
+VIDEO_STREAM_SENDFILE = os.getenv('VIDEO_STREAM_SENDFILE', 'False') == 'True'
+# HLS packaging (`manage.py transcode_videos`): ffmpeg processes per worker,
+# attempts before a video is marked failed and segment length (seconds)
+VIDEO_TRANSCODE_WORKERS = int(os.getenv('VIDEO_TRANSCODE_WORKERS', 2))
+VIDEO_TRANSCODE_MAX_ATTEMPTS = int(os.getenv('VIDEO_TRANSCODE_MAX_ATTEMPTS', 3))
+VIDEO_HLS_SEGMENT_SECONDS = int(os.getenv('VIDEO_HLS_SEGMENT_SECONDS', 6))
+VIDEO_FFMPEG_BINARY = os.getenv('VIDEO_FFMPEG_BINARY', 'ffmpeg')
+VIDEO_FFPROBE_BINARY = os.getenv('VIDEO_FFPROBE_BINARY', 'ffprobe')
+# Length (seconds) of the hover preview clip cut by the same worker
+VIDEO_PREVIEW_SECONDS = int(os.getenv('VIDEO_PREVIEW_SECONDS', 6))
 
 # whatsappAPI settings
 WHATSAPP_ACCESS_TOKEN = os.getenv('WHATSAPP_ACCESS_TOKEN')
@@ -317,6 +405,42 @@ WHATSAPP_FROM_PHONE_NUMBER_ID = os.getenv('WHATSAPP_PHONENUMBER_ID')
 WHATSAPP_VERSION = os.getenv('WHATSAPP_VERSION')
 WHATSAPP_WEBHOOK_TOKEN = os.getenv('TOKEN')
 
+# Shared Graph API client (whatsappAPI/client.py)
+WHATSAPP_GRAPH_API_URL = os.getenv('WHATSAPP_GRAPH_API_URL', 'https://graph.facebook.com')
+WHATSAPP_API_TIMEOUT = float(os.getenv('WHATSAPP_API_TIMEOUT', 30))
+WHATSAPP_API_MAX_RETRIES = int(os.getenv('WHATSAPP_API_MAX_RETRIES', 3))
+WHATSAPP_API_BACKOFF = float(os.getenv('WHATSAPP_API_BACKOFF', 0.5))
+
+# Template broadcasts (sent by `manage.py send_broadcasts`), per worker process
+WHATSAPP_BROADCAST_RATE = float(os.getenv('WHATSAPP_BROADCAST_RATE', 20))
+WHATSAPP_BROADCAST_CONCURRENCY = int(os.getenv('WHATSAPP_BROADCAST_CONCURRENCY', 10))
+# Agent messages (`manage.py send_outbound_messages`): in-flight requests per
+# worker, attempts before a message is marked failed and base backoff (seconds)
+WHATSAPP_OUTBOUND_CONCURRENCY = int(os.getenv('WHATSAPP_OUTBOUND_CONCURRENCY', 10))
+WHATSAPP_OUTBOUND_MAX_ATTEMPTS = int(os.getenv('WHATSAPP_OUTBOUND_MAX_ATTEMPTS', 5))
+WHATSAPP_OUTBOUND_BACKOFF = float(os.getenv('WHATSAPP_OUTBOUND_BACKOFF', 2))
+
+# Window (seconds) over which WebSocket updates are coalesced into one frame
+WHATSAPP_FANOUT_WINDOW = float(os.getenv('WHATSAPP_FANOUT_WINDOW', 0.15))
+# Window (seconds) over which seen acknowledgements from the contacts socket are batched
+WHATSAPP_SEEN_DEBOUNCE = float(os.getenv('WHATSAPP_SEEN_DEBOUNCE', 0.5))
+# Publish outbox events from the writing process instead of `manage.py relay_outbox`
+# (the in-memory channel layer used with DEBUG_ENV does not cross processes)
+WHATSAPP_OUTBOX_INLINE_RELAY = os.getenv('WHATSAPP_OUTBOX_INLINE_RELAY', str(DEBUG_ENV)) == 'True'
+
+# Webhook ingestion queue (drained by `manage.py process_webhook_queue`)
+WHATSAPP_WEBHOOK_QUEUE_WORKERS = int(os.getenv('WHATSAPP_WEBHOOK_QUEUE_WORKERS', 4))
+WHATSAPP_WEBHOOK_QUEUE_BATCH_SIZE = int(os.getenv('WHATSAPP_WEBHOOK_QUEUE_BATCH_SIZE', 50))
+WHATSAPP_WEBHOOK_QUEUE_CLAIM_TIMEOUT = int(os.getenv('WHATSAPP_WEBHOOK_QUEUE_CLAIM_TIMEOUT', 300))
+WHATSAPP_WEBHOOK_QUEUE_MAX_ATTEMPTS = int(os.getenv('WHATSAPP_WEBHOOK_QUEUE_MAX_ATTEMPTS', 5))
+WHATSAPP_WEBHOOK_QUEUE_BACKOFF = float(os.getenv('WHATSAPP_WEBHOOK_QUEUE_BACKOFF', 2))
+# Days of webhook journal kept before `manage.py archive_webhook_events` exports and deletes them
+WHATSAPP_WEBHOOK_JOURNAL_RETENTION_DAYS = int(os.getenv('WHATSAPP_WEBHOOK_JOURNAL_RETENTION_DAYS', 90))
+
+# Content-addressed cache for media proxied from the Graph API, blobs in the
+# "whatsapp_media" storage (default storage in DEBUG_ENV)
+WHATSAPP_MEDIA_CACHE_MAX_BYTES = int(os.getenv('WHATSAPP_MEDIA_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+
 
 SIMPLE_JWT = {
     # Access token valid for 7 days
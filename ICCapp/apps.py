@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class IccappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ICCapp'
+
+    def ready(self):
+        from . import entitlements, imagevariants, trending
+        entitlements.connect_signals()
+        imagevariants.connect_signals()
+        trending.connect_signals()
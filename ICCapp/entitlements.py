@@ -0,0 +1,95 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete
+from .models import Entitlement
+
+CACHE_SECONDS = getattr(settings, 'ENTITLEMENT_CACHE_SECONDS', 3600)
+
+# Entitlement kind: (item model, buyers many-to-many field)
+ENTITLEMENT_KINDS = {
+    'service': ('services.Service', 'userIDs_that_bought_this_service'),
+    'product': ('products.Product', 'userIDs_that_bought_this_product'),
+    'video': ('vidoes.Video', 'userIDs_that_bought_this_video'),
+}
+
+
+def cache_key(user_id):
+    return f'entitlements:{user_id}'
+
+
+def invalidate(user_ids):
+    # After the commit, a reader in between would cache the previous set again
+    keys = [cache_key(user_id) for user_id in set(user_ids)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+# --------------------------------------------------------------------------
+# Lookups
+# --------------------------------------------------------------------------
+def owned_ids(user_id):
+    """{kind: set of item ids} the user bought, from the cache or one indexed query."""
+    owned = cache.get(cache_key(user_id))
+    if owned is None:
+        owned = {kind: [] for kind in ENTITLEMENT_KINDS}
+        for kind, object_id in Entitlement.objects.filter(user_id=user_id).values_list('kind', 'object_id'):
+            owned[kind].append(object_id)
+        cache.set(cache_key(user_id), owned, CACHE_SECONDS)
+    return {kind: set(ids) for kind, ids in owned.items()}
+
+
+def owns(user_id, kind, object_id):
+    return object_id in owned_ids(user_id)[kind]
+
+
+def owned_among(user_id, items):
+    """The ids of `items` ({kind: item ids}) the user bought, by kind and in the given order."""
+    owned = owned_ids(user_id)
+    return {kind: [object_id for object_id in ids if object_id in owned[kind]] for kind, ids in items.items()}
+
+
+# --------------------------------------------------------------------------
+# Mirroring the buyers many-to-many fields
+# --------------------------------------------------------------------------
+def kind_of(label):
+    return next(kind for kind, (item_label, _) in ENTITLEMENT_KINDS.items() if item_label.lower() == label.lower())
+
+
+def buyers_through(kind):
+    label, field = ENTITLEMENT_KINDS[kind]
+    return apps.get_model(label)._meta.get_field(field).remote_field.through
+
+
+def buyers_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    # Forward: instance is the item and pk_set the users, reverse the other way round
+    kind = kind_of(instance._meta.label if not reverse else model._meta.label)
+    if action in ('post_add', 'post_remove'):
+        pairs = [(instance.pk, pk) for pk in pk_set] if reverse else [(pk, instance.pk) for pk in pk_set]
+        if action == 'post_add':
+            Entitlement.objects.bulk_create(
+                [Entitlement(user_id=user_id, kind=kind, object_id=object_id) for user_id, object_id in pairs],
+                ignore_conflicts=True,
+            )
+        else:
+            for user_id, object_id in pairs:
+                Entitlement.objects.filter(user_id=user_id, kind=kind, object_id=object_id).delete()
+        invalidate(user_id for user_id, _ in pairs)
+    elif action == 'pre_clear':
+        rows = Entitlement.objects.filter(kind=kind, **{'user_id' if reverse else 'object_id': instance.pk})
+        invalidate(rows.values_list('user_id', flat=True))
+        rows.delete()
+
+
+def item_deleted(sender, instance, **kwargs):
+    # Deleting an item drops its buyers rows without m2m_changed
+    rows = Entitlement.objects.filter(kind=kind_of(sender._meta.label), object_id=instance.pk)
+    invalidate(rows.values_list('user_id', flat=True))
+    rows.delete()
+
+
+def connect_signals():
+    for kind, (label, _) in ENTITLEMENT_KINDS.items():
+        m2m_changed.connect(buyers_changed, sender=buyers_through(kind), dispatch_uid=f'entitlements:{kind}')
+        post_delete.connect(item_deleted, sender=label, dispatch_uid=f'entitlements:delete:{kind}')
@@ -0,0 +1,184 @@
+import io
+import math
+import os
+import random
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+from django.db.models.signals import post_save
+from django.utils import timezone
+from PIL import Image, ImageOps
+from .models import ImageVariantTask
+from utils import claim_batch
+
+try:
+    # Optional Pillow plugin (pillow-avif-plugin) adding AVIF encoding
+    import pillow_avif  # noqa: F401
+    AVIF_AVAILABLE = True
+except ImportError:
+    AVIF_AVAILABLE = False
+
+WIDTHS = tuple(sorted(getattr(settings, 'IMAGE_VARIANT_WIDTHS', (320, 640, 1280))))
+MAX_ATTEMPTS = 3
+CLAIM_TIMEOUT = timedelta(minutes=10)
+EXIF_ORIENTATION = 0x0112
+
+# extension: (Pillow format, save options)
+FORMATS = {'webp': ('WEBP', {'quality': getattr(settings, 'IMAGE_VARIANT_QUALITY', 80), 'method': 4})}
+if getattr(settings, 'IMAGE_VARIANT_AVIF', False) and AVIF_AVAILABLE:
+    FORMATS['avif'] = ('AVIF', {'quality': 50})
+
+# Image fields that get variants, stored in the model's `<field>_variants` JSONField
+VARIANT_FIELDS = (
+    ('services.Service', 'preview'),
+    ('products.Product', 'preview'),
+    ('vidoes.Video', 'thumbnail'),
+    ('blog.Blog', 'img'),
+    ('ICCapp.Organization', 'logo'),
+    ('ICCapp.Staff', 'img'),
+    ('ICCapp.Testimonial', 'img'),
+    ('ICCapp.Department', 'img'),
+    (settings.AUTH_USER_MODEL, 'avatar'),
+)
+
+
+# --------------------------------------------------------------------------
+# Queueing (on upload and by backfill_image_variants)
+# --------------------------------------------------------------------------
+def needs_variants(instance, field):
+    image = getattr(instance, field)
+    return bool(image) and (getattr(instance, f'{field}_variants') or {}).get('source') != image.name
+
+
+def queue_variants(instance, field):
+    """Queue the variants of an instance's image unless they exist already. Returns whether a task was queued."""
+    if not needs_variants(instance, field):
+        return False
+    task, created = ImageVariantTask.objects.get_or_create(
+        model=instance._meta.label, object_id=str(instance.pk), field=field, name=getattr(instance, field).name,
+    )
+    return created or bool(restart(ImageVariantTask.objects.filter(pk=task.pk)))
+
+
+def restart(tasks):
+    """
+    Start the failed or finished tasks among `tasks` over, for images that
+    still lack their variants (a finished task's variants are discarded
+    when the image changed meanwhile). Returns how many were restarted.
+    """
+    return tasks.filter(status__in=['failed', 'done']).update(
+        status='pending', attempts=0, last_error='', next_attempt_at=timezone.now(),
+    )
+
+
+def image_saved(sender, instance, update_fields=None, **kwargs):
+    for label, field in VARIANT_FIELDS:
+        if label.lower() != sender._meta.label.lower():
+            continue
+        if update_fields is not None and field not in update_fields:
+            continue
+        queue_variants(instance, field)
+
+
+def connect_signals():
+    for label in {label for label, _ in VARIANT_FIELDS}:
+        post_save.connect(image_saved, sender=label, dispatch_uid=f'image_variants:{label}')
+
+
+# --------------------------------------------------------------------------
+# Claiming and recording (generate_image_variants worker process)
+# --------------------------------------------------------------------------
+def claim_tasks(worker_name, batch_size):
+    now = timezone.now()
+    claimable = (
+        Q(status='pending', next_attempt_at__lte=now)
+        | Q(status='processing', claimed_at__lt=now - CLAIM_TIMEOUT)
+    )
+    return claim_batch(
+        ImageVariantTask.objects.filter(claimable),
+        worker_name,
+        batch_size,
+        status='processing',
+        attempts=F('attempts') + 1,
+    )
+
+
+def record_result(task, variants=None, error=''):
+    """
+    Store the variants on the image's row, only while it still holds the
+    same file, and delete the variants of the file it replaced.
+    """
+    if variants is not None:
+        model = apps.get_model(task.model)
+        rows = model.objects.filter(pk=task.object_id, **{task.field: task.name})
+        previous = rows.values_list(f'{task.field}_variants', flat=True).first()
+        if rows.update(**{f'{task.field}_variants': variants}):
+            if previous and previous.get('source') != task.name:
+                delete_variants(previous)
+        else:
+            # The image was replaced or deleted meanwhile
+            delete_variants(variants)
+        task.status = 'done'
+        task.last_error = ''
+    elif task.attempts >= MAX_ATTEMPTS:
+        task.status = 'failed'
+        task.last_error = error
+    else:
+        task.status = 'pending'
+        task.last_error = error
+        task.next_attempt_at = timezone.now() + timedelta(seconds=random.uniform(30, 60) * 2 ** task.attempts)
+    task.claimed_by = ''
+    task.claimed_at = None
+    task.save(update_fields=['status', 'last_error', 'next_attempt_at', 'claimed_by', 'claimed_at'])
+
+
+def delete_variants(variants):
+    for widths in (variants.get('formats') or {}).values():
+        for name in widths.values():
+            default_storage.delete(name)
+
+
+# --------------------------------------------------------------------------
+# Resizing (runs in the pool processes)
+# --------------------------------------------------------------------------
+def variant_widths(width):
+    """The configured widths below the image's own width, or the image's width for a smaller image."""
+    return [w for w in WIDTHS if w < width] or [width]
+
+
+def generate_variants(name):
+    """
+    Resize a stored image to every variant width in every format, saved next
+    to the original as `<name>_<width>w.<format>`. Returns the variants map
+    {'source': name, 'formats': {format: {width: storage name}}}.
+    """
+    with default_storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        width, height = image.size
+        if image.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+            # Stored a quarter turn off, displayed the other way round
+            width, height = height, width
+        widths = variant_widths(width)
+        # Decode JPEGs at a reduced scale, no smaller than the largest variant
+        scale = max(widths) / width
+        image.draft('RGB', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        image = ImageOps.exif_transpose(image)
+
+    transparent = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if transparent else 'RGB')
+    stem = os.path.splitext(name)[0]
+    formats = {}
+    for width in widths:
+        size = (width, max(1, round(image.height * width / image.width)))
+        resized = image if size == image.size else image.resize(size, Image.LANCZOS)
+        for extension, (image_format, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, **options)
+            variant = f'{stem}_{width}w.{extension}'
+            # Keep the deterministic name, local storage would add a suffix
+            default_storage.delete(variant)
+            formats.setdefault(extension, {})[str(width)] = default_storage.save(variant, ContentFile(buffer.getvalue()))
+    return {'source': name, 'formats': formats}
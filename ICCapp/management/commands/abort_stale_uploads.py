@@ -0,0 +1,24 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from ICCapp.models import ResumableUpload
+from ICCapp.uploads import abort_upload
+
+
+class Command(BaseCommand):
+    help = "Abort resumable uploads that received no chunk for a while, freeing their temporary file or S3 parts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help="Hours without a chunk before an upload is abandoned")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = ResumableUpload.objects.filter(status='uploading', updated_at__lt=cutoff)
+        aborted = 0
+        for upload in stale.iterator():
+            try:
+                abort_upload(upload)
+                aborted += 1
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Upload {upload.token} could not be aborted: {e}"))
+        self.stdout.write(self.style.SUCCESS(f"Aborted {aborted} stale upload(s)"))
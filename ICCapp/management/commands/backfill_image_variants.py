@@ -0,0 +1,60 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from ICCapp import imagevariants
+from ICCapp.models import ImageVariantTask
+
+
+class Command(BaseCommand):
+    help = "Queue resized variants for the existing images that have none (processed by generate_image_variants)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', help="Only this model (app_label.ModelName), repeatable")
+        parser.add_argument('--retry-failed', action='store_true', help="Queue the failed images again")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        labels = {label.lower() for label in options['model'] or []}
+        known = {label.lower() for label, _ in imagevariants.VARIANT_FIELDS}
+        if labels - known:
+            raise CommandError(f"No image variants for: {', '.join(sorted(labels - known))}")
+
+        if options['retry_failed']:
+            retried = imagevariants.restart(ImageVariantTask.objects.filter(status='failed'))
+            self.stdout.write(f"Queued {retried} failed image(s) again")
+
+        for label, field in imagevariants.VARIANT_FIELDS:
+            if labels and label.lower() not in labels:
+                continue
+            model = apps.get_model(label)
+            rows = (
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .only('pk', field, f'{field}_variants').order_by('pk')
+            )
+            existing = ImageVariantTask.objects.filter(model=model._meta.label, field=field).count()
+            restarted = 0
+            tasks = []
+            for instance in rows.iterator(chunk_size=options['batch_size']):
+                if imagevariants.needs_variants(instance, field):
+                    tasks.append(ImageVariantTask(
+                        model=model._meta.label, object_id=str(instance.pk), field=field, name=getattr(instance, field).name,
+                    ))
+                if len(tasks) >= options['batch_size']:
+                    restarted += self.queue(model._meta.label, field, tasks)
+                    tasks = []
+            restarted += self.queue(model._meta.label, field, tasks)
+            queued = ImageVariantTask.objects.filter(model=model._meta.label, field=field).count() - existing
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.label}.{field}: queued {queued} image(s), restarted {restarted}"
+            ))
+
+    def queue(self, label, field, tasks):
+        """Insert the tasks, restarting the existing failed or finished ones. Returns how many were restarted."""
+        # Images with a task already are skipped by the unique constraint
+        ImageVariantTask.objects.bulk_create(tasks, ignore_conflicts=True)
+        keys = {(task.object_id, task.name) for task in tasks}
+        existing = ImageVariantTask.objects.filter(
+            model=label, field=field, object_id__in={object_id for object_id, _ in keys},
+        ).values_list('pk', 'object_id', 'name')
+        return imagevariants.restart(ImageVariantTask.objects.filter(
+            pk__in=[pk for pk, object_id, name in existing if (object_id, name) in keys],
+        ))
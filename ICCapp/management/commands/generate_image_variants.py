@@ -0,0 +1,53 @@
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from ICCapp import imagevariants
+
+
+class Command(BaseCommand):
+    help = "Generate the resized WebP/AVIF variants of uploaded images in a pool of processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2), help="Images resized at the same time")
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when there is nothing to resize")
+        parser.add_argument('--once', action='store_true', help="Process everything due once and exit")
+
+    def handle(self, *args, **options):
+        worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        workers = max(1, options['workers'])
+        self.stdout.write(f"Starting image variant worker, {workers} process(es), formats: {', '.join(imagevariants.FORMATS)}")
+
+        # Spawned rather than forked so workers open their own database connections
+        context = multiprocessing.get_context('spawn')
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+                while True:
+                    close_old_connections()
+                    tasks = imagevariants.claim_tasks(worker_name, options['batch_size'])
+                    if not tasks:
+                        if options['once']:
+                            return
+                        time.sleep(options['poll_interval'])
+                        continue
+
+                    futures = [(task, pool.submit(imagevariants.generate_variants, task.name)) for task in tasks]
+                    done = 0
+                    for task, future in futures:
+                        try:
+                            imagevariants.record_result(task, variants=future.result())
+                            done += 1
+                        except Exception as e:
+                            imagevariants.record_result(task, error=f"{type(e).__name__}: {e}")
+                            self.stdout.write(self.style.ERROR(f"[{worker_name}] {task} failed: {e}"))
+                    self.stdout.write(f"[{worker_name}] resized {done}/{len(tasks)} image(s)")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
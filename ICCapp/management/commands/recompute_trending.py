@@ -0,0 +1,31 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from ICCapp import trending
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the time-decayed trending scores of services, products and videos from the completed "
+        "orders, once or (--loop) every --interval seconds"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep recomputing instead of exiting")
+        parser.add_argument('--interval', type=float, default=getattr(settings, 'TRENDING_RECOMPUTE_INTERVAL', 3600), help="Seconds between recomputes with --loop")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                close_old_connections()
+                for label in trending.TRENDING_MODELS:
+                    scored = trending.recompute(label)
+                    self.stdout.write(f"{label}: {scored} trending item(s)")
+                if not options['loop']:
+                    return
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BUYERS = (
+    ('service', 'services', 'Service', 'userIDs_that_bought_this_service'),
+    ('product', 'products', 'Product', 'userIDs_that_bought_this_product'),
+    ('video', 'vidoes', 'Video', 'userIDs_that_bought_this_video'),
+)
+
+
+def copy_buyers(apps, schema_editor):
+    Entitlement = apps.get_model('ICCapp', 'Entitlement')
+    for kind, app_label, model_name, field in BUYERS:
+        model = apps.get_model(app_label, model_name)
+        buyers = model._meta.get_field(field)
+        rows = buyers.remote_field.through.objects.values_list(
+            buyers.m2m_reverse_field_name(), buyers.m2m_field_name(),
+        ).iterator(chunk_size=2000)
+        batch = []
+        for user_id, object_id in rows:
+            batch.append(Entitlement(user_id=user_id, kind=kind, object_id=object_id))
+            if len(batch) >= 2000:
+                Entitlement.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        Entitlement.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ICCapp', '0018_resumableupload'),
+        ('products', '0015_trending_score'),
+        ('services', '0023_trending_score'),
+        ('vidoes', '0016_trending_score'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Entitlement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('service', 'Service'), ('product', 'Product'), ('video', 'Video')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entitlements', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'object_id'], name='entitlement_item_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind', 'object_id'), name='unique_entitlement')],
+            },
+        ),
+        migrations.RunPython(copy_buyers, migrations.RunPython.noop),
+    ]
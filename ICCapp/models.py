@@ -1,12 +1,16 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from ckeditor.fields import RichTextField
+import uuid
 
 # Organization model
 class Organization(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
     logo = models.ImageField(upload_to='organizations/logos')
+    # Resized variants of the image (ICCapp/imagevariants.py)
+    logo_variants = models.JSONField(default=dict, blank=True, editable=False)
     vision = models.TextField()
     mission = models.TextField()
     email = models.EmailField()
@@ -38,6 +42,8 @@ class Staff(models.Model):
     phone = models.CharField(max_length=20,blank=True, null=True)
     address = models.TextField(blank=True, null=True)
     img = models.ImageField(upload_to='staff/images',blank=True, null=True)
+    # Resized variants of the image (ICCapp/imagevariants.py)
+    img_variants = models.JSONField(default=dict, blank=True, editable=False)
     facebooklink = models.CharField(max_length=100, blank=True, null=True)
     instagramlink = models.CharField(max_length=100, blank=True, null=True)
     twitterlink = models.CharField(max_length=100, blank=True, null=True)
@@ -55,6 +61,8 @@ class Testimonial(models.Model):
     content = models.TextField()
     role = models.CharField(max_length=100, blank=True, null=True)
     img = models.ImageField(upload_to='testimonials/images',blank=True, null=True)
+    # Resized variants of the image (ICCapp/imagevariants.py)
+    img_variants = models.JSONField(default=dict, blank=True, editable=False)
     rating = models.IntegerField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     last_updated_date = models.DateTimeField(auto_now=True)
@@ -81,6 +89,8 @@ class DepartmentService(models.Model):
 class Department(models.Model):
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
     img = models.ImageField(upload_to='departments/images',blank=True, null=True)
+    # Resized variants of the image (ICCapp/imagevariants.py)
+    img_variants = models.JSONField(default=dict, blank=True, editable=False)
     name = models.CharField(max_length=100)
     description = models.TextField()
     staff_in_charge = models.ForeignKey(Staff, on_delete=models.CASCADE, null=True, blank=True)
@@ -97,4 +107,123 @@ class RichTextEditorImages(models.Model):
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f'Image {self.pk} uploaded at {self.uploaded_at}'
\ No newline at end of file
+        return f'Image {self.pk} uploaded at {self.uploaded_at}'
+
+# Queue of images waiting for their resized variants (ICCapp/imagevariants.py)
+class ImageVariantTask(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    model = models.CharField(max_length=100)  # app_label.ModelName
+    object_id = models.CharField(max_length=64)
+    field = models.CharField(max_length=100)
+    name = models.CharField(max_length=255)  # Storage name of the original
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=100, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.model}:{self.object_id}.{self.field} ({self.status})'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'object_id', 'field', 'name'], name='image_variant_task_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='image_variant_task_status_idx'),
+        ]
+
+
+# Resumable (tus-style) upload of a large file into a FileField (ICCapp/uploads.py)
+class ResumableUpload(models.Model):
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('completed', 'Completed'),
+        ('aborted', 'Aborted'),
+    ]
+
+    token = models.CharField(max_length=32, unique=True, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='resumable_uploads')
+    target = models.CharField(max_length=20)  # Key of uploads.UPLOAD_TARGETS
+    object_id = models.PositiveBigIntegerField()
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    chunk_size = models.PositiveIntegerField()
+    # Local temporary file, or the final storage name of an S3 multipart upload
+    storage_name = models.CharField(max_length=500)
+    s3_upload_id = models.CharField(max_length=255, blank=True)
+    parts = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    # Set while a chunk is being written, chunks of an upload never overlap
+    receiving_since = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.filename} ({self.offset}/{self.size})'
+
+    def save(self, *args, **kwargs):
+        if not self.token:
+            self.token = uuid.uuid4().hex
+        return super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='resumable_upload_status_idx'),
+        ]
+
+
+# Time-decayed popularity of a bought item (ICCapp/trending.py), subclassed by
+# the services, products and vidoes apps with the item and its category
+class AbstractTrendingScore(models.Model):
+    # Copies of the item's organization and category, so the trending
+    # listings are read from the index alone
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    # log2 of the purchases weighted by 2^-(age / half-life), taken at
+    # trending.EPOCH: rows compare without decaying each of them
+    score = models.FloatField()
+    last_purchase_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+        indexes = [
+            models.Index(fields=['organization', 'category', '-score'], name='%(app_label)s_trending_cat_idx'),
+            models.Index(fields=['organization', '-score'], name='%(app_label)s_trending_org_idx'),
+        ]
+
+
+# Bought service, product or video of a user, mirrored from the items'
+# buyers many-to-many fields (ICCapp/entitlements.py)
+class Entitlement(models.Model):
+    KIND_CHOICES = [
+        ('service', 'Service'),
+        ('product', 'Product'),
+        ('video', 'Video'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='entitlements')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.kind} {self.object_id}'
+
+    class Meta:
+        constraints = [
+            # Also the index of the per-user lookups
+            models.UniqueConstraint(fields=['user', 'kind', 'object_id'], name='unique_entitlement'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'object_id'], name='entitlement_item_idx'),
+        ]
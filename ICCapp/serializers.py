@@ -6,6 +6,7 @@ class OrganizationSerializer(serializers.ModelSerializer):
     logo = serializers.ImageField(allow_null=True, required=False)
     Organizationlogoname = serializers.SerializerMethodField()
     Organizationlogo = serializers.SerializerMethodField()
+    Organizationlogosrcset = serializers.SerializerMethodField()
     # staffs = serializers.SerializerMethodField()
     # testimonials = serializers.SerializerMethodField()
     # subscriptions = serializers.SerializerMethodField()
@@ -18,6 +19,9 @@ class OrganizationSerializer(serializers.ModelSerializer):
     def get_Organizationlogo(self, obj):
         return get_full_image_url(obj.logo)
     
+    def get_Organizationlogosrcset(self, obj):
+        return get_image_srcset(obj.logo, obj.logo_variants)
+    
     def get_Organizationlogoname(self, obj):
         return get_image_name(obj.logo)
     
@@ -41,14 +45,18 @@ class OrganizationMiniSerializer(serializers.ModelSerializer):
     logo = serializers.ImageField(allow_null=True, required=False)
     Organizationlogoname = serializers.SerializerMethodField()
     Organizationlogo = serializers.SerializerMethodField()
+    Organizationlogosrcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Organization
-        fields = ['id', 'name', 'logo', 'Organizationlogoname', 'Organizationlogo']
+        fields = ['id', 'name', 'logo', 'Organizationlogoname', 'Organizationlogo', 'Organizationlogosrcset']
     
     def get_Organizationlogo(self, obj):
         return get_full_image_url(obj.logo)
     
+    def get_Organizationlogosrcset(self, obj):
+        return get_image_srcset(obj.logo, obj.logo_variants)
+    
     def get_Organizationlogoname(self, obj):
         return get_image_name(obj.logo)
     
@@ -71,6 +79,7 @@ class PaginatedOrganizationSerializer(serializers.Serializer):
 class StaffSerializer(serializers.ModelSerializer):
     img = serializers.ImageField(allow_null=True, required=False)
     img_url = serializers.SerializerMethodField()
+    img_srcset = serializers.SerializerMethodField()
     img_name = serializers.SerializerMethodField()
     
     class Meta:
@@ -80,6 +89,9 @@ class StaffSerializer(serializers.ModelSerializer):
     def get_img_url(self, obj):
         return get_full_image_url(obj.img)
     
+    def get_img_srcset(self, obj):
+        return get_image_srcset(obj.img, obj.img_variants)
+    
     def get_img_name(self, obj):
         return get_image_name(obj.img)
 
@@ -110,6 +122,7 @@ class UpdateStaffSerializer(serializers.ModelSerializer):
 class TestimonialSerializer(serializers.ModelSerializer):
     img = serializers.ImageField(allow_null=True, required=False)
     img_url = serializers.SerializerMethodField()
+    img_srcset = serializers.SerializerMethodField()
     img_name = serializers.SerializerMethodField()
     class Meta:
         model = Testimonial
@@ -118,6 +131,9 @@ class TestimonialSerializer(serializers.ModelSerializer):
     def get_img_url(self, obj):
         return get_full_image_url(obj.img)
     
+    def get_img_srcset(self, obj):
+        return get_image_srcset(obj.img, obj.img_variants)
+    
     def get_img_name(self, obj):
         return get_image_name(obj.img)
     
@@ -169,6 +185,7 @@ class DepartmentServiceSerializer(serializers.ModelSerializer):
 class DepartmentSerializer(serializers.ModelSerializer):
     img = serializers.ImageField(allow_null=True, required=False)
     img_url = serializers.SerializerMethodField()
+    img_srcset = serializers.SerializerMethodField()
     img_name = serializers.SerializerMethodField()
     staff_in_charge = StaffSerializer(many=False)
     organization = OrganizationMiniSerializer(many=False)
@@ -181,6 +198,9 @@ class DepartmentSerializer(serializers.ModelSerializer):
     def get_img_url(self, obj):
         return get_full_image_url(obj.img)
     
+    def get_img_srcset(self, obj):
+        return get_image_srcset(obj.img, obj.img_variants)
+    
     def get_img_name(self, obj):
         return get_image_name(obj.img)
 
@@ -232,4 +252,28 @@ class CreateRichTextEditorImagesSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = RichTextEditorImages
-        exclude = ['id', 'uploaded_at']
\ No newline at end of file
+        exclude = ['id', 'uploaded_at']
+
+class CreateResumableUploadSerializer(serializers.Serializer):
+    target = serializers.ChoiceField(choices=['video', 'product'])
+    object_id = serializers.IntegerField(min_value=1)
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+
+class ResumableUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ResumableUpload
+        fields = ['token', 'target', 'object_id', 'filename', 'size', 'offset', 'chunk_size', 'status', 'created_at', 'updated_at']
+
+
+class OwnedItemsQuerySerializer(serializers.Serializer):
+    user_id = serializers.IntegerField(min_value=1, required=False, help_text="Staff only, defaults to the requesting user")
+    services = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=500)
+    products = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=500)
+    videos = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=500)
+
+class OwnedItemsSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    services = serializers.ListField(child=serializers.IntegerField())
+    products = serializers.ListField(child=serializers.IntegerField())
+    videos = serializers.ListField(child=serializers.IntegerField())
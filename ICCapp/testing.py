@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .models import Organization
+
+
+class ListingQueryTestCase(TestCase):
+    """
+    Shared fixture of the listing query tests: an organization and two
+    buyers. assertListing pins the queries of a listing and checks that the
+    planned queryset serializes the same as the plain one.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Org')
+        cls.buyers = [
+            get_user_model().objects.create_user(username=f'buyer{i}', email=f'buyer{i}@example.com', password='x')
+            for i in range(2)
+        ]
+        cls.buyer = cls.buyers[0]
+
+    @classmethod
+    def create_catalog(cls, item_model, score_model, category, subcategory, fields, count=12):
+        """`count` services, products or videos bought by both buyers, item i with trending score i."""
+        kind = item_model._meta.model_name
+        for i in range(count):
+            item = item_model.objects.create(organization=cls.organization, category=category, subcategory=subcategory, **fields(i))
+            getattr(item, f'userIDs_that_bought_this_{kind}').add(*cls.buyers)
+            score_model.objects.create(
+                **{kind: item}, organization=cls.organization, category=category, score=i, last_purchase_at=timezone.now(),
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def assertListing(self, url, num_queries, serializer_class, expected, page_size=10):
+        """GET `url` in `num_queries` queries; the output must be `serializer_class` of the `expected` queryset."""
+        with self.assertNumQueries(num_queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        items = list(expected)
+        if isinstance(data, dict):
+            self.assertEqual(data['count'], len(items))
+            data, items = data['results'], items[:page_size]
+        self.assertTrue(items)
+        serialized = serializer_class(items, many=True).data
+        if expected.ordered:
+            self.assertEqual(data, serialized)
+        else:
+            self.assertCountEqual(data, serialized)
+        return data
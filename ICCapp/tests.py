@@ -1,3 +1,372 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from payments.models import Orders
+from products.models import Product
+from services.models import Service, ServiceTrendingScore
+from vidoes.models import Video
+from . import entitlements, imagevariants, trending, uploads
+from .models import Department, DepartmentService, Entitlement, ImageVariantTask, Organization, ResumableUpload, Staff, Subscription, Testimonial
+from .serializers import DepartmentSerializer, StaffSerializer, SubscriptionSerializer, TestimonialSerializer
+from .testing import ListingQueryTestCase
 
-# Create your tests here.
+
+class OrganizationListingQueryTests(ListingQueryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        services = [DepartmentService.objects.create(name=f'Service {i}') for i in range(2)]
+        for i in range(12):
+            staff = Staff.objects.create(organization=cls.organization, first_name=f'Staff {i}', last_name='Member')
+            department = Department.objects.create(
+                organization=cls.organization, name=f'Department {i}', description='', staff_in_charge=staff,
+            )
+            department.services.add(*services)
+            Testimonial.objects.create(organization=cls.organization, content=f'Testimonial {i}')
+            Subscription.objects.create(organization=cls.organization, email=f'subscriber{i}@example.com')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.buyer)
+
+    def test_departments_page_runs_a_fixed_number_of_queries(self):
+        # organization lookup, count, page (staff in charge and organization
+        # joined), services prefetch
+        results = self.assertListing(
+            f'/api/department/{self.organization.pk}/', 4, DepartmentSerializer,
+            Department.objects.filter(organization=self.organization).order_by('id'),
+        )
+        self.assertEqual(results[0]['staff_in_charge']['first_name'], 'Staff 0')
+        self.assertEqual(results[0]['organization']['name'], 'Org')
+        self.assertEqual(len(results[0]['services']), 2)
+
+    def test_flat_listings_run_a_fixed_number_of_queries(self):
+        # organization lookup, count, page
+        listings = [
+            ('staff', StaffSerializer, Staff.objects.order_by('id')),
+            ('testimonial', TestimonialSerializer, Testimonial.objects.order_by('-created_at')),
+            ('subscription', SubscriptionSerializer, Subscription.objects.order_by('-date_added')),
+        ]
+        for url, serializer_class, queryset in listings:
+            with self.subTest(url=url):
+                self.assertListing(
+                    f'/api/{url}/{self.organization.pk}/', 3, serializer_class, queryset.filter(organization=self.organization),
+                )
+
+
+def image_file(size, image_format='PNG', orientation=None):
+    exif = Image.Exif()
+    if orientation:
+        exif[imagevariants.EXIF_ORIENTATION] = orientation
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, image_format, exif=exif)
+    return ContentFile(buffer.getvalue())
+
+
+@mock.patch.object(imagevariants, 'WIDTHS', (320, 640, 1280))
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def organization(self):
+        organization = Organization(name='Org')
+        organization.logo.save('logo.png', image_file((800, 400)), save=False)
+        organization.save()
+        return organization
+
+    def test_variant_widths_stay_below_the_image_width(self):
+        self.assertEqual(imagevariants.variant_widths(2000), [320, 640, 1280])
+        self.assertEqual(imagevariants.variant_widths(1280), [320, 640])
+        # A smaller image keeps its own width
+        self.assertEqual(imagevariants.variant_widths(200), [200])
+
+    def test_rotated_photos_are_resized_as_displayed(self):
+        # Stored 800x400 a quarter turn off (orientation 6), displayed 400x800
+        name = default_storage.save('photos/rotated.jpg', image_file((800, 400), 'JPEG', orientation=6))
+        variants = imagevariants.generate_variants(name)
+
+        self.assertEqual(list(variants['formats']['webp']), ['320'])
+        with default_storage.open(variants['formats']['webp']['320'], 'rb') as f:
+            self.assertEqual(Image.open(f).size, (320, 640))
+
+    def test_variants_of_a_replaced_image_are_discarded(self):
+        organization = self.organization()
+        task = ImageVariantTask.objects.get(object_id=str(organization.pk), field='logo')
+        Organization.objects.filter(pk=organization.pk).update(logo='organizations/logos/other.png')
+
+        variants = imagevariants.generate_variants(task.name)
+        imagevariants.record_result(task, variants)
+        self.assertEqual(Organization.objects.get(pk=organization.pk).logo_variants, {})
+        self.assertFalse(default_storage.exists(variants['formats']['webp']['320']))
+        self.assertEqual(ImageVariantTask.objects.get(pk=task.pk).status, 'done')
+
+    def test_variants_of_the_current_image_replace_the_previous_ones(self):
+        organization = self.organization()
+        task = ImageVariantTask.objects.get(object_id=str(organization.pk), field='logo')
+        previous = {'source': 'organizations/logos/old.png', 'formats': {'webp': {'320': default_storage.save('old_320w.webp', ContentFile(b'x'))}}}
+        Organization.objects.filter(pk=organization.pk).update(logo_variants=previous)
+
+        variants = imagevariants.generate_variants(task.name)
+        imagevariants.record_result(task, variants)
+        self.assertEqual(Organization.objects.get(pk=organization.pk).logo_variants, variants)
+        self.assertEqual(sorted(variants['formats']['webp']), ['320', '640'])
+        self.assertFalse(default_storage.exists(previous['formats']['webp']['320']))
+
+    def test_failed_tasks_are_queued_again_on_save_and_backfill(self):
+        organization = self.organization()
+        tasks = ImageVariantTask.objects.filter(object_id=str(organization.pk), field='logo')
+        tasks.update(status='failed', attempts=3)
+
+        organization.save()
+        self.assertEqual(list(tasks.values_list('status', 'attempts')), [('pending', 0)])
+
+        tasks.update(status='failed', attempts=3)
+        call_command('backfill_image_variants', model=['ICCapp.Organization'], stdout=open(os.devnull, 'w'))
+        self.assertEqual(list(tasks.values_list('status', 'attempts')), [('pending', 0)])
+
+
+    def test_retry_failed_queues_failed_tasks_at_once(self):
+        # A task of an image the backfill itself would not queue again
+        task = ImageVariantTask.objects.create(
+            model='ICCapp.Organization', object_id='999', field='logo', name='organizations/logos/gone.png',
+            status='failed', attempts=3, last_error='boom', next_attempt_at=timezone.now() + timedelta(hours=1),
+        )
+
+        call_command('backfill_image_variants', retry_failed=True, stdout=open(os.devnull, 'w'))
+
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, task.last_error), ('pending', 0, ''))
+        self.assertLessEqual(task.next_attempt_at, timezone.now())
+
+class ResumableUploadTests(TestCase):
+    CONTENT = b'0123456789'
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for patcher in (
+            mock.patch.object(uploads, 'CHUNK_SIZE', 4),
+            mock.patch.object(uploads, 'UPLOAD_DIR', os.path.join(media_root, 'partial')),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(username='staff', email='staff@example.com', password='x'))
+
+    def start(self, target='video', object_id=None):
+        if object_id is None:
+            object_id = Video.objects.create(title='Lesson', description='').pk
+        response = self.client.post('/api/uploads/', {
+            'target': target, 'object_id': object_id, 'filename': 'lesson.mp4', 'size': len(self.CONTENT),
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['token']
+
+    def patch(self, token, offset, chunk, checksum=None):
+        digest = base64.b64encode(hashlib.sha256(chunk).digest()).decode()
+        return self.client.generic(
+            'PATCH', f'/api/uploads/{token}/', chunk, content_type='application/offset+octet-stream',
+            headers={'Upload-Offset': str(offset), 'Upload-Checksum': checksum or f'sha256 {digest}'},
+        )
+
+    def offset(self, token):
+        return int(self.client.head(f'/api/uploads/{token}/')['Upload-Offset'])
+
+    def test_chunk_at_the_wrong_offset_is_rejected(self):
+        token = self.start()
+        self.assertEqual(self.patch(token, 0, self.CONTENT[:4]).status_code, 204)
+        response = self.patch(token, 0, self.CONTENT[:4])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['error'], 'Upload-Offset must be 4')
+        self.assertEqual(self.offset(token), 4)
+
+    def test_chunk_with_a_wrong_checksum_does_not_count(self):
+        token = self.start()
+        wrong = 'sha256 ' + base64.b64encode(hashlib.sha256(b'other').digest()).decode()
+        response = self.patch(token, 0, self.CONTENT[:4], checksum=wrong)
+        self.assertEqual(response.status_code, 460)
+        self.assertEqual(self.offset(token), 0)
+        self.assertEqual(self.patch(token, 0, self.CONTENT[:4], checksum='crc32 AAAA').status_code, 400)
+
+    def test_interrupted_chunk_is_resumed_from_the_stored_offset(self):
+        token = self.start()
+        self.assertEqual(self.patch(token, 0, self.CONTENT[:4]).status_code, 204)
+        # The connection drops after two of the four bytes
+        upload = ResumableUpload.objects.get(token=token)
+        checksum = 'sha256 ' + base64.b64encode(hashlib.sha256(self.CONTENT[4:8]).digest()).decode()
+        with self.assertRaises(uploads.UploadError) as raised:
+            uploads.receive_chunk(upload, 4, io.BytesIO(self.CONTENT[4:6]), 4, checksum)
+        self.assertEqual(raised.exception.status, 400)
+        self.assertEqual(self.offset(token), 4)
+        self.assertEqual(os.path.getsize(upload.storage_name), 4)
+
+        self.assertEqual(self.patch(token, 4, self.CONTENT[4:8]).status_code, 204)
+        response = self.patch(token, 8, self.CONTENT[8:])
+        self.assertEqual(response['Upload-Offset'], str(len(self.CONTENT)))
+
+    def test_finalizing_attaches_the_file_to_its_target(self):
+        video_token = self.start()
+        product = Product.objects.create(name='Workbook', price=5)
+        product_token = self.start('product', product.pk)
+        self.assertEqual(self.client.post(f'/api/uploads/{video_token}/finalize/').status_code, 409)
+
+        for token in (video_token, product_token):
+            for offset in range(0, len(self.CONTENT), 4):
+                self.assertEqual(self.patch(token, offset, self.CONTENT[offset:offset + 4]).status_code, 204)
+            response = self.client.post(f'/api/uploads/{token}/finalize/')
+            self.assertEqual(response.status_code, 200, response.data)
+
+        upload = ResumableUpload.objects.get(token=video_token)
+        video = Video.objects.get(pk=upload.object_id)
+        self.assertEqual(upload.status, 'completed')
+        self.assertFalse(os.path.exists(upload.storage_name))
+        with video.video.open('rb') as f:
+            self.assertEqual(f.read(), self.CONTENT)
+        self.assertEqual(video.processing_status, 'pending')
+        product.refresh_from_db()
+        with product.product.open('rb') as f:
+            self.assertEqual(f.read(), self.CONTENT)
+
+
+class TrendingScoreTests(SimpleTestCase):
+    def test_purchases_decay_by_half_every_half_life(self):
+        now = timezone.now()
+        self.assertAlmostEqual(trending.decayed_purchases(trending.purchase_points(now), now), 1)
+        self.assertAlmostEqual(trending.decayed_purchases(trending.purchase_points(now - trending.HALF_LIFE), now), 0.5)
+        self.assertAlmostEqual(trending.decayed_purchases(trending.purchase_points(now - 3 * trending.HALF_LIFE), now), 0.125)
+
+    def test_scores_add_up_in_log_space(self):
+        now = timezone.now()
+        score = trending.add_points(trending.purchase_points(now), trending.purchase_points(now))
+        self.assertAlmostEqual(score, trending.purchase_points(now) + 1)
+        score = trending.add_points(score, trending.purchase_points(now - trending.HALF_LIFE))
+        self.assertAlmostEqual(trending.decayed_purchases(score, now), 2.5)
+        # Far from EPOCH, 2 ** score would overflow a float
+        self.assertAlmostEqual(trending.add_points(5000, 5000), 5001)
+        self.assertAlmostEqual(trending.add_points(5000, -5000), 5000)
+
+
+class TrendingRecomputeTests(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name='Org')
+        self.customer = get_user_model().objects.create_user(username='customer', email='customer@example.com', password='x')
+        self.now = timezone.now()
+
+    def order(self, services, status='Completed', days_ago=0):
+        order = Orders.objects.create(organization=self.organization, customer=self.customer, amount=10, status=status)
+        order.services.add(*services)
+        Orders.objects.filter(pk=order.pk).update(created_at=self.now - timedelta(days=days_ago))
+        return order
+
+    def test_scores_are_rebuilt_from_completed_orders(self):
+        bought, pending_only, no_longer_bought = [
+            Service.objects.create(organization=self.organization, name=f'Service {i}', price=10) for i in range(3)
+        ]
+        self.order([bought])
+        self.order([bought], days_ago=trending.HALF_LIFE.days)
+        self.order([pending_only], status='Pending')
+        for service in (pending_only, no_longer_bought):
+            ServiceTrendingScore.objects.create(service=service, organization=self.organization, score=1, last_purchase_at=self.now)
+
+        self.assertEqual(trending.recompute('services.Service', chunk_size=1), 1)
+        row = ServiceTrendingScore.objects.get()
+        self.assertEqual(row.pk, bought.pk)
+        self.assertAlmostEqual(trending.decayed_purchases(row.score, self.now), 1.5)
+        self.assertEqual(row.last_purchase_at, self.now)
+
+
+class EntitlementTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        users = get_user_model().objects
+        self.buyer = users.create_user(username='buyer', email='buyer@example.com', password='x')
+        self.other = users.create_user(username='other', email='other@example.com', password='x')
+        self.staff = users.create_user(username='staff', email='staff@example.com', password='x', is_staff=True)
+        organization = Organization.objects.create(name='Org')
+        self.services = [Service.objects.create(organization=organization, name=f'Service {i}', price=10) for i in range(2)]
+        self.product = Product.objects.create(organization=organization, name='Product', price=10)
+        self.video = Video.objects.create(organization=organization, title='Video', description='')
+        self.client = APIClient()
+
+    def rows(self):
+        return set(Entitlement.objects.values_list('user_id', 'kind', 'object_id'))
+
+    def test_buyers_changes_are_mirrored_from_the_item_side(self):
+        service = self.services[0]
+        service.userIDs_that_bought_this_service.add(self.buyer, self.other)
+        self.product.userIDs_that_bought_this_product.add(self.buyer)
+        self.assertEqual(self.rows(), {
+            (self.buyer.pk, 'service', service.pk), (self.other.pk, 'service', service.pk),
+            (self.buyer.pk, 'product', self.product.pk),
+        })
+        service.userIDs_that_bought_this_service.remove(self.other)
+        self.assertEqual(self.rows(), {(self.buyer.pk, 'service', service.pk), (self.buyer.pk, 'product', self.product.pk)})
+        service.userIDs_that_bought_this_service.clear()
+        self.assertEqual(self.rows(), {(self.buyer.pk, 'product', self.product.pk)})
+        self.product.delete()
+        self.assertEqual(self.rows(), set())
+
+    def test_buyers_changes_are_mirrored_from_the_user_side(self):
+        self.buyer.userIDs_that_bought_this_service.add(*self.services)
+        self.buyer.video_set.add(self.video)
+        self.other.userIDs_that_bought_this_service.add(self.services[0])
+        self.assertEqual(self.rows(), {
+            (self.buyer.pk, 'service', self.services[0].pk), (self.buyer.pk, 'service', self.services[1].pk),
+            (self.buyer.pk, 'video', self.video.pk), (self.other.pk, 'service', self.services[0].pk),
+        })
+        self.buyer.userIDs_that_bought_this_service.remove(self.services[0])
+        self.buyer.video_set.clear()
+        self.assertEqual(self.rows(), {(self.buyer.pk, 'service', self.services[1].pk), (self.other.pk, 'service', self.services[0].pk)})
+
+    def test_cached_sets_are_invalidated_when_the_change_commits(self):
+        self.assertEqual(entitlements.owned_ids(self.buyer.pk)['video'], set())
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.video.userIDs_that_bought_this_video.add(self.buyer)
+            # Readers before the commit keep the cached set
+            self.assertFalse(entitlements.owns(self.buyer.pk, 'video', self.video.pk))
+        for callback in callbacks:
+            callback()
+        self.assertTrue(entitlements.owns(self.buyer.pk, 'video', self.video.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.video.userIDs_that_bought_this_video.clear()
+        self.assertFalse(entitlements.owns(self.buyer.pk, 'video', self.video.pk))
+
+    def test_only_staff_can_ask_for_another_user(self):
+        self.services[1].userIDs_that_bought_this_service.add(self.buyer)
+        query = {'services': [self.services[0].pk, self.services[1].pk], 'videos': [self.video.pk]}
+
+        self.client.force_authenticate(self.buyer)
+        response = self.client.post('/api/entitlements/owned/', query, format='json')
+        self.assertEqual(response.data, {'user_id': self.buyer.pk, 'services': [self.services[1].pk], 'products': [], 'videos': []})
+
+        self.client.force_authenticate(self.other)
+        response = self.client.post('/api/entitlements/owned/', {**query, 'user_id': self.buyer.pk}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.post('/api/entitlements/owned/', {**query, 'user_id': self.buyer.pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['services'], [self.services[1].pk])
@@ -0,0 +1,117 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+# A purchase counts half as much after this many days
+HALF_LIFE = timedelta(days=getattr(settings, 'TRENDING_HALF_LIFE_DAYS', 7))
+# Scores are taken at this fixed time, see AbstractTrendingScore.score
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+# Item model: (score model, Orders many-to-many field)
+TRENDING_MODELS = {
+    'services.Service': ('services.ServiceTrendingScore', 'services'),
+    'products.Product': ('products.ProductTrendingScore', 'products'),
+    'vidoes.Video': ('vidoes.VideoTrendingScore', 'videos'),
+}
+
+
+# --------------------------------------------------------------------------
+# Scores: log2 of the decayed purchase count at EPOCH
+# --------------------------------------------------------------------------
+def purchase_points(when):
+    """Score of a single purchase made at `when`."""
+    return (when - EPOCH) / HALF_LIFE
+
+
+def add_points(score, points):
+    """The score with one more purchase, log2(2^score + 2^points) without overflowing."""
+    high, low = max(score, points), min(score, points)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def decayed_purchases(score, now=None):
+    """The purchases a score stands for at `now`, each weighted by its age."""
+    return 2 ** (score - purchase_points(now or timezone.now()))
+
+
+def score_model(item_model, registry=apps):
+    return registry.get_model(TRENDING_MODELS[item_model._meta.label][0])
+
+
+# --------------------------------------------------------------------------
+# Incremental update (verify_payment)
+# --------------------------------------------------------------------------
+def record_purchase(item, when):
+    """Add a purchase of a service, product or video made at `when` to its trending score."""
+    model = score_model(type(item))
+    points = purchase_points(when)
+    with transaction.atomic():
+        row, created = model.objects.select_for_update().get_or_create(pk=item.pk, defaults={
+            'organization_id': item.organization_id, 'category_id': item.category_id,
+            'score': points, 'last_purchase_at': when,
+        })
+        if created:
+            return row
+        row.score = add_points(row.score, points)
+        row.last_purchase_at = max(row.last_purchase_at, when)
+        row.organization_id = item.organization_id
+        row.category_id = item.category_id
+        row.save()
+    return row
+
+
+def item_saved(sender, instance, **kwargs):
+    # Keep the copied organization and category of a scored item current
+    score_model(sender).objects.filter(pk=instance.pk).update(
+        organization_id=instance.organization_id, category_id=instance.category_id,
+    )
+
+
+def connect_signals():
+    for label in TRENDING_MODELS:
+        post_save.connect(item_saved, sender=label, dispatch_uid=f'trending:{label}')
+
+
+# --------------------------------------------------------------------------
+# Full recompute (recompute_trending)
+# --------------------------------------------------------------------------
+def recompute(label, chunk_size=2000, registry=apps):
+    """
+    Rebuild the trending scores of an item model from the completed orders.
+    Scored items that are no longer bought lose their row. Returns the
+    number of scored items. `registry` is the app registry of a migration.
+    """
+    item_model = registry.get_model(label)
+    model = score_model(item_model, registry)
+    _, orders_field = TRENDING_MODELS[label]
+    through = registry.get_model('payments.Orders')._meta.get_field(orders_field).remote_field.through
+    item_column = f'{item_model._meta.model_name}_id'
+
+    scores = {}
+    purchases = through.objects.filter(orders__status='Completed').values_list(item_column, 'orders__created_at')
+    for item_id, when in purchases.iterator(chunk_size=chunk_size):
+        points = purchase_points(when)
+        if item_id in scores:
+            score, last = scores[item_id]
+            scores[item_id] = (add_points(score, points), max(last, when))
+        else:
+            scores[item_id] = (points, when)
+
+    started = timezone.now()
+    rows = [
+        model(pk=pk, organization_id=organization_id, category_id=category_id, score=scores[pk][0], last_purchase_at=scores[pk][1])
+        for pk, organization_id, category_id in item_model.objects.values_list('pk', 'organization_id', 'category_id').iterator(chunk_size=chunk_size)
+        if pk in scores
+    ]
+    with transaction.atomic():
+        model.objects.bulk_create(
+            rows, batch_size=chunk_size, update_conflicts=True, unique_fields=[model._meta.pk.name],
+            update_fields=['organization', 'category', 'score', 'last_purchase_at', 'updated_at'],
+        )
+        # Rows left untouched belong to items without completed orders
+        model.objects.filter(updated_at__lt=started).delete()
+    return len(rows)
@@ -0,0 +1,227 @@
+import base64
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q
+from django.utils import timezone
+from storages.backends.s3 import S3Storage
+from .models import ResumableUpload
+
+# Every chunk but the last has exactly this size (S3 parts need at least 5 MB)
+CHUNK_SIZE = getattr(settings, 'RESUMABLE_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+MAX_SIZE = getattr(settings, 'RESUMABLE_UPLOAD_MAX_SIZE', 10 * 1024 * 1024 * 1024)
+UPLOAD_DIR = getattr(settings, 'RESUMABLE_UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'resumable_uploads'))
+# A chunk write that has not finished after this long is presumed dead
+RECEIVE_TIMEOUT = timedelta(minutes=10)
+READ_SIZE = 64 * 1024
+CHECKSUM_ALGORITHMS = ('sha256', 'sha1', 'md5')
+
+# Upload target: (model, FileField)
+UPLOAD_TARGETS = {
+    'video': ('vidoes.Video', 'video'),
+    'product': ('products.Product', 'product'),
+}
+
+
+class UploadError(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def target_storage(target):
+    """The storage of the target's FileField (videos are kept in a private one)."""
+    label, field = UPLOAD_TARGETS[target]
+    return apps.get_model(label)._meta.get_field(field).storage
+
+
+def uses_s3(target):
+    return isinstance(target_storage(target), S3Storage)
+
+
+def target_instance(target, object_id):
+    """The model instance an upload is attached to, or None."""
+    label, _ = UPLOAD_TARGETS[target]
+    return apps.get_model(label).objects.filter(pk=object_id).first()
+
+
+def s3_object(upload):
+    """(client, bucket, key) of the multipart upload's object."""
+    storage = target_storage(upload.target)
+    return (
+        storage.connection.meta.client,
+        storage.bucket_name,
+        storage._normalize_name(upload.storage_name),
+    )
+
+
+# --------------------------------------------------------------------------
+# Starting an upload
+# --------------------------------------------------------------------------
+def start_upload(user, target, instance, filename, size):
+    if size <= 0 or size > MAX_SIZE:
+        raise UploadError(f'Upload size must be between 1 byte and {MAX_SIZE} bytes', 413)
+    upload = ResumableUpload(
+        user=user, target=target, object_id=instance.pk, filename=os.path.basename(filename),
+        size=size, chunk_size=CHUNK_SIZE,
+    )
+    upload.save()
+    if uses_s3(target):
+        _, field = UPLOAD_TARGETS[target]
+        storage = target_storage(target)
+        name = instance._meta.get_field(field).generate_filename(instance, upload.filename)
+        upload.storage_name = storage.get_available_name(name)
+        client, bucket, key = s3_object(upload)
+        # The ACL the storage would give the object (private for videos)
+        extra = {'ACL': storage.default_acl} if storage.default_acl else {}
+        upload.s3_upload_id = client.create_multipart_upload(Bucket=bucket, Key=key, **extra)['UploadId']
+    else:
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        upload.storage_name = os.path.join(UPLOAD_DIR, upload.token)
+        open(upload.storage_name, 'wb').close()
+    upload.save(update_fields=['storage_name', 's3_upload_id'])
+    return upload
+
+
+# --------------------------------------------------------------------------
+# Receiving a chunk (PATCH)
+# --------------------------------------------------------------------------
+def parse_checksum(header):
+    """(algorithm, expected digest) of an `Upload-Checksum: <algorithm> <base64 digest>` header."""
+    try:
+        algorithm, digest = header.strip().split(' ', 1)
+        algorithm = algorithm.lower()
+        if algorithm not in CHECKSUM_ALGORITHMS:
+            raise ValueError
+        return algorithm, base64.b64decode(digest, validate=True)
+    except ValueError:
+        raise UploadError(f'Upload-Checksum must be "<{"|".join(CHECKSUM_ALGORITHMS)}> <base64 digest>"', 400)
+
+
+def expected_chunk_length(upload):
+    return min(upload.chunk_size, upload.size - upload.offset)
+
+
+def receive_chunk(upload, offset, stream, length, checksum_header):
+    """
+    Append a chunk read from `stream` at `offset`, in constant memory. The
+    chunk is checked against its Upload-Checksum before it counts, a
+    mismatch (460) leaves the upload at the previous offset.
+    """
+    if upload.status != 'uploading':
+        raise UploadError('Upload is not in progress', 409)
+    if offset != upload.offset:
+        raise UploadError(f'Upload-Offset must be {upload.offset}', 409)
+    if length != expected_chunk_length(upload):
+        raise UploadError(f'Chunk must be {expected_chunk_length(upload)} bytes', 400)
+    algorithm, expected = parse_checksum(checksum_header)
+
+    now = timezone.now()
+    # One chunk at a time per upload
+    receiving = ResumableUpload.objects.filter(pk=upload.pk, offset=offset).filter(
+        Q(receiving_since__isnull=True) | Q(receiving_since__lt=now - RECEIVE_TIMEOUT)
+    )
+    if not receiving.update(receiving_since=now):
+        raise UploadError('Another chunk of this upload is being received', 409)
+    try:
+        if upload.s3_upload_id:
+            part = receive_s3_part(upload, stream, length, algorithm, expected)
+            upload.parts = upload.parts + [part]
+        else:
+            receive_local_chunk(upload, offset, stream, length, algorithm, expected)
+        upload.offset = offset + length
+    finally:
+        upload.receiving_since = None
+        upload.save(update_fields=['offset', 'parts', 'receiving_since', 'updated_at'])
+    return upload.offset
+
+
+def copy_stream(stream, destination, length, hashers):
+    remaining = length
+    while remaining:
+        data = stream.read(min(READ_SIZE, remaining))
+        if not data:
+            raise UploadError('Request body is shorter than Content-Length', 400)
+        for hasher in hashers:
+            hasher.update(data)
+        destination.write(data)
+        remaining -= len(data)
+
+
+def receive_local_chunk(upload, offset, stream, length, algorithm, expected):
+    hasher = hashlib.new(algorithm)
+    with open(upload.storage_name, 'r+b') as f:
+        f.seek(offset)
+        try:
+            copy_stream(stream, f, length, [hasher])
+            if hasher.digest() != expected:
+                raise UploadError('Checksum mismatch', 460)
+        except BaseException:
+            f.truncate(offset)
+            raise
+
+
+def receive_s3_part(upload, stream, length, algorithm, expected):
+    # Spooled to disk, S3 gets the part with its MD5 and checks it again
+    hasher = hashlib.new(algorithm)
+    md5 = hashlib.md5()
+    with tempfile.TemporaryFile() as f:
+        copy_stream(stream, f, length, [hasher, md5])
+        if hasher.digest() != expected:
+            raise UploadError('Checksum mismatch', 460)
+        f.seek(0)
+        client, bucket, key = s3_object(upload)
+        part_number = len(upload.parts) + 1
+        response = client.upload_part(
+            Bucket=bucket, Key=key, UploadId=upload.s3_upload_id, PartNumber=part_number,
+            Body=f, ContentLength=length, ContentMD5=base64.b64encode(md5.digest()).decode(),
+        )
+    return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+
+# --------------------------------------------------------------------------
+# Finishing an upload
+# --------------------------------------------------------------------------
+def finalize_upload(upload):
+    """Attach the complete file to the target's FileField and return the saved instance."""
+    if upload.status != 'uploading':
+        raise UploadError('Upload is not in progress', 409)
+    if upload.offset != upload.size:
+        raise UploadError(f'Upload is incomplete ({upload.offset}/{upload.size} bytes)', 409)
+    instance = target_instance(upload.target, upload.object_id)
+    if instance is None:
+        raise UploadError('The upload target no longer exists', 404)
+
+    _, field = UPLOAD_TARGETS[upload.target]
+    if upload.s3_upload_id:
+        client, bucket, key = s3_object(upload)
+        client.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload.s3_upload_id, MultipartUpload={'Parts': upload.parts},
+        )
+        setattr(instance, field, upload.storage_name)
+        instance.save()
+    else:
+        with open(upload.storage_name, 'rb') as f:
+            getattr(instance, field).save(upload.filename, File(f), save=True)
+        os.remove(upload.storage_name)
+
+    upload.status = 'completed'
+    upload.save(update_fields=['status', 'updated_at'])
+    return instance
+
+
+def abort_upload(upload):
+    """Drop the received chunks of an unfinished upload."""
+    if upload.status != 'uploading':
+        return
+    if upload.s3_upload_id:
+        client, bucket, key = s3_object(upload)
+        client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload.s3_upload_id)
+    elif os.path.exists(upload.storage_name):
+        os.remove(upload.storage_name)
+    upload.status = 'aborted'
+    upload.save(update_fields=['status', 'updated_at'])
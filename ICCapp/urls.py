@@ -1,7 +1,7 @@
 from django.urls import path
 
 from ICCapp.views import richtextimagesviews
-from .views import testimonialviews, staffviews, subscriptionviews, organizationviews, deptsviews
+from .views import testimonialviews, staffviews, subscriptionviews, organizationviews, deptsviews, uploadviews, entitlementviews
 
 urlpatterns = [
     path('organization/', organizationviews.get_organizations, name='get_organizations'),
@@ -39,5 +39,9 @@ urlpatterns = [
     path("richtextimage/all/", richtextimagesviews.get_rich_text_images, name="get_rich_text_images"),
     path("richtextimage/delete/", richtextimagesviews.delete_rich_text_image, name="delete_rich_text_image"),
 
-    
-]
\ No newline at end of file
+    path('uploads/', uploadviews.create_upload, name='create_upload'),
+    path('uploads/<str:token>/', uploadviews.upload_detail, name='upload_detail'),
+    path('uploads/<str:token>/finalize/', uploadviews.finalize_resumable_upload, name='finalize_upload'),
+
+    path('entitlements/owned/', entitlementviews.get_owned_items, name='get_owned_items'),
+]
@@ -4,7 +4,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from ..models import *
 from ..serializers import *
-from utils import normalize_img_field, parse_json_fields
+from utils import normalize_img_field, parse_json_fields, plan_queryset
 from rest_framework.pagination import PageNumberPagination
 from django.http import QueryDict
 from rest_framework.parsers import MultiPartParser, FormParser
@@ -31,7 +31,7 @@ def get_org_depts(request, organization_id):
         organization = get_object_or_404(Organization, id=organization_id)
         departments = Department.objects.filter(organization=organization).order_by('id')
         paginator = DepartmentPagination()
-        result_page = paginator.paginate_queryset(departments, request)
+        result_page = paginator.paginate_queryset(plan_queryset(departments, DepartmentSerializer), request)
         serializer = DepartmentSerializer(result_page, many=True)
         return paginator.get_paginated_response(serializer.data)
     except Organization.DoesNotExist:
@@ -0,0 +1,51 @@
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework import status
+from drf_yasg.utils import swagger_auto_schema
+from ..entitlements import owned_among
+from ..serializers import OwnedItemsQuerySerializer, OwnedItemsSerializer
+
+# Request and response keys: entitlement kind
+ITEM_KEYS = {
+    'services': 'service',
+    'products': 'product',
+    'videos': 'video',
+}
+
+
+# --------------------------------------------------------------------------
+# Which of these services, products and videos does a user own
+# --------------------------------------------------------------------------
+@swagger_auto_schema(
+    method='post',
+    operation_description=(
+        "Return the ids among the given services, products and videos that the user bought, "
+        "answered from a cached per-user set. Staff may ask for another user with `user_id`."
+    ),
+    request_body=OwnedItemsQuerySerializer,
+    responses={
+        200: OwnedItemsSerializer,
+        400: "Bad request",
+        403: "Only staff can ask for another user"
+    }
+)
+@api_view(['POST'])
+def get_owned_items(request):
+    try:
+        serializer = OwnedItemsQuerySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'error': 'Invalid data', 'details': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+
+        user_id = data.get('user_id', request.user.pk)
+        if user_id != request.user.pk and not request.user.is_staff:
+            return Response({'error': 'Only staff can ask for another user'}, status=status.HTTP_403_FORBIDDEN)
+
+        owned = owned_among(user_id, {ITEM_KEYS[key]: data.get(key, []) for key in ITEM_KEYS})
+        return Response(
+            {'user_id': user_id, **{key: owned[kind] for key, kind in ITEM_KEYS.items()}},
+            status=status.HTTP_200_OK,
+        )
+    except Exception as e:
+        print(f"Error in get_owned_items: {e}")
+        return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
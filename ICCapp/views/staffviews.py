@@ -5,7 +5,7 @@ from ..serializers import *
 from rest_framework.decorators import api_view,parser_classes, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
-from utils import normalize_img_field, parse_json_fields
+from utils import normalize_img_field, parse_json_fields, plan_queryset
 from rest_framework.pagination import PageNumberPagination
 from django.http import QueryDict
 from drf_yasg.utils import swagger_auto_schema
@@ -31,7 +31,7 @@ def get_staffs(request, organization_id):
         organization = get_object_or_404(Organization, id=organization_id)
         staffs = Staff.objects.filter(organization=organization).order_by('id')
         paginator = StaffPagination()
-        result_page = paginator.paginate_queryset(staffs, request)
+        result_page = paginator.paginate_queryset(plan_queryset(staffs, StaffSerializer), request)
         serializer = StaffSerializer(result_page, many=True)
         return paginator.get_paginated_response(serializer.data)
     except Organization.DoesNotExist:
@@ -1,6 +1,7 @@
 from django.shortcuts import get_object_or_404, render
 from ..models import *
 from ..serializers import *
+from utils import plan_queryset
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
@@ -28,7 +29,7 @@ def get_subscriptions(request, organization_id):
         organization = get_object_or_404(Organization, id=organization_id)
         subscriptions = Subscription.objects.filter(organization=organization).order_by('-date_added')
         paginator = SubscriptionPagination()
-        result_page = paginator.paginate_queryset(subscriptions, request)
+        result_page = paginator.paginate_queryset(plan_queryset(subscriptions, SubscriptionSerializer), request)
         serializer = SubscriptionSerializer(result_page, many=True)
         return paginator.get_paginated_response(serializer.data)
     except Organization.DoesNotExist:
@@ -5,7 +5,7 @@ from rest_framework.decorators import api_view,parser_classes, permission_classe
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
-from utils import normalize_img_field
+from utils import normalize_img_field, plan_queryset
 from rest_framework.pagination import PageNumberPagination
 from django.http import QueryDict
 from drf_yasg.utils import swagger_auto_schema
@@ -33,7 +33,7 @@ def get_testimonials(request, organization_id):
         organization = get_object_or_404(Organization, id=organization_id)
         testimonials = Testimonial.objects.filter(organization=organization).order_by('-created_at')          
         paginator = TestimonialPagination()
-        result_page = paginator.paginate_queryset(testimonials, request)
+        result_page = paginator.paginate_queryset(plan_queryset(testimonials, TestimonialSerializer), request)
         serializer = TestimonialSerializer(result_page, many=True)
         return paginator.get_paginated_response(serializer.data)
     except Organization.DoesNotExist:
@@ -0,0 +1,153 @@
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework import status
+from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
+from ..models import ResumableUpload
+from ..serializers import CreateResumableUploadSerializer, ResumableUploadSerializer
+from ..uploads import UploadError, abort_upload, finalize_upload, receive_chunk, start_upload, target_instance
+from products.serializers import ProductSerializer
+from vidoes.serializers import VideoSerializer
+
+CHUNK_CONTENT_TYPE = 'application/offset+octet-stream'
+TARGET_SERIALIZERS = {
+    'video': VideoSerializer,
+    'product': ProductSerializer,
+}
+
+
+def upload_response(upload, status_code=status.HTTP_200_OK):
+    response = Response(ResumableUploadSerializer(upload).data, status=status_code)
+    response['Upload-Offset'] = str(upload.offset)
+    response['Upload-Length'] = str(upload.size)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+# --------------------------------------------------------------------------
+# Start a resumable upload (tus-style: start, PATCH chunks, finalize)
+# --------------------------------------------------------------------------
+@swagger_auto_schema(
+    method='post',
+    operation_description=(
+        "Start a resumable upload of a video or product file. Send the file in chunks of "
+        "`chunk_size` bytes with PATCH, then finalize to attach it to the video or product."
+    ),
+    request_body=CreateResumableUploadSerializer,
+    responses={
+        201: ResumableUploadSerializer,
+        400: "Bad request",
+        404: "Video or product not found",
+        413: "File too large"
+    }
+)
+@api_view(['POST'])
+def create_upload(request):
+    try:
+        serializer = CreateResumableUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'error': 'Invalid data', 'details': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+
+        instance = target_instance(data['target'], data['object_id'])
+        if instance is None:
+            return Response({'error': f"{data['target'].capitalize()} not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        upload = start_upload(request.user, data['target'], instance, data['filename'], data['size'])
+        response = upload_response(upload, status.HTTP_201_CREATED)
+        response['Location'] = request.build_absolute_uri(f'{upload.token}/')
+        return response
+    except UploadError as e:
+        return Response({'error': str(e)}, status=e.status)
+    except Exception as e:
+        print(f"Error in create_upload: {e}")
+        return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# --------------------------------------------------------------------------
+# Upload progress, send a chunk, abort
+# --------------------------------------------------------------------------
+@swagger_auto_schema(
+    methods=['get', 'delete'],
+    responses={
+        200: ResumableUploadSerializer,
+        204: "Upload aborted",
+        404: "Upload not found"
+    }
+)
+@swagger_auto_schema(
+    method='patch',
+    operation_description=(
+        f"Send the next chunk as the raw body ({CHUNK_CONTENT_TYPE}). Every chunk but the last "
+        "has exactly `chunk_size` bytes. A chunk whose checksum does not match is dropped with 460."
+    ),
+    manual_parameters=[
+        openapi.Parameter('Upload-Offset', openapi.IN_HEADER, description="Offset of the chunk, the upload's current offset", type=openapi.TYPE_INTEGER, required=True),
+        openapi.Parameter('Upload-Checksum', openapi.IN_HEADER, description="<sha256|sha1|md5> <base64 digest of the chunk>", type=openapi.TYPE_STRING, required=True),
+    ],
+    responses={
+        204: "Chunk stored, new offset in the Upload-Offset header",
+        400: "Bad chunk size or headers",
+        404: "Upload not found",
+        409: "Offset mismatch or upload not in progress",
+        415: f"Content-Type must be {CHUNK_CONTENT_TYPE}",
+        460: "Checksum mismatch"
+    }
+)
+@api_view(['GET', 'HEAD', 'PATCH', 'DELETE'])
+def upload_detail(request, token):
+    try:
+        upload = ResumableUpload.objects.filter(token=token, user=request.user).first()
+        if upload is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.method == 'DELETE':
+            abort_upload(upload)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if request.method != 'PATCH':
+            return upload_response(upload)
+
+        if request.content_type.split(';')[0].strip() != CHUNK_CONTENT_TYPE:
+            return Response({'error': f'Content-Type must be {CHUNK_CONTENT_TYPE}'}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response({'error': 'Upload-Offset and Content-Length headers are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The body is read straight from the request in small blocks, never parsed
+        new_offset = receive_chunk(upload, offset, request.stream, length, request.headers.get('Upload-Checksum', ''))
+        response = Response(status=status.HTTP_204_NO_CONTENT)
+        response['Upload-Offset'] = str(new_offset)
+        return response
+    except UploadError as e:
+        return Response({'error': str(e)}, status=e.status)
+    except Exception as e:
+        print(f"Error in upload_detail: {e}")
+        return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# --------------------------------------------------------------------------
+# Finalize an upload (attach the file)
+# --------------------------------------------------------------------------
+@swagger_auto_schema(
+    method='post',
+    operation_description="Attach a complete upload to its video or product and return it",
+    responses={
+        200: "The updated video or product",
+        404: "Upload, video or product not found",
+        409: "Upload incomplete or not in progress"
+    }
+)
+@api_view(['POST'])
+def finalize_resumable_upload(request, token):
+    try:
+        upload = ResumableUpload.objects.filter(token=token, user=request.user).first()
+        if upload is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        instance = finalize_upload(upload)
+        return Response(TARGET_SERIALIZERS[upload.target](instance).data, status=status.HTTP_200_OK)
+    except UploadError as e:
+        return Response({'error': str(e)}, status=e.status)
+    except Exception as e:
+        print(f"Error in finalize_resumable_upload: {e}")
+        return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
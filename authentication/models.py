@@ -3,6 +3,8 @@ from django.contrib.auth.models import AbstractUser, Group, Permission
 
 class CustomUser(AbstractUser):
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
+    # Resized variants of the image (ICCapp/imagevariants.py)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     isOauth = models.BooleanField(default=False)
     Oauthprovider = models.CharField(max_length=100, null=True, blank=True, default='email')
     emailIsVerified = models.BooleanField(default=False)
@@ -5,6 +5,7 @@ from utils import *
 class UserSerializer(serializers.ModelSerializer):
     avatar = serializers.ImageField(allow_null=True, required=False)
     avatar_url = serializers.SerializerMethodField()
+    avatar_srcset = serializers.SerializerMethodField()
     avatar_name = serializers.SerializerMethodField()
     class Meta:
         model = CustomUser
@@ -15,6 +16,9 @@ class UserSerializer(serializers.ModelSerializer):
         useravatar = obj.avatar
         return get_full_image_url(useravatar)
     
+    def get_avatar_srcset(self, obj):
+        return get_image_srcset(obj.avatar, obj.avatar_variants)
+    
     def get_avatar_name(self, obj):
         useravatar = obj.avatar
         return get_image_name(useravatar)
@@ -32,16 +36,20 @@ class UserAuthSerializer(serializers.Serializer):
 
 class UserminiSerializer(serializers.ModelSerializer):
     img = serializers.SerializerMethodField()  # Handle avatar as URL
+    img_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = CustomUser
-        fields = ['id', 'username', 'img']
+        fields = ['id', 'username', 'img', 'img_srcset']
         ref_name = "AuthUserMini"
 
     def get_img(self, obj):
         """Generate the full avatar URL or return an empty string if not available."""
         return get_full_image_url(obj.avatar) if obj.avatar else None
 
+    def get_img_srcset(self, obj):
+        return get_image_srcset(obj.avatar, obj.avatar_variants)
+
 
 # Serializers for API documentation
 class RegisterUserSerializer(serializers.Serializer):
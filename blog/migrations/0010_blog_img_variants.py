@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_blog_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='img_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
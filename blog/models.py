@@ -21,6 +21,8 @@ class Blog(models.Model):
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
     img = models.ImageField(upload_to='blogs/', null=True, blank=True)
+    # Resized variants of the image (ICCapp/imagevariants.py)
+    img_variants = models.JSONField(default=dict, blank=True, editable=False)
     title = models.CharField(max_length=100)
     subtitle = models.CharField(max_length=100, blank=True, null=True)
     body = RichTextField( blank=True, null=True)
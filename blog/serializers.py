@@ -40,6 +40,7 @@ class BlogSerializer(serializers.ModelSerializer):
     # Image fields
     img = serializers.ImageField(allow_null=True, required=False)
     img_url = serializers.SerializerMethodField()
+    img_srcset = serializers.SerializerMethodField()
     img_name = serializers.SerializerMethodField()
     author = UserminiSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
@@ -50,7 +51,7 @@ class BlogSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'subtitle', 'body', 'slug' , 'category' , 'tags'
             , 'author', 'organization', 
-            'img', 'img_url', 'img_name', 'readTime', 
+            'img', 'img_url', 'img_srcset', 'img_name', 'readTime', 
             'views', 'date', 'updated_at','likes'
         ]
         read_only_fields = ['id', 'date', 'updated_at', 'views', 'likes']
@@ -59,6 +60,9 @@ class BlogSerializer(serializers.ModelSerializer):
     def get_img_url(self, obj):
         return get_full_image_url(obj.img) if obj.img else None
     
+    def get_img_srcset(self, obj):
+        return get_image_srcset(obj.img, obj.img_variants)
+    
     def get_img_name(self, obj):
         return get_image_name(obj.img) if obj.img else None
     
@@ -1,3 +1,45 @@
-from django.test import TestCase
+from ICCapp.testing import ListingQueryTestCase
+from .models import Blog, Category, Comment, Tag
+from .serializers import BlogSerializer, CommentSerializer
 
-# Create your tests here.
+
+class BlogListingQueryTests(ListingQueryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        category = Category.objects.create(category='News')
+        tags = [Tag.objects.create(tag=f'tag{i}') for i in range(2)]
+        for i in range(12):
+            blog = Blog.objects.create(
+                organization=cls.organization, author=cls.buyer, category=category, title=f'Post {i}', body='',
+            )
+            blog.tags.add(*tags)
+            blog.likes.add(*cls.buyers)
+            Comment.objects.create(user=cls.buyer, blog=blog, comment=f'Comment {i}')
+        cls.blog = blog
+        for i in range(11):
+            Comment.objects.create(user=cls.buyers[i % 2], blog=blog, comment=f'Reply {i}')
+
+    def test_organization_blogs_page_runs_a_fixed_number_of_queries(self):
+        # organization check, count, page (author and category joined), tags
+        # and likes prefetches
+        results = self.assertListing(
+            f'/blogsapi/orgblogs/{self.organization.pk}/', 5, BlogSerializer,
+            Blog.objects.filter(organization=self.organization).order_by('-updated_at'),
+        )
+        self.assertEqual(results[0]['author']['username'], 'buyer0')
+        self.assertEqual(len(results[0]['tags']), 2)
+
+    def test_author_blogs_page_runs_a_fixed_number_of_queries(self):
+        self.assertListing(
+            f'/blogsapi/blogs/{self.buyer.pk}/', 5, BlogSerializer,
+            Blog.objects.filter(author=self.buyer).order_by('-updated_at'),
+        )
+
+    def test_comments_page_runs_a_fixed_number_of_queries(self):
+        # count, page with the commenters joined
+        results = self.assertListing(
+            f'/blogsapi/getcomments/{self.blog.pk}/', 2, CommentSerializer,
+            Comment.objects.filter(blog=self.blog).order_by('-updated_at'),
+        )
+        self.assertEqual({c['user']['username'] for c in results}, {'buyer0', 'buyer1'})
@@ -10,7 +10,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.pagination import PageNumberPagination
 from django.contrib.auth import get_user_model
-from utils import normalize_img_field,parse_json_fields
+from utils import normalize_img_field,parse_json_fields,plan_queryset
 from rest_framework.parsers import MultiPartParser, FormParser
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
@@ -64,7 +64,7 @@ def get_org_blogs(request, organization_id):
             blogs = Blog.objects.filter(organization=organization_id).order_by('-updated_at')
         
         paginator = BlogPagination()
-        result_page = paginator.paginate_queryset(blogs, request)
+        result_page = paginator.paginate_queryset(plan_queryset(blogs, BlogSerializer), request)
         serializer = BlogSerializer(result_page, many=True)
         return paginator.get_paginated_response(serializer.data)
         
@@ -104,7 +104,7 @@ def get_blogs(request, user_id):
         
         blogs = Blog.objects.filter(author=user_id).order_by('-updated_at')
         paginator = BlogPagination()
-        result_page = paginator.paginate_queryset(blogs, request)
+        result_page = paginator.paginate_queryset(plan_queryset(blogs, BlogSerializer), request)
         serializer = BlogSerializer(result_page, many=True)
         return paginator.get_paginated_response(serializer.data)
         
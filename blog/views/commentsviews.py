@@ -1,6 +1,7 @@
 from django.shortcuts import render
 from ..models import *
 from ..serializers import *
+from utils import plan_queryset
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
@@ -25,7 +26,7 @@ def get_comments(request, blog_id):
     try:
         comments = Comment.objects.filter(blog=blog_id).order_by('-updated_at')
         paginator = CommentPagination()
-        result_page = paginator.paginate_queryset(comments, request)
+        result_page = paginator.paginate_queryset(plan_queryset(comments, CommentSerializer), request)
         serializer = CommentSerializer(result_page, many=True)
         return paginator.get_paginated_response(serializer.data)
     except Comment.DoesNotExist:
@@ -1,3 +1,84 @@
+from unittest import mock
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from rest_framework.test import APIClient
+from ICCapp import trending
+from ICCapp.models import Organization
+from ICCapp.testing import ListingQueryTestCase
+from products.models import Product, ProductTrendingScore
+from services.models import Category as ServiceCategory, Service, ServiceTrendingScore, SubCategory as ServiceSubCategory
+from vidoes.models import Video, VideoTrendingScore
+from .models import Orders
+from .serializers import PaymentResponseSerializer
 
-# Create your tests here.
+
+class PaymentListingQueryTests(ListingQueryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        category = ServiceCategory.objects.create(category='Consulting')
+        subcategory = ServiceSubCategory.objects.create(category=category, subcategory='Tax')
+        for i in range(5):
+            order = Orders.objects.create(organization=cls.organization, customer=cls.buyer, amount=30, status='Completed')
+            for j in range(2):
+                service = Service.objects.create(
+                    organization=cls.organization, name=f'Service {i}.{j}', price=10, category=category, subcategory=subcategory,
+                )
+                service.userIDs_that_bought_this_service.add(cls.buyer)
+                order.services.add(service)
+                order.products.add(Product.objects.create(organization=cls.organization, name=f'Product {i}.{j}', price=10))
+                order.videos.add(Video.objects.create(organization=cls.organization, title=f'Video {i}.{j}', description=''))
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.buyer)
+
+    def test_organization_payments_run_a_fixed_number_of_queries(self):
+        # organization lookup, exists check, orders (organization and
+        # customer joined), then per item kind the items (organization,
+        # category and subcategory joined) and their buyers prefetches
+        results = self.assertListing(
+            f'/paymentsapi/payments/{self.organization.pk}/', 11, PaymentResponseSerializer,
+            Orders.objects.filter(organization=self.organization),
+        )
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len(results[0]['services']), 2)
+        self.assertEqual(results[0]['services'][0]['subcategory']['category']['category'], 'Consulting')
+        self.assertEqual(results[0]['customer']['email'], 'buyer0@example.com')
+
+    def test_customer_payments_run_a_fixed_number_of_queries(self):
+        results = self.assertListing(
+            f'/paymentsapi/paymentsbyuser/{self.buyer.pk}/', 11, PaymentResponseSerializer,
+            Orders.objects.filter(customer=self.buyer),
+        )
+        self.assertEqual(len(results[0]['videos']), 2)
+
+
+class VerifyPaymentTrendingTests(TestCase):
+    def setUp(self):
+        organization = Organization.objects.create(name='Org')
+        self.customer = get_user_model().objects.create_user(username='customer', email='customer@example.com', password='x')
+        self.order = Orders.objects.create(organization=organization, customer=self.customer, amount=30)
+        self.order.services.add(Service.objects.create(organization=organization, name='Service', price=10))
+        self.order.products.add(Product.objects.create(organization=organization, name='Product', price=10))
+        self.order.videos.add(Video.objects.create(organization=organization, title='Video', description=''))
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def verify(self, paid=True):
+        with mock.patch('payments.views.Paystack') as paystack:
+            paystack.return_value.verify_payment.return_value = (paid, {})
+            return self.client.post('/paymentsapi/verifypayment/', {
+                'reference': self.order.reference, 'customer_id': self.customer.pk,
+            }, format='json')
+
+    def test_purchase_counts_once_on_first_completion(self):
+        self.assertEqual(self.verify(paid=False).status_code, 400)
+        self.assertFalse(ServiceTrendingScore.objects.exists())
+
+        for _ in range(2):
+            self.assertEqual(self.verify().status_code, 200)
+        points = trending.purchase_points(self.order.created_at)
+        for model in (ServiceTrendingScore, ProductTrendingScore, VideoTrendingScore):
+            with self.subTest(model=model.__name__):
+                self.assertAlmostEqual(model.objects.get().score, points)
@@ -4,6 +4,7 @@ from products.models import Product
 from services.models import Service
 from vidoes.models import Video
 from ICCapp.models import Organization
+from ICCapp.trending import record_purchase
 from .serializers import PaymentResponseSerializer, PaymentSerializer, VerifyPaymentSerializer, PaymentCountStatsSerializer
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
@@ -11,6 +12,7 @@ from rest_framework import status
 from django.contrib.auth import get_user_model
 from .Paystack import Paystack
 from django.db.models import Count,Sum,Avg
+from utils import plan_queryset
 from drf_yasg.utils import swagger_auto_schema
 
 Customer = get_user_model()
@@ -27,7 +29,7 @@ def get_payments(request, organization_id):
     try:
         # Validate organization exists
         organization = Organization.objects.get(id=organization_id)
-        orders = Orders.objects.filter(organization=organization_id)
+        orders = plan_queryset(Orders.objects.filter(organization=organization_id), PaymentResponseSerializer)
         
         if not orders.exists():
             return Response([], status=status.HTTP_200_OK)
@@ -53,7 +55,7 @@ def get_payments_by_user(request, user_id):
     try:
         # Validate customer exists
         customer = Customer.objects.get(id=user_id)
-        orders = Orders.objects.filter(customer=user_id)
+        orders = plan_queryset(Orders.objects.filter(customer=user_id), PaymentResponseSerializer)
         
         if not orders.exists():
             return Response([], status=status.HTTP_200_OK)
@@ -77,7 +79,7 @@ def get_payments_by_user(request, user_id):
 @api_view(['GET'])
 def get_payment(request, payment_id):
     try:
-        order = Orders.objects.get(id=payment_id)
+        order = plan_queryset(Orders.objects.all(), PaymentResponseSerializer).get(id=payment_id)
         serializer = PaymentResponseSerializer(order, many=False)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Orders.DoesNotExist:
@@ -90,7 +92,7 @@ def get_payment(request, payment_id):
 @api_view(['GET'])
 def get_payment_by_reference(request, reference):
     try:
-        order = Orders.objects.get(reference=reference)
+        order = plan_queryset(Orders.objects.all(), PaymentResponseSerializer).get(reference=reference)
         serializer = PaymentResponseSerializer(order, many=False)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Orders.DoesNotExist:
@@ -194,6 +196,8 @@ def verify_payment(request):
         order = Orders.objects.prefetch_related('services', 'products', 'videos').get(reference=ref)
         
         if payment_status:
+            # A repeated verification must not count the purchase again
+            first_completion = order.status != 'Completed'
             order.status = 'Completed'
             
             # Update services
@@ -204,6 +208,8 @@ def verify_payment(request):
                     if service.userIDs_whose_services_have_been_completed.filter(id=customer_id).exists():
                         service.userIDs_whose_services_have_been_completed.remove(customer_id)
                     service.save()
+                    if first_completion:
+                        record_purchase(service, order.created_at)
             
             # Update products
             if order.products.exists():
@@ -211,6 +217,8 @@ def verify_payment(request):
                     product.number_of_times_bought += 1
                     product.userIDs_that_bought_this_product.add(customer_id)
                     product.save()
+                    if first_completion:
+                        record_purchase(product, order.created_at)
             
             # Update videos
             if order.videos.exists():
@@ -218,6 +226,8 @@ def verify_payment(request):
                     video.number_of_times_bought += 1
                     video.userIDs_that_bought_this_video.add(customer_id)
                     video.save()
+                    if first_completion:
+                        record_purchase(video, order.created_at)
             
             order.save()
             order_serializer = PaymentResponseSerializer(order)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_auto_20240726_1239'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='preview_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
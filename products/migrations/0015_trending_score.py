@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def compute_trending(apps, schema_editor):
+    from ICCapp.trending import recompute
+    recompute('products.Product', registry=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_rename_vidoes_orders_videos'),
+        ('ICCapp', '0018_resumableupload'),
+        ('products', '0014_product_preview_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTrendingScore',
+            fields=[
+                ('score', models.FloatField()),
+                ('last_purchase_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='products.product')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.category')),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ICCapp.organization')),
+            ],
+            options={
+                'abstract': False,
+                'indexes': [models.Index(fields=['organization', 'category', '-score'], name='products_trending_cat_idx'), models.Index(fields=['organization', '-score'], name='products_trending_org_idx')],
+            },
+        ),
+        migrations.RunPython(compute_trending, migrations.RunPython.noop),
+    ]
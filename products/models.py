@@ -1,5 +1,5 @@
 from django.db import models
-from ICCapp.models import Organization
+from ICCapp.models import Organization, AbstractTrendingScore
 from django.conf import settings
 import uuid
 
@@ -29,6 +29,8 @@ class SubCategory(models.Model):
 class Product(models.Model):
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
     preview = models.ImageField(upload_to='products/',null=True, blank=True)
+    # Resized variants of the image (ICCapp/imagevariants.py)
+    preview_variants = models.JSONField(default=dict, blank=True, editable=False)
     name = models.CharField(max_length=200, unique=True , null=True, blank=False)
     description = models.TextField(default='No description available')
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -60,4 +62,13 @@ class Product(models.Model):
     def generate_token(self):
         return uuid.uuid4().hex
 
-# 
\ No newline at end of file
+
+# Trending score of a bought product (ICCapp/trending.py)
+class ProductTrendingScore(AbstractTrendingScore):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    def __str__(self):
+        return f'{self.product_id}: {self.score:.3f}'
+
+# 
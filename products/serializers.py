@@ -34,6 +34,7 @@ class CreateSubCategorySerializer(serializers.ModelSerializer):
 class ProductSerializer(serializers.ModelSerializer):
     organization = OrganizationMiniSerializer(read_only=True)
     img_url = serializers.SerializerMethodField()
+    img_srcset = serializers.SerializerMethodField()
     img_name = serializers.SerializerMethodField()
     product_url = serializers.SerializerMethodField()
     product_name = serializers.SerializerMethodField()
@@ -53,6 +54,9 @@ class ProductSerializer(serializers.ModelSerializer):
     def get_img_url(self, obj):
         return get_full_image_url(obj.preview)
 
+    def get_img_srcset(self, obj):
+        return get_image_srcset(obj.preview, obj.preview_variants)
+
     def get_img_name(self, obj):
         return get_image_name(obj.preview)
 
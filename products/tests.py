@@ -1,3 +1,36 @@
-from django.test import TestCase
+from ICCapp.testing import ListingQueryTestCase
+from .models import Category, Product, ProductTrendingScore, SubCategory
+from .serializers import ProductSerializer
 
-# Create your tests here.
+
+class ProductListingQueryTests(ListingQueryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        category = Category.objects.create(category='Books')
+        subcategory = SubCategory.objects.create(category=category, subcategory='Guides')
+        cls.create_catalog(Product, ProductTrendingScore, category, subcategory, lambda i: {'name': f'Product {i}', 'price': 10})
+
+    def test_products_page_runs_a_fixed_number_of_queries(self):
+        # organization check, count, page (organization, category, subcategory
+        # and its category joined), buyers prefetch
+        results = self.assertListing(
+            f'/productsapi/products/{self.organization.pk}/', 4, ProductSerializer,
+            Product.objects.filter(organization=self.organization).order_by('-last_updated_date'),
+        )
+        self.assertEqual(results[0]['subcategory']['category']['category'], 'Books')
+        self.assertEqual(len(results[0]['userIDs_that_bought_this_product']), 2)
+
+    def test_trending_products_page_runs_a_fixed_number_of_queries(self):
+        results = self.assertListing(
+            f'/productsapi/trendingproducts/{self.organization.pk}/', 4, ProductSerializer,
+            Product.objects.filter(trending__organization=self.organization).order_by('-trending__score', '-last_updated_date'),
+        )
+        self.assertEqual([p['name'] for p in results][:2], ['Product 11', 'Product 10'])
+
+    def test_bought_products_page_runs_a_fixed_number_of_queries(self):
+        # plus the user check
+        self.assertListing(
+            f'/productsapi/userboughtproducts/{self.organization.pk}/{self.buyer.pk}/', 5, ProductSerializer,
+            Product.objects.filter(organization=self.organization, userIDs_that_bought_this_product=self.buyer).order_by('-last_updated_date'),
+        )
@@ -5,8 +5,7 @@ from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
-from utils import normalize_img_field,parse_json_fields
-from django.db.models import Count
+from utils import normalize_img_field,parse_json_fields,plan_queryset
 from django.http import QueryDict
 from drf_yasg.utils import swagger_auto_schema
 from ICCapp.models import Organization
@@ -49,7 +48,7 @@ def get_products(request, organization_id):
             products = Product.objects.filter(organization=organization_id).order_by('-last_updated_date')
         
         paginator = ProductPagination()
-        result_page = paginator.paginate_queryset(products, request)
+        result_page = paginator.paginate_queryset(plan_queryset(products, ProductSerializer), request)
         serializer = ProductSerializer(result_page, many=True)
         return paginator.get_paginated_response(serializer.data)
     except Exception as e:
@@ -76,25 +75,17 @@ def get_trendingproducts(request, organization_id):
             try:
                 product_category = Category.objects.get(category=category)
                 products = Product.objects.filter(
-                    organization=organization_id, category=product_category
-                ).annotate(
-                    buyers_count=Count('userIDs_that_bought_this_product')
-                ).filter(
-                    buyers_count__gt=0  # Exclude products with no buyers
-                ).order_by('-buyers_count', '-last_updated_date')
+                    trending__organization=organization_id, trending__category=product_category
+                ).order_by('-trending__score', '-last_updated_date')
             except Category.DoesNotExist:
                 return Response({'error': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
         else:
             products = Product.objects.filter(
-                organization=organization_id
-            ).annotate(
-                buyers_count=Count('userIDs_that_bought_this_product')
-            ).filter(
-                buyers_count__gt=0  # Exclude products with no buyers
-            ).order_by('-buyers_count', '-last_updated_date')
+                trending__organization=organization_id
+            ).order_by('-trending__score', '-last_updated_date')
 
         paginator = ProductPagination()
-        result_page = paginator.paginate_queryset(products, request)
+        result_page = paginator.paginate_queryset(plan_queryset(products, ProductSerializer), request)
         serializer = ProductSerializer(result_page, many=True)
 
         return paginator.get_paginated_response(serializer.data)
@@ -142,7 +133,7 @@ def get_user_products(request, organization_id, user_id):
             ).order_by('-last_updated_date')
 
         paginator = ProductPagination()
-        result_page = paginator.paginate_queryset(products, request)
+        result_page = paginator.paginate_queryset(plan_queryset(products, ProductSerializer), request)
         serializer = ProductSerializer(result_page, many=True)
         return paginator.get_paginated_response(serializer.data)
 
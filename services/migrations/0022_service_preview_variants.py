@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0021_service_details_form_link'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='preview_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
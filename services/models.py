@@ -1,5 +1,5 @@
 from django.db import models
-from ICCapp.models import Organization
+from ICCapp.models import Organization, AbstractTrendingScore
 from django.conf import settings
 from ckeditor.fields import RichTextField
 import uuid
@@ -29,6 +29,8 @@ class SubCategory(models.Model):
 class Service(models.Model):
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
     preview = models.ImageField(upload_to='services/',null=True, blank=True)
+    # Resized variants of the image (ICCapp/imagevariants.py)
+    preview_variants = models.JSONField(default=dict, blank=True, editable=False)
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     service_token = models.CharField(max_length=100, blank=True, null=True)
@@ -60,4 +62,13 @@ class Service(models.Model):
     def generate_token(self):
         return uuid.uuid4().hex
 
-# Prebuilt Categories Form 
\ No newline at end of file
+
+# Trending score of a bought service (ICCapp/trending.py)
+class ServiceTrendingScore(AbstractTrendingScore):
+    service = models.OneToOneField(Service, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    def __str__(self):
+        return f'{self.service_id}: {self.score:.3f}'
+
+# Prebuilt Categories Form 
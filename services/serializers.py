@@ -34,6 +34,7 @@ class ServiceSerializer(serializers.ModelSerializer):
     organization = OrganizationMiniSerializer(read_only=True)
     preview = serializers.ImageField(allow_null=True, required=False)
     img_url = serializers.SerializerMethodField()
+    img_srcset = serializers.SerializerMethodField()
     img_name = serializers.SerializerMethodField()
     category = CategorySerializer(read_only=True)
     subcategory = SubCategorySerializer(read_only=True)
@@ -46,6 +47,9 @@ class ServiceSerializer(serializers.ModelSerializer):
     def get_img_url(self, obj):
         return get_full_image_url(obj.preview)
     
+    def get_img_srcset(self, obj):
+        return get_image_srcset(obj.preview, obj.preview_variants)
+    
     def get_img_name(self, obj):
         return get_image_name(obj.preview)
 
@@ -1,3 +1,37 @@
-from django.test import TestCase
+from ICCapp.testing import ListingQueryTestCase
+from .models import Category, Service, ServiceTrendingScore, SubCategory
+from .serializers import ServiceSerializer
 
-# Create your tests here.
+
+class ServiceListingQueryTests(ListingQueryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        category = Category.objects.create(category='Consulting')
+        subcategory = SubCategory.objects.create(category=category, subcategory='Tax')
+        cls.create_catalog(Service, ServiceTrendingScore, category, subcategory, lambda i: {'name': f'Service {i}', 'price': 10})
+
+    def test_services_page_runs_a_fixed_number_of_queries(self):
+        # organization check, count, page (organization, category, subcategory
+        # and its category joined), one prefetch per buyers many-to-many field
+        results = self.assertListing(
+            f'/servicesapi/services/{self.organization.pk}/', 6, ServiceSerializer,
+            Service.objects.filter(organization=self.organization).order_by('-updated_at'),
+        )
+        self.assertEqual(results[0]['subcategory']['category']['category'], 'Consulting')
+        self.assertEqual(len(results[0]['userIDs_that_bought_this_service']), 2)
+
+    def test_trending_services_page_runs_a_fixed_number_of_queries(self):
+        results = self.assertListing(
+            f'/servicesapi/trendingservices/{self.organization.pk}/', 6, ServiceSerializer,
+            Service.objects.filter(trending__organization=self.organization).order_by('-trending__score', '-updated_at'),
+        )
+        self.assertEqual([s['name'] for s in results][:2], ['Service 11', 'Service 10'])
+
+    def test_bought_services_page_runs_a_fixed_number_of_queries(self):
+        self.client.force_authenticate(self.buyer)
+        # plus the user check
+        self.assertListing(
+            f'/servicesapi/userboughtservices/{self.organization.pk}/{self.buyer.pk}/', 7, ServiceSerializer,
+            Service.objects.filter(organization=self.organization, userIDs_that_bought_this_service=self.buyer).order_by('-updated_at'),
+        )
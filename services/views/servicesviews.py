@@ -6,9 +6,8 @@ from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
-from utils import normalize_img_field,parse_json_fields,get_full_image_url
+from utils import normalize_img_field,parse_json_fields,get_full_image_url,plan_queryset
 import json
-from django.db.models import Count
 from django.http import QueryDict
 from collections import Counter
 from django.contrib.auth import get_user_model
@@ -62,7 +61,7 @@ def get_services(request, organization_id):
             services = Service.objects.filter(organization=organization_id).order_by('-updated_at')
         
         paginator = ServicePagination()
-        result_page = paginator.paginate_queryset(services, request)
+        result_page = paginator.paginate_queryset(plan_queryset(services, ServiceSerializer), request)
         serializer = ServiceSerializer(result_page, many=True)
         return paginator.get_paginated_response(serializer.data)
     except Exception as e:
@@ -71,7 +70,7 @@ def get_services(request, organization_id):
 
 @swagger_auto_schema(
     method='get',
-    operation_description="Get trending services for a specific organization, sorted by number of buyers",
+    operation_description="Get trending services for a specific organization, sorted by recent purchases (older purchases count for less)",
     manual_parameters=[
         openapi.Parameter(
             'category',
@@ -99,25 +98,17 @@ def get_trendingservices(request, organization_id):
             try:
                 service_category = Category.objects.get(category=category)
                 services = Service.objects.filter(
-                    organization=organization_id, category=service_category
-                ).annotate(
-                    buyers_count=Count('userIDs_that_bought_this_service')
-                ).filter(
-                    buyers_count__gt=0  # Exclude services with no buyers
-                ).order_by('-buyers_count', '-updated_at')
+                    trending__organization=organization_id, trending__category=service_category
+                ).order_by('-trending__score', '-updated_at')
             except Category.DoesNotExist:
                 return Response({'error': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
         else:
             services = Service.objects.filter(
-                organization=organization_id
-            ).annotate(
-                buyers_count=Count('userIDs_that_bought_this_service')
-            ).filter(
-                buyers_count__gt=0  # Exclude services with no buyers
-            ).order_by('-buyers_count', '-updated_at')
+                trending__organization=organization_id
+            ).order_by('-trending__score', '-updated_at')
 
         paginator = ServicePagination()
-        result_page = paginator.paginate_queryset(services, request)
+        result_page = paginator.paginate_queryset(plan_queryset(services, ServiceSerializer), request)
         serializer = ServiceSerializer(result_page, many=True)
 
         return paginator.get_paginated_response(serializer.data)
@@ -173,7 +164,7 @@ def get_user_services(request, organization_id, user_id):
             ).order_by('-updated_at')
 
         paginator = ServicePagination()
-        result_page = paginator.paginate_queryset(services, request)
+        result_page = paginator.paginate_queryset(plan_queryset(services, ServiceSerializer), request)
         serializer = ServiceSerializer(result_page, many=True)
         return paginator.get_paginated_response(serializer.data)
 
@@ -1,18 +1,27 @@
 # utils.py
 import re
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.db import connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
 import json
+from contextlib import nullcontext
 from functools import wraps
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from rest_framework import serializers
 
 def get_full_image_url(image_field, base_url=settings.DJANGO_IMAGE_URL):
     if not image_field:
         return None
 
     # Get the image URL
-    image_url = image_field.url
-    
+    return get_full_media_url(image_field.url, base_url)
+
+
+def get_full_media_url(image_url, base_url=settings.DJANGO_IMAGE_URL):
     # Fix percent-encoded colons first
     pattern_percent_3A = r'%3A'
     image_url = re.sub(pattern_percent_3A, ':', image_url)
@@ -27,6 +36,24 @@ def get_full_image_url(image_field, base_url=settings.DJANGO_IMAGE_URL):
     return image_url
 
 
+def get_image_srcset(image_field, variants, base_url=settings.DJANGO_IMAGE_URL):
+    """
+    srcset strings of the resized variants of an image, per format:
+    {'webp': '<url> 320w, <url> 640w', ...}. None until the variants of the
+    current file exist (see ICCapp/imagevariants.py).
+    """
+    if not image_field or not variants or variants.get('source') != image_field.name:
+        return None
+    storage = image_field.storage
+    srcset = {}
+    for image_format, widths in variants.get('formats', {}).items():
+        srcset[image_format] = ', '.join(
+            f"{get_full_media_url(storage.url(name), base_url)} {width}w"
+            for width, name in sorted(widths.items(), key=lambda item: int(item[0]))
+        )
+    return srcset or None
+
+
 
 def get_image_name(image_field):
     if not image_field:
@@ -146,3 +173,171 @@ def swagger_doc(
 
         return wrapper
     return decorator
+
+
+
+
+def claim_batch(queryset, worker_name, batch_size, **updates):
+    """
+    Claim up to batch_size rows of queryset (oldest first) for worker_name.
+
+    The model needs `claimed_by`/`claimed_at` fields. Rows are locked with
+    SELECT ... FOR UPDATE SKIP LOCKED where the backend supports it, and the
+    claim condition is re-applied in the UPDATE so two workers on a backend
+    without row locks (SQLite in DEBUG_ENV) can never claim the same row.
+    """
+    now = timezone.now()
+    # Without row locks a read-then-write transaction only adds lock
+    # upgrade deadlocks on SQLite, the guarded UPDATE is enough there
+    locking = connection.features.has_select_for_update
+    with transaction.atomic() if locking else nullcontext():
+        ids = list(
+            queryset.select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        queryset.filter(id__in=ids).update(claimed_by=worker_name, claimed_at=now, **updates)
+
+    return list(
+        queryset.model.objects.filter(id__in=ids, claimed_by=worker_name, claimed_at=now).order_by('id')
+    )
+
+
+def refresh_claim(queryset, worker_name, ids):
+    """
+    Restart the claim timeout of the rows of `ids` worker_name still holds,
+    for jobs that can outlast it. Returns the number of rows still held.
+    """
+    return queryset.filter(id__in=ids, claimed_by=worker_name).update(claimed_at=timezone.now())
+
+
+
+
+def plan_queryset(queryset, serializer_class):
+    """
+    Add the select_related/prefetch_related a serializer needs to a queryset.
+
+    Nested serializers of foreign keys are joined (recursively), nested
+    serializers of many-to-many and reverse relations are prefetched with a
+    queryset planned the same way, and lists of related ids are prefetched
+    with the ids only. A page then costs a fixed number of queries instead
+    of a few per row.
+    """
+    select, prefetch = _plan_fields(queryset.model, serializer_class().fields, '')
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def _plan_fields(model, fields, prefix):
+    select, prefetch = [], []
+    for field in fields.values():
+        if field.write_only or not field.source or field.source == '*' or '.' in field.source:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation:
+            continue
+        path = f'{prefix}{field.source}'
+        related_model = model_field.related_model
+
+        if model_field.many_to_many or model_field.one_to_many:
+            if isinstance(field, serializers.ListSerializer):
+                nested = plan_queryset(related_model._default_manager.all(), type(field.child))
+                prefetch.append(Prefetch(path, queryset=nested))
+            elif isinstance(field, serializers.ManyRelatedField):
+                prefetch.append(Prefetch(path, queryset=related_model._default_manager.only('pk')))
+        elif isinstance(field, serializers.BaseSerializer):
+            select.append(path)
+            nested_select, nested_prefetch = _plan_fields(related_model, field.fields, f'{path}__')
+            select += nested_select
+            prefetch += nested_prefetch
+        elif isinstance(field, serializers.RelatedField) and not isinstance(field, serializers.PrimaryKeyRelatedField):
+            # The primary key comes from the row itself, other representations need the object
+            select.append(path)
+    return select, prefetch
+
+
+
+
+def parse_range_header(range_header, size):
+    """
+    Parse a single `bytes=` range against a resource of `size` bytes.
+    Returns (start, end) inclusive, None when the header is absent or not a
+    single byte range (serve the whole resource), and raises ValueError when
+    the range cannot be satisfied.
+    """
+    if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+        return None
+    start, _, end = range_header[len('bytes='):].strip().partition('-')
+    try:
+        if not start:
+            # Suffix range: the last N bytes
+            length = int(end)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    except (TypeError, ValueError):
+        return None
+    if start >= size or start > end:
+        raise ValueError(range_header)
+    return start, end
+
+
+def ranged_file_response(request, file_obj, size, content_type, etag=None, cache_control=None, chunk_size=64 * 1024):
+    """
+    Serve an open binary file honouring `Range`, `If-Range` and
+    `If-None-Match`: 206 for a satisfiable range, 416 for an unsatisfiable
+    one, 304 when the client already holds the same ETag.
+    """
+    quoted_etag = f'"{etag}"' if etag else None
+    headers = {'Accept-Ranges': 'bytes'}
+    if quoted_etag:
+        headers['ETag'] = quoted_etag
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+
+    if quoted_etag and quoted_etag in request.headers.get('If-None-Match', ''):
+        file_obj.close()
+        return HttpResponse(status=304, headers=headers)
+
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != quoted_etag:
+        range_header = None
+
+    try:
+        byte_range = parse_range_header(range_header, size)
+    except ValueError:
+        file_obj.close()
+        return HttpResponse(status=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+
+    start, end = byte_range if byte_range else (0, size - 1)
+    length = end - start + 1 if size else 0
+
+    def stream():
+        try:
+            file_obj.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = file_obj.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            file_obj.close()
+
+    response = StreamingHttpResponse(stream(), status=206 if byte_range else 200, content_type=content_type, headers=headers)
+    response['Content-Length'] = str(length)
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
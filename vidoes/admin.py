@@ -4,8 +4,8 @@ from .models import Video, Category, SubCategory
 # Register your models here.
 @admin.register(Video)
 class VideoAdmin(admin.ModelAdmin):
-    list_display = ['title', 'organization', 'category', 'created_at', 'updated_at']
-    list_filter = ['organization', 'category']
+    list_display = ['title', 'organization', 'category', 'processing_status', 'created_at', 'updated_at']
+    list_filter = ['organization', 'category', 'processing_status']
     search_fields = ['title', 'organization', 'category']
 
 
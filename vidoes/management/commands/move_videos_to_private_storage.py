@@ -0,0 +1,44 @@
+import os
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from vidoes.models import Video
+from vidoes.storage import video_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the video files and HLS renditions stored before the private video storage existed "
+        "out of the public media storage. Safe to run again, moved files are skipped"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="List the files without moving them")
+
+    def handle(self, *args, **options):
+        storage = video_storage()
+        if storage is default_storage:
+            self.stdout.write("No separate video storage is configured, nothing to move")
+            return
+
+        moved = 0
+        videos = Video.objects.exclude(video='').exclude(video__isnull=True).values_list('video', 'hls_playlist')
+        for video_name, playlist in videos.iterator(chunk_size=500):
+            names = [video_name]
+            if playlist:
+                directory = os.path.dirname(playlist)
+                try:
+                    _, files = default_storage.listdir(directory)
+                except FileNotFoundError:
+                    files = []
+                names += [f'{directory}/{name}' for name in files]
+            for name in names:
+                if storage.exists(name) or not default_storage.exists(name):
+                    continue
+                self.stdout.write(name)
+                if options['dry_run']:
+                    continue
+                with default_storage.open(name, 'rb') as f:
+                    storage.save(name, f)
+                default_storage.delete(name)
+                moved += 1
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} file(s) to the video storage"))
@@ -0,0 +1,67 @@
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from vidoes import transcoding
+
+
+class Command(BaseCommand):
+    help = (
+        "Package uploaded videos into HLS renditions (360p/720p/1080p) and cut their poster frame and "
+        "preview clip with ffmpeg in a pool of processes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'VIDEO_TRANSCODE_WORKERS', 2), help="Videos transcoded at the same time")
+        parser.add_argument('--poll-interval', type=float, default=5.0, help="Seconds to sleep when there is nothing to transcode")
+        parser.add_argument('--once', action='store_true', help="Transcode everything pending once and exit")
+
+    def handle(self, *args, **options):
+        worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        workers = max(1, options['workers'])
+        self.stdout.write(f"Starting video transcoding worker, {workers} process(es)")
+
+        # Spawned rather than forked so workers open their own database connections
+        context = multiprocessing.get_context('spawn')
+        running = {}
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+                while True:
+                    close_old_connections()
+                    # A long lecture can take longer to package than the claim timeout
+                    transcoding.hold_claims(worker_name, [video.pk for video in running.values()])
+                    # Only claim what the pool can start now, the rest stays claimable by other hosts
+                    if len(running) < workers:
+                        for video in transcoding.claim_videos(worker_name, workers - len(running)):
+                            running[pool.submit(transcoding.transcode_video, video.pk)] = video
+                    if not running:
+                        if options['once']:
+                            return
+                        time.sleep(options['poll_interval'])
+                        continue
+
+                    done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.record(running.pop(future), future, worker_name)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+
+    def record(self, video, future, worker_name):
+        try:
+            result = future.result()
+        except Exception as e:
+            error = str(e) if isinstance(e, transcoding.TranscodeError) else f"{type(e).__name__}: {e}"
+            transcoding.record_result(video, worker_name, error=error)
+            self.stdout.write(self.style.ERROR(f"[{worker_name}] video {video.pk} failed (attempt {video.processing_attempts}): {error}"))
+            return
+        if transcoding.record_result(video, worker_name, result=result):
+            self.stdout.write(self.style.SUCCESS(f"[{worker_name}] video {video.pk} ready: {', '.join(result['renditions'])}"))
+        else:
+            self.stdout.write(f"[{worker_name}] video {video.pk} changed while transcoding, discarded")
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Existing uploads get packaged by the transcode_videos worker as well
+def queue_existing_videos(apps, schema_editor):
+    Video = apps.get_model('vidoes', 'Video')
+    Video.objects.exclude(video='').exclude(video__isnull=True).update(processing_status='pending')
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ICCapp', '0016_richtexteditorimages'),
+        ('vidoes', '0012_alter_video_organization'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='hls_playlist',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='hls_renditions',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='processing_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='processing_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='processing_status',
+            field=models.CharField(choices=[('none', 'No video'), ('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='none', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['processing_status', 'claimed_at'], name='video_processing_idx'),
+        ),
+        migrations.RunPython(queue_existing_videos, migrations.RunPython.noop),
+    ]
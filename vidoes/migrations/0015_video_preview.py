@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+# Packaged videos are processed again for their preview clip (and a poster
+# frame when they have no thumbnail)
+def queue_packaged_videos(apps, schema_editor):
+    Video = apps.get_model('vidoes', 'Video')
+    Video.objects.filter(processing_status='ready').update(processing_status='pending', processing_attempts=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vidoes', '0014_video_thumbnail_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='preview',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='videopreviews/'),
+        ),
+        migrations.RunPython(queue_packaged_videos, migrations.RunPython.noop),
+    ]
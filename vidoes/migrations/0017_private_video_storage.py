@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:42
+
+import vidoes.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vidoes', '0016_trending_score'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='video',
+            name='video',
+            field=models.FileField(blank=True, null=True, storage=vidoes.storage.video_storage, upload_to='videos/'),
+        ),
+    ]
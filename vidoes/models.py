@@ -1,5 +1,6 @@
 from django.db import models
-from ICCapp.models import Organization
+from ICCapp.models import Organization, AbstractTrendingScore
+from .storage import video_storage
 from django.conf import settings
 import uuid
 
@@ -25,11 +26,26 @@ class SubCategory(models.Model):
         verbose_name_plural = 'SubCategories'
 
 class Video(models.Model):
+    # HLS packaging, poster frame and preview clip by `manage.py transcode_videos`
+    # (vidoes/transcoding.py)
+    PROCESSING_STATUS_CHOICES = [
+        ('none', 'No video'),
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
     title = models.CharField(max_length=100)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
-    video = models.FileField(upload_to='videos/', null=True, blank=True)
+    # Paid content, kept private and streamed through vidoes/streaming.py
+    video = models.FileField(upload_to='videos/', storage=video_storage, null=True, blank=True)
     thumbnail = models.ImageField(upload_to='videothumbnails/', null=True, blank=True)
+    # Resized variants of the image (ICCapp/imagevariants.py)
+    thumbnail_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Short muted low-bitrate clip for hover previews, generated with the HLS renditions
+    preview = models.FileField(upload_to='videopreviews/', null=True, blank=True, editable=False)
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True)
     subcategory = models.ForeignKey(SubCategory, on_delete=models.CASCADE, null=True)
@@ -39,22 +55,60 @@ class Video(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     free = models.BooleanField(default=False)
+    processing_status = models.CharField(max_length=20, choices=PROCESSING_STATUS_CHOICES, default='none')
+    processing_error = models.TextField(blank=True)
+    processing_attempts = models.PositiveSmallIntegerField(default=0)
+    # Storage name of the HLS master playlist and the renditions it lists
+    hls_playlist = models.CharField(max_length=255, blank=True)
+    hls_renditions = models.JSONField(default=list, blank=True)
+    claimed_by = models.CharField(max_length=100, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
     
     def __str__(self):
         return self.title
     
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['processing_status', 'claimed_at'], name='video_processing_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored file, to tell a replaced one apart on save
+        instance._loaded_video_name = instance.__dict__.get('video')
+        return instance
 
     # Save the video
     def save(self, *args, **kwargs):
         if not self.video_token:
             self.video_token = self.generate_token()
-        return super().save(*args, **kwargs)
+        # A new or replaced file is (re)packaged, the previous renditions stay
+        # available until the new ones are ready
+        if not self.video:
+            self.processing_status = 'none'
+        elif (
+            self._state.adding
+            or not self.video._committed
+            or getattr(self, '_loaded_video_name', None) not in (None, self.video.name)
+        ):
+            self.processing_status = 'pending'
+            self.processing_error = ''
+            self.processing_attempts = 0
+            self.claimed_at = None
+        super().save(*args, **kwargs)
+        self._loaded_video_name = self.video.name
     
     # Generate a token for the video
     def generate_token(self):
         return uuid.uuid4().hex
-    
 
 
+# Trending score of a bought video (ICCapp/trending.py)
+class VideoTrendingScore(AbstractTrendingScore):
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    def __str__(self):
+        return f'{self.video_id}: {self.score:.3f}'
@@ -1,7 +1,9 @@
 from rest_framework import serializers
 
 from ICCapp.serializers import OrganizationMiniSerializer
+from django.conf import settings
 from .models import *
+from .streaming import hls_path, stream_path
 from utils import *
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -33,27 +35,46 @@ class CreateSubCategorySerializer(serializers.ModelSerializer):
 class VideoSerializer(serializers.ModelSerializer):
     organization = OrganizationMiniSerializer(read_only=True)
     thumbnail = serializers.ImageField(allow_null=True, required=False)
-    video = serializers.FileField(allow_null=True, required=False)
+    # The file is only reachable through the stream endpoint (video_url)
+    video = serializers.FileField(allow_null=True, required=False, write_only=True)
     video_url = serializers.SerializerMethodField()
+    # Adaptive stream (HLS master playlist), null until the video is packaged
+    hls_url = serializers.SerializerMethodField()
+    # Short muted clip for hover previews, null until generated
+    preview_url = serializers.SerializerMethodField()
     video_name = serializers.SerializerMethodField()
     img_url = serializers.SerializerMethodField()
+    img_srcset = serializers.SerializerMethodField()
     img_name = serializers.SerializerMethodField()
     category = CategorySerializer(read_only=True)
     subcategory = SubCategorySerializer(read_only=True)
     
     class Meta:
         model = Video
-        fields = '__all__'
+        exclude = ['hls_playlist', 'claimed_by', 'claimed_at']
         ref_name = "VideoSerializer"
     
     def get_img_url(self, obj):
         return get_full_image_url(obj.thumbnail)
     
+    def get_img_srcset(self, obj):
+        return get_image_srcset(obj.thumbnail, obj.thumbnail_variants)
+    
     def get_img_name(self, obj):
         return get_image_name(obj.thumbnail)
     
     def get_video_url(self, obj):
-        return get_full_image_url(obj.video)
+        if not obj.video:
+            return None
+        return f"{settings.DJANGO_IMAGE_URL}{stream_path(obj)}"
+
+    def get_hls_url(self, obj):
+        if obj.processing_status != 'ready':
+            return None
+        return f"{settings.DJANGO_IMAGE_URL}{hls_path(obj)}"
+    
+    def get_preview_url(self, obj):
+        return get_full_image_url(obj.preview)
     
     def get_video_name(self, obj):
         return get_image_name(obj.video)
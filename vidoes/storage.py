@@ -0,0 +1,13 @@
+from django.core.files.storage import InvalidStorageError, default_storage, storages
+
+
+def video_storage():
+    """
+    Storage of the uploaded video files and their HLS renditions: the
+    "videos" storage when configured (private S3 objects, only readable
+    through presigned URLs), else the default storage.
+    """
+    try:
+        return storages['videos']
+    except InvalidStorageError:
+        return default_storage
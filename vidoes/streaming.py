@@ -0,0 +1,211 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote, urlencode
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.http import HttpResponse, HttpResponseRedirect
+from django.urls import reverse
+from storages.backends.s3 import S3Storage
+from ICCapp.entitlements import owns
+from .storage import video_storage
+from utils import ranged_file_response
+
+# Lifetime (seconds) of signed stream links and presigned S3 URLs
+STREAM_URL_MAX_AGE = getattr(settings, 'VIDEO_STREAM_URL_MAX_AGE', 300)
+# A stream link only starts a stream, the player keeps going on a playback
+# token (seeks, HLS renditions and segments) issued with it for this long
+PLAYBACK_MAX_AGE = getattr(settings, 'VIDEO_STREAM_PLAYBACK_MAX_AGE', 6 * 3600)
+# Hand local files to the front web server instead of reading them in
+# Python: nginx `internal` location mapped to MEDIA_ROOT (X-Accel-Redirect),
+# or Apache/lighttpd mod_xsendfile (X-Sendfile)
+ACCEL_REDIRECT_PREFIX = getattr(settings, 'VIDEO_STREAM_ACCEL_REDIRECT_PREFIX', '')
+USE_SENDFILE = getattr(settings, 'VIDEO_STREAM_SENDFILE', False)
+STREAM_CACHE_CONTROL = 'private, max-age=3600'
+SIGNING_SALT = 'vidoes.stream'
+PLAYBACK_SALT = 'vidoes.playback'
+# Files of a packaged video: playlists and segments, no directories
+HLS_FILE_RE = re.compile(r'^[\w-]+\.(m3u8|ts)$')
+HLS_CONTENT_TYPES = {'m3u8': 'application/vnd.apple.mpegurl', 'ts': 'video/mp2t'}
+MASTER_PLAYLIST = 'master.m3u8'
+
+
+# --------------------------------------------------------------------------
+# Entitlement
+# --------------------------------------------------------------------------
+def is_entitled(user, video):
+    """Free videos stream for everyone, paid ones for staff and the users who bought them."""
+    if video.free:
+        return True
+    if user is None or not user.is_authenticated:
+        return False
+    if user.is_staff:
+        return True
+    return owns(user.pk, 'video', video.pk)
+
+
+# --------------------------------------------------------------------------
+# Signed stream links (a <video> element cannot send the JWT header)
+# --------------------------------------------------------------------------
+def sign_stream(video, user, salt=SIGNING_SALT):
+    return signing.TimestampSigner(salt=salt).sign(f'{video.video_token}:{user.pk}')
+
+
+def sign_playback(video, user):
+    """A playback token: what a stream link turns into once the stream started."""
+    return sign_stream(video, user, PLAYBACK_SALT)
+
+
+def signed_stream_user_id(video, signature, salt=SIGNING_SALT, max_age=STREAM_URL_MAX_AGE):
+    """The id of the user a stream link was signed for, or None when it is invalid, expired or for another video."""
+    try:
+        value = signing.TimestampSigner(salt=salt).unsign(signature, max_age=max_age)
+    except signing.BadSignature:
+        return None
+    video_token, _, user_id = value.rpartition(':')
+    if video_token != video.video_token or not user_id.isdigit():
+        return None
+    return int(user_id)
+
+
+def stream_user(request, video, signature=None, playback=False):
+    """
+    The user a stream request is for: the signer of a stream link, else the
+    JWT user. With `playback` the signature must be a playback token, valid
+    for PLAYBACK_MAX_AGE; a stream link is not, whatever the request asks for.
+    """
+    if signature and not video.free:
+        if playback:
+            user_id = signed_stream_user_id(video, signature, PLAYBACK_SALT, PLAYBACK_MAX_AGE)
+        else:
+            user_id = signed_stream_user_id(video, signature)
+        return get_user_model().objects.filter(pk=user_id).first() if user_id else None
+    return request.user
+
+
+def is_hls_playback(name):
+    """Rendition playlists and segments are requested with the playback token of the master playlist."""
+    return name != MASTER_PLAYLIST
+
+
+def stream_path(video):
+    return reverse('stream_video', args=[video.video_token])
+
+
+def playback_redirect(video, user):
+    """
+    Send a player that starts a stream with a link on to the playback URL,
+    media elements keep requesting the URL they were redirected to.
+    """
+    response = HttpResponseRedirect(f"{stream_path(video)}?{urlencode({'playback': sign_playback(video, user)})}")
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+
+def hls_path(video, signature=None):
+    """
+    Path of the master playlist. Players resolve the rendition playlists and
+    segments relative to it, so a signature is part of the path rather than
+    the query string.
+    """
+    if signature:
+        return reverse('stream_video_hls_signed', args=[video.video_token, signature, MASTER_PLAYLIST])
+    return reverse('stream_video_hls', args=[video.video_token, MASTER_PLAYLIST])
+
+
+# --------------------------------------------------------------------------
+# Streaming the file
+# --------------------------------------------------------------------------
+def stream_response(request, video):
+    return storage_file_response(request, video.video.name, video.video_token)
+
+
+def presigned_url(storage, name, content_type):
+    """
+    A URL of a private S3 object expiring after STREAM_URL_MAX_AGE. Signed
+    by the S3 client itself: with a custom domain and no CloudFront signer,
+    the storage's url() is the plain public URL whatever `expire` says.
+    """
+    return storage.connection.meta.client.generate_presigned_url(
+        'get_object',
+        Params={
+            'Bucket': storage.bucket_name,
+            'Key': storage._normalize_name(name),
+            'ResponseContentType': content_type,
+        },
+        ExpiresIn=STREAM_URL_MAX_AGE,
+    )
+
+
+def storage_file_response(request, name, etag_key, content_type=None):
+    """
+    Serve a file of the video storage without pushing it through Python
+    where possible: a redirect to a short-lived presigned URL for S3 (which
+    answers Range itself), X-Accel-Redirect/X-Sendfile when configured, and
+    otherwise a ranged response (206 for Range requests).
+    """
+    storage = video_storage()
+    content_type = content_type or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        path = None
+
+    if path is None:
+        if isinstance(storage, S3Storage):
+            url = presigned_url(storage, name, content_type)
+        else:
+            url = storage.url(name)
+        response = HttpResponseRedirect(url)
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
+    if ACCEL_REDIRECT_PREFIX or USE_SENDFILE:
+        # The web server handles Range, the body stays empty here
+        response = HttpResponse(content_type=content_type)
+        if ACCEL_REDIRECT_PREFIX:
+            response['X-Accel-Redirect'] = f"{ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(name)}"
+        else:
+            response['X-Sendfile'] = path
+        response['Cache-Control'] = STREAM_CACHE_CONTROL
+        return response
+
+    stat = os.stat(path)
+    return ranged_file_response(
+        request,
+        open(path, 'rb'),
+        stat.st_size,
+        content_type,
+        etag=f'{etag_key}-{int(stat.st_mtime)}-{stat.st_size}',
+        cache_control=STREAM_CACHE_CONTROL,
+    )
+
+
+def hls_response(request, video, name, playback=None):
+    """
+    Serve a file of the packaged video. Playlists are always answered here,
+    a redirect would make the player resolve the segments against the
+    presigned URL; segments are served like the video file. With a
+    `playback` token the master playlist points the player at the renditions
+    under it, and their segments resolve there too.
+    """
+    match = HLS_FILE_RE.match(name)
+    if not match or not video.hls_playlist:
+        raise FileNotFoundError(name)
+    storage_name = f'{os.path.dirname(video.hls_playlist)}/{name}'
+    content_type = HLS_CONTENT_TYPES[match.group(1)]
+    if match.group(1) == 'ts':
+        return storage_file_response(request, storage_name, video.video_token, content_type)
+
+    with video_storage().open(storage_name, 'rb') as playlist:
+        content = playlist.read()
+    if playback and name == MASTER_PLAYLIST:
+        content = b'\n'.join(
+            reverse('stream_video_hls_signed', args=[video.video_token, playback, line.decode()]).encode()
+            if HLS_FILE_RE.match(line.decode()) else line
+            for line in content.split(b'\n')
+        )
+    response = HttpResponse(content, content_type=content_type)
+    response['Cache-Control'] = STREAM_CACHE_CONTROL
+    return response
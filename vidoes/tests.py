@@ -1,3 +1,333 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from storages.backends.s3 import S3Storage
+from ICCapp.testing import ListingQueryTestCase
+from . import streaming, transcoding
+from .models import Category, SubCategory, Video, VideoTrendingScore
+from .serializers import VideoSerializer
 
-# Create your tests here.
+
+class VideoListingQueryTests(ListingQueryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        category = Category.objects.create(category='Lessons')
+        subcategory = SubCategory.objects.create(category=category, subcategory='Maths')
+        cls.create_catalog(Video, VideoTrendingScore, category, subcategory, lambda i: {'title': f'Video {i}', 'description': ''})
+
+    def test_videos_page_runs_a_fixed_number_of_queries(self):
+        # organization check, count, page (organization, category, subcategory
+        # and its category joined), buyers prefetch
+        results = self.assertListing(
+            f'/vidoesapi/videos/{self.organization.pk}/', 4, VideoSerializer,
+            Video.objects.filter(organization=self.organization).order_by('-updated_at'),
+        )
+        self.assertEqual(results[0]['subcategory']['category']['category'], 'Lessons')
+        self.assertEqual(len(results[0]['userIDs_that_bought_this_video']), 2)
+
+    def test_trending_videos_page_runs_a_fixed_number_of_queries(self):
+        results = self.assertListing(
+            f'/vidoesapi/trendingvideos/{self.organization.pk}/', 4, VideoSerializer,
+            Video.objects.filter(trending__organization=self.organization).order_by('-trending__score', '-updated_at'),
+        )
+        self.assertEqual([v['title'] for v in results][:2], ['Video 11', 'Video 10'])
+
+    def test_bought_videos_page_runs_a_fixed_number_of_queries(self):
+        # plus the user check
+        self.assertListing(
+            f'/vidoesapi/userboughtvideos/{self.organization.pk}/{self.buyer.pk}/', 5, VideoSerializer,
+            Video.objects.filter(organization=self.organization, userIDs_that_bought_this_video=self.buyer).order_by('-updated_at'),
+        )
+
+
+class VideoStreamTests(TestCase):
+    CONTENT = bytes(range(256)) * 4
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Entitlements are cached per user id and test transactions never commit
+        cache.clear()
+
+        users = get_user_model().objects
+        self.buyer = users.create_user(username='buyer', email='buyer@example.com', password='x')
+        self.stranger = users.create_user(username='stranger', email='stranger@example.com', password='x')
+        self.video = Video(title='Lesson', description='', price=10)
+        self.video.video.save('lesson.mp4', ContentFile(self.CONTENT), save=False)
+        self.video.save()
+        self.video.userIDs_that_bought_this_video.add(self.buyer)
+
+        directory = f'videos/hls/{self.video.video_token}/run'
+        default_storage.save(f'{directory}/master.m3u8', ContentFile(b'#EXTM3U\n360p.m3u8\n'))
+        default_storage.save(f'{directory}/360p.m3u8', ContentFile(b'#EXTM3U\n360p_000.ts\n'))
+        default_storage.save(f'{directory}/360p_000.ts', ContentFile(b'segment'))
+        Video.objects.filter(pk=self.video.pk).update(processing_status='ready', hls_playlist=f'{directory}/master.m3u8')
+        self.client = APIClient()
+
+    def stream_link(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get(f'/vidoesapi/video_stream_url/{self.video.video_token}/')
+        self.client.force_authenticate(None)
+        return response
+
+    def get(self, url, **headers):
+        response = self.client.get(url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def later(self, seconds):
+        return mock.patch('django.core.signing.time.time', return_value=time.time() + seconds)
+
+    def playback_url(self):
+        response = self.get(self.stream_link(self.buyer).data['url'])[0]
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('?playback=', response['Location'])
+        return response['Location']
+
+    def test_full_range_and_unsatisfiable_requests(self):
+        url = self.playback_url()
+
+        response, body = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.CONTENT)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response, body = self.get(url, Range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.CONTENT)}')
+        self.assertEqual(body, self.CONTENT[10:20])
+
+        response, _ = self.get(url, Range='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.CONTENT)}')
+
+    def test_matching_etag_returns_304(self):
+        url = self.playback_url()
+        etag = self.get(url)[0]['ETag']
+        response, body = self.get(url, If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(body, b'')
+
+    def test_only_entitled_users_get_a_stream(self):
+        self.assertEqual(self.stream_link(self.stranger).status_code, 403)
+        self.assertEqual(self.get(f'/vidoesapi/stream/{self.video.video_token}/')[0].status_code, 403)
+        signature = streaming.sign_stream(self.video, self.stranger)
+        response, _ = self.get(f'/vidoesapi/stream/{self.video.video_token}/?signature={signature}')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.get(f'/vidoesapi/stream/{self.video.video_token}/')[0].status_code, 200)
+
+    def test_expired_link_no_longer_starts_a_stream(self):
+        url = self.stream_link(self.buyer).data['url']
+        with self.later(streaming.STREAM_URL_MAX_AGE + 1):
+            for byte_range in (None, 'bytes=0-99', 'bytes=1-', 'bytes=500-'):
+                with self.subTest(range=byte_range):
+                    headers = {'Range': byte_range} if byte_range else {}
+                    self.assertEqual(self.get(url, **headers)[0].status_code, 403)
+
+    def test_link_is_not_a_playback_token(self):
+        signature = parse_qs(urlparse(self.stream_link(self.buyer).data['url']).query)['signature'][0]
+        response, _ = self.get(f'/vidoesapi/stream/{self.video.video_token}/?playback={signature}', Range='bytes=500-')
+        self.assertEqual(response.status_code, 403)
+
+    def test_started_stream_keeps_playing_after_the_link_expires(self):
+        url = self.playback_url()
+        with self.later(streaming.STREAM_URL_MAX_AGE + 1):
+            response, body = self.get(url, Range='bytes=500-')
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(body, self.CONTENT[500:])
+        with self.later(streaming.PLAYBACK_MAX_AGE + 1):
+            self.assertEqual(self.get(url, Range='bytes=500-')[0].status_code, 403)
+
+    def test_hls_renditions_play_on_the_token_of_the_master_playlist(self):
+        master = self.stream_link(self.buyer).data['hls_url']
+        response, body = self.get(master)
+        self.assertEqual(response.status_code, 200)
+        header, rendition = body.decode().split()
+        self.assertEqual(header, '#EXTM3U')
+        self.assertNotIn(urlparse(master).path.split('/')[-2], rendition)
+        segment = rendition.replace('360p.m3u8', '360p_000.ts')
+        with self.later(streaming.STREAM_URL_MAX_AGE + 1):
+            self.assertEqual(self.get(master)[0].status_code, 403)
+            self.assertEqual(self.get(rendition), (mock.ANY, b'#EXTM3U\n360p_000.ts\n'))
+            self.assertEqual(self.get(segment), (mock.ANY, b'segment'))
+        with self.later(streaming.PLAYBACK_MAX_AGE + 1):
+            self.assertEqual(self.get(segment)[0].status_code, 403)
+
+    def test_link_does_not_open_renditions_or_segments(self):
+        master = self.stream_link(self.buyer).data['hls_url']
+        for name in ('360p.m3u8', '360p_000.ts'):
+            with self.subTest(name=name):
+                self.assertEqual(self.get(master.replace('master.m3u8', name))[0].status_code, 403)
+                with self.later(streaming.STREAM_URL_MAX_AGE + 1):
+                    self.assertEqual(self.get(master.replace('master.m3u8', name))[0].status_code, 403)
+
+    def test_s3_files_redirect_to_a_presigned_url(self):
+        storage = S3Storage(
+            bucket_name='bucket', access_key='key', secret_key='secret', region_name='us-east-1',
+            location='private', custom_domain='bucket.s3.amazonaws.com', signature_version='s3v4',
+        )
+        request = RequestFactory().get('/')
+        with mock.patch('vidoes.streaming.video_storage', return_value=storage):
+            response = streaming.storage_file_response(request, 'videos/lesson.mp4', 'token')
+        self.assertEqual(response.status_code, 302)
+        url = urlparse(response['Location'])
+        query = parse_qs(url.query)
+        self.assertEqual(url.path, '/private/videos/lesson.mp4')
+        self.assertEqual(query['X-Amz-Expires'], [str(streaming.STREAM_URL_MAX_AGE)])
+        self.assertIn('X-Amz-Signature', query)
+        self.assertEqual(query['response-content-type'], ['video/mp4'])
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+
+
+def fake_run(command):
+    """Stand-in for ffprobe and ffmpeg: a 1920x1080 minute-long source, every output written."""
+    if command[0] == transcoding.FFPROBE:
+        data = {'streams': [{'width': 1920, 'height': 1080}], 'format': {'duration': '60.0'}}
+        return subprocess.CompletedProcess(command, 0, stdout=json.dumps(data), stderr='')
+    output = command[-1]
+    with open(output, 'wb') as f:
+        f.write(b'output')
+    if output.endswith('.m3u8'):
+        with open(output.replace('.m3u8', '_0000.ts'), 'wb') as f:
+            f.write(b'segment')
+    return subprocess.CompletedProcess(command, 0, stdout='', stderr='')
+
+
+class VideoTranscodingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.video = Video(title='Lecture', description='')
+        self.video.video.save('lecture.mp4', ContentFile(b'source'), save=False)
+        self.video.save()
+
+    def files(self, directory):
+        root = os.path.join(self.media_root, directory)
+        return sorted(os.path.relpath(os.path.join(path, name), root) for path, _, names in os.walk(root) for name in names)
+
+    def transcode(self, run=fake_run):
+        with mock.patch.object(transcoding, 'run', side_effect=run):
+            return transcoding.transcode_video(self.video.pk)
+
+    def test_renditions_are_never_upscaled(self):
+        names = lambda height: [r[0] for r in transcoding.renditions_for(height)]
+        self.assertEqual(names(240), ['360p'])
+        self.assertEqual(names(720), ['360p', '720p'])
+        self.assertEqual(names(1080), ['360p', '720p', '1080p'])
+        self.assertEqual(names(2160), ['360p', '720p', '1080p'])
+
+    def test_master_playlist_lists_each_rendition(self):
+        self.assertEqual(transcoding.master_playlist(transcoding.renditions_for(720), 1280, 720), (
+            '#EXTM3U\n'
+            '#EXT-X-VERSION:3\n'
+            '#EXT-X-STREAM-INF:BANDWIDTH=896000,RESOLUTION=640x360\n'
+            '360p.m3u8\n'
+            '#EXT-X-STREAM-INF:BANDWIDTH=2928000,RESOLUTION=1280x720\n'
+            '720p.m3u8\n'
+        ))
+
+    def test_transcoded_video_is_recorded(self):
+        self.assertEqual(transcoding.claim_videos('worker', 10), [self.video])
+        result = self.transcode()
+        self.assertEqual(result['renditions'], ['360p', '720p', '1080p'])
+        directory = os.path.dirname(result['playlist'])
+        self.assertEqual(self.files(directory), [
+            '1080p.m3u8', '1080p_0000.ts', '360p.m3u8', '360p_0000.ts', '720p.m3u8', '720p_0000.ts', 'master.m3u8',
+        ])
+        with default_storage.open(result['playlist']) as master:
+            self.assertIn(b'RESOLUTION=1920x1080', master.read())
+
+        self.assertTrue(transcoding.record_result(self.video, 'worker', result=result))
+        video = Video.objects.get(pk=self.video.pk)
+        self.assertEqual((video.processing_status, video.hls_playlist, video.claimed_by), ('ready', result['playlist'], ''))
+        self.assertEqual(video.hls_renditions, ['360p', '720p', '1080p'])
+        self.assertEqual((video.preview.name, video.thumbnail.name), (result['preview'], result['poster']))
+
+        # A second run replaces the files of the first one
+        Video.objects.filter(pk=self.video.pk).update(processing_status='pending', claimed_at=None)
+        transcoding.claim_videos('worker', 10)
+        second = self.transcode()
+        self.assertTrue(transcoding.record_result(self.video, 'worker', result=second))
+        self.assertEqual(self.files(directory), [])
+        self.assertEqual(self.files(transcoding.PREVIEW_ROOT), [os.path.basename(second['preview'])])
+        self.assertEqual(self.files(transcoding.POSTER_ROOT), [os.path.basename(second['poster'])])
+
+    def test_result_of_a_replaced_file_is_discarded(self):
+        transcoding.claim_videos('worker', 10)
+        result = self.transcode()
+        self.video.video.save('other.mp4', ContentFile(b'other'))
+
+        self.assertFalse(transcoding.record_result(self.video, 'worker', result=result))
+        self.assertEqual(Video.objects.get(pk=self.video.pk).processing_status, 'pending')
+        for directory in (transcoding.HLS_ROOT, transcoding.PREVIEW_ROOT, transcoding.POSTER_ROOT):
+            self.assertEqual(self.files(directory), [])
+
+    def test_failed_rendition_leaves_no_files(self):
+        def failing_run(command):
+            if command[-1].endswith('720p.m3u8'):
+                raise transcoding.TranscodeError('encoder crashed')
+            return fake_run(command)
+
+        with self.assertRaises(transcoding.TranscodeError):
+            self.transcode(failing_run)
+        for directory in (transcoding.HLS_ROOT, transcoding.PREVIEW_ROOT, transcoding.POSTER_ROOT):
+            self.assertEqual(self.files(directory), [])
+
+    def test_failed_upload_removes_what_it_saved(self):
+        save_file = transcoding.save_file
+
+        def failing_save(name, path, *args):
+            if name.startswith(transcoding.POSTER_ROOT):
+                raise OSError('storage unavailable')
+            return save_file(name, path, *args)
+
+        with mock.patch.object(transcoding, 'save_file', failing_save), self.assertRaises(OSError):
+            self.transcode()
+        for directory in (transcoding.HLS_ROOT, transcoding.PREVIEW_ROOT, transcoding.POSTER_ROOT):
+            self.assertEqual(self.files(directory), [])
+
+    def test_failures_are_retried_after_a_delay_then_given_up(self):
+        for attempt in range(1, transcoding.MAX_ATTEMPTS + 1):
+            [video] = transcoding.claim_videos('worker', 10)
+            self.assertEqual(video.processing_attempts, attempt)
+            self.assertTrue(transcoding.record_result(video, 'worker', error='encoder crashed'))
+            # Not before RETRY_DELAY
+            self.assertEqual(transcoding.claim_videos('worker', 10), [])
+            Video.objects.filter(pk=video.pk).update(claimed_at=timezone.now() - transcoding.RETRY_DELAY - timedelta(seconds=1))
+        video = Video.objects.get(pk=self.video.pk)
+        self.assertEqual((video.processing_status, video.processing_error), ('failed', 'encoder crashed'))
+        self.assertEqual(transcoding.claim_videos('worker', 10), [])
+
+    def test_held_claims_are_not_taken_over(self):
+        transcoding.claim_videos('worker', 10)
+        expired = timezone.now() - transcoding.CLAIM_TIMEOUT - timedelta(seconds=1)
+        Video.objects.filter(pk=self.video.pk).update(claimed_at=expired)
+        self.assertEqual(transcoding.hold_claims('worker', [self.video.pk]), 1)
+        self.assertEqual(transcoding.claim_videos('other-worker', 10), [])
+
+        # A worker that stopped refreshing loses the video
+        Video.objects.filter(pk=self.video.pk).update(claimed_at=expired)
+        self.assertEqual(transcoding.claim_videos('other-worker', 10), [self.video])
+        self.assertEqual(transcoding.hold_claims('worker', [self.video.pk]), 0)
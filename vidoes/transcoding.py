@@ -0,0 +1,282 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+from django.utils import timezone
+from ICCapp.imagevariants import queue_variants
+from .models import Video
+from .storage import video_storage
+from utils import claim_batch, refresh_claim
+
+FFMPEG = getattr(settings, 'VIDEO_FFMPEG_BINARY', 'ffmpeg')
+FFPROBE = getattr(settings, 'VIDEO_FFPROBE_BINARY', 'ffprobe')
+SEGMENT_SECONDS = getattr(settings, 'VIDEO_HLS_SEGMENT_SECONDS', 6)
+MAX_ATTEMPTS = getattr(settings, 'VIDEO_TRANSCODE_MAX_ATTEMPTS', 3)
+# The worker refreshes the claims of its running videos every poll, one
+# that has not for this long is presumed dead
+CLAIM_TIMEOUT = timedelta(minutes=10)
+# Delay before a failed video is attempted again
+RETRY_DELAY = timedelta(minutes=5)
+PREVIEW_SECONDS = getattr(settings, 'VIDEO_PREVIEW_SECONDS', 6)
+HLS_ROOT = 'videos/hls'
+MASTER_PLAYLIST = 'master.m3u8'
+# Generated posters live here, a thumbnail elsewhere was uploaded and is kept
+POSTER_ROOT = 'videothumbnails/posters/'
+PREVIEW_ROOT = 'videopreviews/'
+
+# name, height, video bitrate, audio bitrate (kbit/s)
+RENDITIONS = (
+    ('360p', 360, 800, 96),
+    ('720p', 720, 2800, 128),
+    ('1080p', 1080, 5000, 192),
+)
+
+
+class TranscodeError(Exception):
+    pass
+
+
+# --------------------------------------------------------------------------
+# Claiming and recording (transcode_videos worker process)
+# --------------------------------------------------------------------------
+def claim_videos(worker_name, batch_size):
+    now = timezone.now()
+    # A failed attempt leaves its claimed_at behind, the retry waits RETRY_DELAY after it
+    claimable = (
+        Q(processing_status='pending', claimed_at__isnull=True)
+        | Q(processing_status='pending', claimed_at__lt=now - RETRY_DELAY)
+        | Q(processing_status='processing', claimed_at__lt=now - CLAIM_TIMEOUT)
+    )
+    return claim_batch(
+        Video.objects.filter(claimable),
+        worker_name,
+        batch_size,
+        processing_status='processing',
+        processing_attempts=F('processing_attempts') + 1,
+    )
+
+
+def hold_claims(worker_name, video_ids):
+    """Refresh the claims of the videos a worker is transcoding, however long they take."""
+    return refresh_claim(Video.objects.filter(processing_status='processing'), worker_name, video_ids)
+
+
+def record_result(video, worker_name, result=None, error=''):
+    """
+    Store the outcome of a claimed video. The update only applies while the
+    claim holds, so a file replaced during transcoding is processed again
+    instead of getting the renditions of the previous file. A generated
+    poster only replaces an empty or generated thumbnail.
+    """
+    claim = Video.objects.filter(pk=video.pk, processing_status='processing', claimed_by=worker_name)
+    if result:
+        previous = Video.objects.filter(pk=video.pk).values('hls_playlist', 'preview', 'thumbnail').first() or {}
+        if not claim.update(
+            processing_status='ready', processing_error='', hls_playlist=result['playlist'],
+            hls_renditions=result['renditions'], preview=result['preview'], claimed_by='', claimed_at=None,
+        ):
+            delete_renditions(result['playlist'])
+            delete_files(result['preview'], result['poster'])
+            return False
+        if previous.get('hls_playlist') and previous['hls_playlist'] != result['playlist']:
+            delete_renditions(previous['hls_playlist'])
+        if previous.get('preview') != result['preview']:
+            delete_files(previous.get('preview'))
+        if result['poster']:
+            record_poster(video, result['poster'], previous.get('thumbnail'))
+        return True
+
+    retry = video.processing_attempts < MAX_ATTEMPTS
+    return bool(claim.update(
+        processing_status='pending' if retry else 'failed',
+        processing_error=error[-2000:], claimed_by='', claimed_at=timezone.now(),
+    ))
+
+
+def record_poster(video, poster, previous):
+    no_uploaded_thumbnail = Q(thumbnail='') | Q(thumbnail__isnull=True) | Q(thumbnail__startswith=POSTER_ROOT)
+    if not Video.objects.filter(no_uploaded_thumbnail, pk=video.pk).update(thumbnail=poster):
+        delete_files(poster)
+        return
+    if previous and previous != poster and previous.startswith(POSTER_ROOT):
+        delete_files(previous)
+    # update() skips post_save, queue the resized variants of the new thumbnail here
+    queue_variants(Video.objects.get(pk=video.pk), 'thumbnail')
+
+
+def delete_files(*names):
+    for name in names:
+        if name:
+            default_storage.delete(name)
+
+
+def delete_renditions(playlist):
+    """Delete a packaged directory (the master playlist's directory) from the video storage."""
+    storage = video_storage()
+    directory = os.path.dirname(playlist)
+    try:
+        _, files = storage.listdir(directory)
+    except (FileNotFoundError, NotImplementedError):
+        return
+    for name in files:
+        storage.delete(f'{directory}/{name}')
+
+
+# --------------------------------------------------------------------------
+# Packaging (runs in the pool processes)
+# --------------------------------------------------------------------------
+def probe(path):
+    """(width, height, duration in seconds) of the first video stream of a file."""
+    result = run([
+        FFPROBE, '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height:format=duration', '-of', 'json', path,
+    ])
+    data = json.loads(result.stdout or '{}')
+    streams = data.get('streams') or []
+    if not streams:
+        raise TranscodeError('No video stream found')
+    duration = float((data.get('format') or {}).get('duration') or 0)
+    return int(streams[0]['width']), int(streams[0]['height']), duration
+
+
+def renditions_for(height):
+    """The renditions a source of this height is packaged into (never upscaled, at least the lowest)."""
+    return [r for r in RENDITIONS if r[1] <= height] or [RENDITIONS[0]]
+
+
+def rendition_command(source, output_dir, rendition):
+    name, height, video_kbps, audio_kbps = rendition
+    return [
+        FFMPEG, '-y', '-v', 'error', '-i', source,
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-vf', f'scale=-2:{height}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main',
+        '-b:v', f'{video_kbps}k', '-maxrate', f'{video_kbps * 107 // 100}k', '-bufsize', f'{video_kbps * 3 // 2}k',
+        # Keyframes on segment boundaries so players can switch renditions between segments
+        '-force_key_frames', f'expr:gte(t,n_forced*{SEGMENT_SECONDS})', '-sc_threshold', '0',
+        '-c:a', 'aac', '-b:a', f'{audio_kbps}k', '-ac', '2',
+        '-f', 'hls', '-hls_time', str(SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(output_dir, f'{name}_%04d.ts'),
+        os.path.join(output_dir, f'{name}.m3u8'),
+    ]
+
+
+def poster_command(source, output, duration):
+    # The thumbnail filter keeps the most representative of the 100 frames
+    # from a tenth into the video, past intros and fade-ins
+    return [
+        FFMPEG, '-y', '-v', 'error', '-ss', f'{duration / 10:.2f}', '-i', source,
+        '-vf', "thumbnail=100,scale=-2:'min(720,ih)'", '-frames:v', '1', '-q:v', '3',
+        output,
+    ]
+
+
+def preview_command(source, output, duration):
+    start = duration / 4 if duration > PREVIEW_SECONDS * 2 else 0
+    return [
+        FFMPEG, '-y', '-v', 'error', '-ss', f'{start:.2f}', '-i', source, '-t', str(PREVIEW_SECONDS),
+        '-an', '-vf', "scale=-2:'min(360,ih)'",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main', '-pix_fmt', 'yuv420p',
+        '-b:v', '300k', '-maxrate', '400k', '-bufsize', '600k',
+        # moov atom first so a hover preview starts before it is fully downloaded
+        '-movflags', '+faststart',
+        output,
+    ]
+
+
+def master_playlist(renditions, width, height):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for name, rendition_height, video_kbps, audio_kbps in renditions:
+        rendition_width = round(width * rendition_height / height / 2) * 2
+        lines.append(
+            f'#EXT-X-STREAM-INF:BANDWIDTH={(video_kbps + audio_kbps) * 1000},'
+            f'RESOLUTION={rendition_width}x{rendition_height}'
+        )
+        lines.append(f'{name}.m3u8')
+    return '\n'.join(lines) + '\n'
+
+
+def run(command):
+    try:
+        return subprocess.run(command, capture_output=True, text=True, check=True)
+    except FileNotFoundError:
+        raise TranscodeError(f'{command[0]} is not installed')
+    except subprocess.CalledProcessError as e:
+        raise TranscodeError((e.stderr or str(e)).strip()[-2000:])
+
+
+def local_source(field, workdir):
+    """A local path of the uploaded file, downloaded first when the storage is remote (S3)."""
+    try:
+        return field.storage.path(field.name)
+    except NotImplementedError:
+        path = os.path.join(workdir, 'source' + os.path.splitext(field.name)[1])
+        with field.storage.open(field.name, 'rb') as remote, open(path, 'wb') as local:
+            shutil.copyfileobj(remote, local, 1024 * 1024)
+        return path
+
+
+def transcode_video(video_id):
+    """
+    Package a video into HLS renditions and a master playlist, uploaded to a
+    fresh directory of the video storage, and cut its preview clip and (without
+    an uploaded thumbnail) its poster frame. Returns {'playlist',
+    'renditions', 'preview', 'poster'} with storage names; raises
+    TranscodeError.
+    """
+    video = Video.objects.get(pk=video_id)
+    if not video.video:
+        raise TranscodeError('The video has no file')
+    # Fresh names, the files of the previous run stay in use until this one is recorded
+    suffix = uuid.uuid4().hex[:12]
+    with tempfile.TemporaryDirectory(prefix='hls-') as workdir:
+        source = local_source(video.video, workdir)
+        width, height, duration = probe(source)
+
+        poster_path = None
+        if not video.thumbnail or video.thumbnail.name.startswith(POSTER_ROOT):
+            poster_path = os.path.join(workdir, 'poster.jpg')
+            run(poster_command(source, poster_path, duration))
+        preview_path = os.path.join(workdir, 'preview.mp4')
+        run(preview_command(source, preview_path, duration))
+
+        renditions = renditions_for(height)
+        output_dir = os.path.join(workdir, 'hls')
+        os.mkdir(output_dir)
+        for rendition in renditions:
+            run(rendition_command(source, output_dir, rendition))
+        with open(os.path.join(output_dir, MASTER_PLAYLIST), 'w') as master:
+            master.write(master_playlist(renditions, width, height))
+
+        # Nothing is uploaded before every file is built, and a failed upload
+        # removes what it saved so retries leave no copies behind
+        directory = f'{HLS_ROOT}/{video.video_token}/{suffix}'
+        poster = preview = None
+        try:
+            for name in sorted(os.listdir(output_dir)):
+                save_file(f'{directory}/{name}', os.path.join(output_dir, name), video_storage())
+            preview = save_file(f'{PREVIEW_ROOT}{video.video_token}_{suffix}.mp4', preview_path)
+            if poster_path:
+                poster = save_file(f'{POSTER_ROOT}{video.video_token}_{suffix}.jpg', poster_path)
+        except Exception:
+            delete_renditions(f'{directory}/{MASTER_PLAYLIST}')
+            delete_files(preview, poster)
+            raise
+    return {
+        'playlist': f'{directory}/{MASTER_PLAYLIST}',
+        'renditions': [r[0] for r in renditions],
+        'preview': preview,
+        'poster': poster,
+    }
+
+
+def save_file(name, path, storage=default_storage):
+    with open(path, 'rb') as f:
+        return storage.save(name, File(f))
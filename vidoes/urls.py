@@ -9,6 +9,10 @@ urlpatterns = [
     path('userboughtvideos/<int:organization_id>/<int:user_id>/', get_user_videos, name='get_user_videos'),
     path('video/<int:video_id>/', get_video, name='get_video'),
     path('video_by_token/<str:videotoken>/', get_video_token, name='get_comments'),
+    path('video_stream_url/<str:videotoken>/', get_video_stream_url, name='get_video_stream_url'),
+    path('stream/<str:videotoken>/', stream_video, name='stream_video'),
+    path('hls/<str:videotoken>/<str:name>', stream_video_hls, name='stream_video_hls'),
+    path('hls/<str:videotoken>/signed/<str:signature>/<str:name>', stream_video_hls, name='stream_video_hls_signed'),
     path('add_video/<int:organization_id>/', add_video, name='add_video'),
     path('update_video/<int:video_id>/', update_video, name='update_video'),
     path('delete_video/<int:video_id>/', delete_video, name='delete_video'),
@@ -9,9 +9,13 @@ from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
-from utils import normalize_img_field, parse_json_fields
+from utils import normalize_img_field, parse_json_fields, plan_queryset
+from ..streaming import (
+    STREAM_URL_MAX_AGE, hls_path, hls_response, is_entitled, is_hls_playback, playback_redirect, sign_playback,
+    sign_stream, stream_path, stream_response, stream_user,
+)
+from urllib.parse import urlencode
 import json
-from django.db.models import Count
 from django.http import QueryDict
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
@@ -71,7 +75,7 @@ def get_videos(request, organization_id):
             videos = Video.objects.filter(organization=organization_id).order_by('-updated_at')
         
         paginator = VideoPagination()
-        result_page = paginator.paginate_queryset(videos, request)
+        result_page = paginator.paginate_queryset(plan_queryset(videos, VideoSerializer), request)
         serializer = VideoSerializer(result_page, many=True)
         return paginator.get_paginated_response(serializer.data)
     except Exception as e:
@@ -83,7 +87,7 @@ def get_videos(request, organization_id):
 # --------------------------------------------------------------------------
 @swagger_auto_schema(
     method='get',
-    operation_description="Get trending videos for an organization, sorted by number of watchers",
+    operation_description="Get trending videos for an organization, sorted by recent purchases (older purchases count for less)",
     manual_parameters=[
         openapi.Parameter('category', openapi.IN_QUERY, description="Category name filter", type=openapi.TYPE_STRING),
         openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
@@ -116,25 +120,17 @@ def get_trendingvideos(request, organization_id):
             try:
                 video_category = Category.objects.get(category=category)
                 videos = Video.objects.filter(
-                    organization=organization_id, category=video_category
-                ).annotate(
-                    watchers_count=Count('userIDs_that_bought_this_video')
-                ).filter(
-                    watchers_count__gt=0
-                ).order_by('-watchers_count', '-updated_at')
+                    trending__organization=organization_id, trending__category=video_category
+                ).order_by('-trending__score', '-updated_at')
             except Category.DoesNotExist:
                 return Response({'error': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
         else:
             videos = Video.objects.filter(
-                organization=organization_id
-            ).annotate(
-                watchers_count=Count('userIDs_that_bought_this_video')
-            ).filter(
-                watchers_count__gt=0
-            ).order_by('-watchers_count', '-updated_at')
+                trending__organization=organization_id
+            ).order_by('-trending__score', '-updated_at')
 
         paginator = VideoPagination()
-        result_page = paginator.paginate_queryset(videos, request)
+        result_page = paginator.paginate_queryset(plan_queryset(videos, VideoSerializer), request)
         serializer = VideoSerializer(result_page, many=True)
 
         return paginator.get_paginated_response(serializer.data)
@@ -203,7 +199,7 @@ def get_user_videos(request, organization_id, user_id):
             ).order_by('-updated_at')
 
         paginator = VideoPagination()
-        result_page = paginator.paginate_queryset(videos, request)
+        result_page = paginator.paginate_queryset(plan_queryset(videos, VideoSerializer), request)
         serializer = VideoSerializer(result_page, many=True)
         return paginator.get_paginated_response(serializer.data)
     except Exception as e:
@@ -274,6 +270,133 @@ def get_video_token(request, videotoken):
         print(f"Error in get_video_token: {e}")
         return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# --------------------------------------------------------------------------
+# Get a signed stream link for a video (for <video> elements)
+# --------------------------------------------------------------------------
+@swagger_auto_schema(
+    method='get',
+    operation_description="Get a short-lived stream link for a video the user is entitled to watch",
+    responses={
+        200: openapi.Response(
+            description="Signed stream link",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'url': openapi.Schema(type=openapi.TYPE_STRING),
+                    'hls_url': openapi.Schema(type=openapi.TYPE_STRING, description="Master playlist, null until packaged"),
+                    'expires_in': openapi.Schema(type=openapi.TYPE_INTEGER),
+                }
+            )
+        ),
+        403: "Not entitled to this video",
+        404: "Video not found"
+    }
+)
+@api_view(['GET'])
+def get_video_stream_url(request, videotoken):
+    try:
+        video = Video.objects.filter(video_token=videotoken).first()
+        if video is None or not video.video:
+            return Response({'error': 'Video not found'}, status=status.HTTP_404_NOT_FOUND)
+        if not is_entitled(request.user, video):
+            return Response({'error': 'You have not bought this video'}, status=status.HTTP_403_FORBIDDEN)
+
+        signature = sign_stream(video, request.user)
+        url = request.build_absolute_uri(f"{stream_path(video)}?{urlencode({'signature': signature})}")
+        hls_url = None
+        if video.processing_status == 'ready':
+            hls_url = request.build_absolute_uri(hls_path(video, signature))
+        return Response({'url': url, 'hls_url': hls_url, 'expires_in': STREAM_URL_MAX_AGE}, status=status.HTTP_200_OK)
+    except Exception as e:
+        print(f"Error in get_video_stream_url: {e}")
+        return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# --------------------------------------------------------------------------
+# Stream a video (Range requests, offloaded to S3 or the web server)
+# --------------------------------------------------------------------------
+@swagger_auto_schema(
+    method='get',
+    operation_description=(
+        "Stream a video by token. Paid videos need the JWT or the signature of a stream link. "
+        "Answers Range requests with 206 partial content, or redirects to a short-lived S3 URL."
+    ),
+    manual_parameters=[
+        openapi.Parameter('signature', openapi.IN_QUERY, description="Signature from the stream link, redirects to the playback URL", type=openapi.TYPE_STRING),
+        openapi.Parameter('playback', openapi.IN_QUERY, description="Playback token the stream link redirected to", type=openapi.TYPE_STRING),
+        openapi.Parameter('Range', openapi.IN_HEADER, description="Byte range, e.g. bytes=0-1048575", type=openapi.TYPE_STRING),
+    ],
+    responses={
+        200: "Video content",
+        206: "Partial video content",
+        302: "Redirect to the playback URL (stream link) or to a presigned storage URL",
+        403: "Not entitled to this video",
+        404: "Video not found",
+        416: "Range not satisfiable"
+    }
+)
+@api_view(['GET'])
+@permission_classes([])
+def stream_video(request, videotoken):
+    try:
+        video = Video.objects.filter(video_token=videotoken).first()
+        if video is None or not video.video:
+            return Response({'error': 'Video not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        playback = request.query_params.get('playback')
+        signature = request.query_params.get('signature')
+        user = stream_user(request, video, playback or signature, playback=bool(playback))
+        if not is_entitled(user, video):
+            return Response({'error': 'You have not bought this video'}, status=status.HTTP_403_FORBIDDEN)
+
+        if signature and not playback and not video.free:
+            # The link only starts the stream
+            return playback_redirect(video, user)
+        return stream_response(request, video)
+    except FileNotFoundError:
+        return Response({'error': 'Video file not found'}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        print(f"Error in stream_video: {e}")
+        return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# --------------------------------------------------------------------------
+# Stream a packaged video (HLS playlists and segments)
+# --------------------------------------------------------------------------
+@swagger_auto_schema(
+    method='get',
+    operation_description=(
+        "Get the HLS master playlist (master.m3u8), a rendition playlist or a segment of a video. "
+        "Paid videos need the JWT, or the signed path returned by video_stream_url."
+    ),
+    responses={
+        200: "Playlist or segment",
+        206: "Partial segment content",
+        302: "Redirect to a presigned storage URL (segments)",
+        403: "Not entitled to this video",
+        404: "Video not packaged or file not found"
+    }
+)
+@api_view(['GET'])
+@permission_classes([])
+def stream_video_hls(request, videotoken, name, signature=None):
+    try:
+        video = Video.objects.filter(video_token=videotoken).first()
+        if video is None or video.processing_status != 'ready':
+            return Response({'error': 'Video not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        user = stream_user(request, video, signature, playback=is_hls_playback(name))
+        if not is_entitled(user, video):
+            return Response({'error': 'You have not bought this video'}, status=status.HTTP_403_FORBIDDEN)
+
+        playback = None
+        if signature and not is_hls_playback(name) and not video.free:
+            playback = sign_playback(video, user)
+        return hls_response(request, video, name, playback)
+    except FileNotFoundError:
+        return Response({'error': 'Video file not found'}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        print(f"Error in stream_video_hls: {e}")
+        return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 # --------------------------------------------------------------------------
 # Add a video
 # --------------------------------------------------------------------------
@@ -22,23 +22,52 @@ class StatusAdmin(admin.ModelAdmin):
 
 @admin.register(WebhookEvent)
 class WebhookEventAdmin(admin.ModelAdmin):
-    list_display = ('event_id', 'received_at')
-    list_filter = ('event_id', 'received_at')
-    search_fields = ('event_id', 'received_at')
+    list_display = ('content_hash', 'account_id', 'day', 'received_at')
+    list_filter = ('day',)
+    search_fields = ('content_hash', 'account_id')
+    exclude = ('payload_gz',)
+    readonly_fields = ('content_hash', 'account_id', 'day', 'received_at', 'payload')
+
+@admin.register(WebhookQueueItem)
+class WebhookQueueItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'attempts', 'received_at', 'claimed_at')
+    list_filter = ('status',)
+    readonly_fields = ('received_at',)
+
+@admin.register(CachedMedia)
+class CachedMediaAdmin(admin.ModelAdmin):
+    list_display = ('media_id', 'status', 'mime_type', 'size', 'last_accessed_at')
+    list_filter = ('status',)
+    search_fields = ('media_id', 'sha256')
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'claimed_by', 'created_at')
+    list_filter = ('kind',)
 
 @admin.register(WATemplateSchema)
 class WATemplateSchemaAdmin(admin.ModelAdmin):
-    list_display = ('template', 'title', 'created_at')
-    list_filter = ('template', 'created_at')
+    list_display = ('template', 'title', 'status', 'sent_count', 'failed_count', 'total_recipients', 'created_at')
+    list_filter = ('template', 'status', 'created_at')
     search_fields = ('template', 'text','created_at')
 
-    readonly_fields = ('created_at',)
+    readonly_fields = ('created_at', 'total_recipients', 'sent_count', 'failed_count', 'broadcast_started_at', 'broadcast_completed_at')
 
     fieldsets = (
         ('Template Information', {
             'fields': ('template', 'text', 'link',"status")
         }),
+        ('Broadcast', {
+            'fields': ('template_name', 'language_code', 'audience', 'total_recipients', 'sent_count', 'failed_count', 'broadcast_started_at', 'broadcast_completed_at')
+        }),
         ('Timestamps', {
             'fields': ('created_at',)
         }),
     )
+
+@admin.register(BroadcastRecipient)
+class BroadcastRecipientAdmin(admin.ModelAdmin):
+    list_display = ('wa_id', 'template', 'status', 'message_id', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('wa_id', 'message_id')
+    raw_id_fields = ('template',)
@@ -0,0 +1,274 @@
+import asyncio
+import time
+from collections import Counter
+from datetime import timedelta
+import httpx
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db.models import F, Q
+from django.utils import timezone
+from .client import RETRY_EXCEPTIONS, whatsapp_client
+from .models import BroadcastRecipient, Contact, WATemplateSchema
+from .search import search_contacts
+from utils import claim_batch, refresh_claim
+
+# A broadcast whose audience is not expanded after this long lost its worker
+EXPAND_TIMEOUT = timedelta(minutes=10)
+MAX_ATTEMPTS = 3
+# Rows per INSERT when expanding an audience into recipients
+EXPAND_BATCH_SIZE = 1000
+# Template types whose link is sent as the header media of the template
+HEADER_MEDIA_TYPES = {
+    'textwithimage': 'image',
+    'textwithvideo': 'video',
+    'textwithdocument': 'document',
+}
+
+
+# ----------------------------------------------------------------
+# Queueing a broadcast
+# ----------------------------------------------------------------
+def validate_audience(audience):
+    """Return the audience dict with only the keys of its type, raising ValueError when invalid."""
+    if not isinstance(audience, dict):
+        raise ValueError('Audience must be an object')
+    audience_type = audience.get('type')
+    if audience_type == 'all':
+        return {'type': 'all'}
+    if audience_type == 'list':
+        wa_ids = audience.get('wa_ids')
+        if not isinstance(wa_ids, list) or not wa_ids:
+            raise ValueError('wa_ids must be a non-empty list for a list audience')
+        return {'type': 'list', 'wa_ids': [str(wa_id).strip() for wa_id in wa_ids if str(wa_id).strip()]}
+    if audience_type == 'query':
+        q = (audience.get('q') or '').strip()
+        if not q:
+            raise ValueError('q is required for a query audience')
+        return {'type': 'query', 'q': q}
+    raise ValueError('Audience type must be one of: all, list, query')
+
+
+def queue_broadcast(template, audience, template_name, language_code='en_US'):
+    template.audience = validate_audience(audience)
+    template.template_name = template_name.replace(' ', '_').lower()
+    template.language_code = language_code or 'en_US'
+    template.status = 'queued'
+    template.total_recipients = template.sent_count = template.failed_count = 0
+    template.broadcast_started_at = template.broadcast_completed_at = None
+    # Recipients of a previous run are replaced by the new audience
+    template.recipients.all().delete()
+    template.save()
+    return template
+
+
+def audience_wa_ids(audience):
+    if audience['type'] == 'list':
+        return iter(dict.fromkeys(audience['wa_ids']))
+    contacts = Contact.objects.all()
+    if audience['type'] == 'query':
+        contacts = search_contacts(contacts, audience['q'])
+    return contacts.order_by('id').values_list('wa_id', flat=True).iterator(chunk_size=EXPAND_BATCH_SIZE)
+
+
+def start_queued_broadcasts():
+    """
+    Expand the audience of every queued broadcast into recipient rows. A
+    broadcast still queued EXPAND_TIMEOUT after a worker claimed it (the
+    worker died halfway) is claimed and expanded again, the recipients
+    inserted the first time are kept.
+    """
+    started = []
+    now = timezone.now()
+    queued = WATemplateSchema.objects.filter(
+        Q(broadcast_started_at__isnull=True) | Q(broadcast_started_at__lt=now - EXPAND_TIMEOUT),
+        status='queued',
+    )
+    for template in queued.order_by('id'):
+        # The conditional UPDATE makes sure only one worker expands a broadcast,
+        # recipients only become claimable once the whole audience is inserted
+        claimed_at = timezone.now()
+        if not queued.filter(pk=template.pk, broadcast_started_at=template.broadcast_started_at).update(broadcast_started_at=claimed_at):
+            continue
+        batch = []
+        for wa_id in audience_wa_ids(template.audience or {'type': 'all'}):
+            batch.append(BroadcastRecipient(template=template, wa_id=wa_id))
+            if len(batch) >= EXPAND_BATCH_SIZE:
+                BroadcastRecipient.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        BroadcastRecipient.objects.bulk_create(batch, ignore_conflicts=True)
+        # Unless the claim was taken over in the meantime
+        if WATemplateSchema.objects.filter(pk=template.pk, status='queued', broadcast_started_at=claimed_at).update(
+            status='sending', total_recipients=template.recipients.count()
+        ):
+            started.append(template.pk)
+    finish_broadcasts(started)
+    return started
+
+
+# ----------------------------------------------------------------
+# Sending
+# ----------------------------------------------------------------
+def claim_timeout():
+    """
+    How long a claim lasts without a refresh. Claims are refreshed as each
+    recipient of a batch starts sending, so this has to outlast one send
+    with all the client's retries, and the gap between two sends at the
+    worker's rate (see min_rate).
+    """
+    return timedelta(seconds=2 * whatsapp_client.max_request_seconds)
+
+
+def min_rate():
+    """Lowest messages per second that starts a send, and refreshes the claims, within every claim timeout."""
+    return 2 / claim_timeout().total_seconds()
+
+
+def claim_recipients(worker_name, batch_size):
+    now = timezone.now()
+    claimable = Q(status='pending') | Q(status='processing', claimed_at__lt=now - claim_timeout())
+    return claim_batch(
+        BroadcastRecipient.objects.filter(claimable, template__status='sending'),
+        worker_name,
+        batch_size,
+        status='processing',
+        attempts=F('attempts') + 1,
+    )
+
+
+def build_payload(template, wa_id):
+    data = {
+        "messaging_product": "whatsapp",
+        "to": wa_id,
+        "type": "template",
+        "template": {
+            "name": template.template_name or template.title.replace(' ', '_').lower(),
+            "language": {"code": template.language_code},
+        },
+    }
+    media_type = HEADER_MEDIA_TYPES.get(template.template)
+    if media_type and template.link:
+        data["template"]["components"] = [{
+            "type": "header",
+            "parameters": [{"type": media_type, media_type: {"link": template.link}}],
+        }]
+    return data
+
+
+class RateLimiter:
+    """Spaces calls evenly so at most `rate` start per second (per worker process)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0
+        self.next_slot = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def hold_claim(recipient, waiting):
+    """
+    Refresh the claim of a recipient about to be sent to and of those still
+    waiting in its batch. False when another worker took the recipient over.
+    """
+    queryset = BroadcastRecipient.objects.filter(status='processing')
+    if not refresh_claim(queryset, recipient.claimed_by, [recipient.pk]):
+        return False
+    refresh_claim(queryset, recipient.claimed_by, waiting)
+    return True
+
+
+async def send_to_recipients(recipients, templates, limiter, concurrency):
+    """Send the template of every recipient, storing each outcome as soon as it is known."""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    waiting = {recipient.pk for recipient in recipients}
+
+    async def send(recipient):
+        async with semaphore:
+            await limiter.wait()
+            waiting.discard(recipient.pk)
+            if not await sync_to_async(hold_claim)(recipient, list(waiting)):
+                recipient.status = 'lost'
+                return
+            try:
+                response = await whatsapp_client.asend_message(
+                    build_payload(templates[recipient.template_id], recipient.wa_id)
+                )
+            except RETRY_EXCEPTIONS as e:
+                # Nothing reached Meta, retry in a later batch
+                recipient.status = 'failed' if recipient.attempts >= MAX_ATTEMPTS else 'pending'
+                recipient.error = f'Failed to connect to WhatsApp API: {e}'
+            except httpx.HTTPError as e:
+                # The request went out, Meta may have delivered it
+                recipient.status = 'unknown'
+                recipient.error = f'No response from WhatsApp API, the message may have been sent: {e!r}'
+            else:
+                read_response(recipient, response)
+        await sync_to_async(record_outcomes)([recipient])
+
+    try:
+        results = await asyncio.gather(*(send(recipient) for recipient in recipients), return_exceptions=True)
+    finally:
+        await whatsapp_client.aclose()
+    for recipient, result in zip(recipients, results):
+        if isinstance(result, Exception):
+            # Left processing, the claim runs out and a later batch retries it
+            print(f"Error sending broadcast to {recipient.wa_id}: {result!r}")
+
+
+def read_response(recipient, response):
+    try:
+        data = response.json()
+    except ValueError:
+        data = {}
+    if response.status_code in [200, 201]:
+        recipient.status = 'sent'
+        recipient.message_id = (data.get('messages') or [{}])[0].get('id', '')
+        recipient.sent_at = timezone.now()
+        recipient.error = ''
+    else:
+        recipient.status = 'failed'
+        recipient.error = (data.get('error') or {}).get('message') or f"WhatsApp API error: {response.status_code}"
+
+
+def send_batch(recipients, limiter, concurrency):
+    templates = WATemplateSchema.objects.in_bulk({recipient.template_id for recipient in recipients})
+    # Database calls of the sends run back in this thread, on its connection
+    async_to_sync(send_to_recipients)(recipients, templates, limiter, concurrency)
+
+
+# ----------------------------------------------------------------
+# Recording outcomes
+# ----------------------------------------------------------------
+def record_outcomes(recipients):
+    recipients = [recipient for recipient in recipients if recipient.status != 'lost']
+    for recipient in recipients:
+        recipient.claimed_by = ''
+        recipient.claimed_at = None
+    BroadcastRecipient.objects.bulk_update(
+        recipients, ['status', 'message_id', 'error', 'sent_at', 'claimed_by', 'claimed_at'], batch_size=500
+    )
+
+    sent = Counter(recipient.template_id for recipient in recipients if recipient.status == 'sent')
+    failed = Counter(recipient.template_id for recipient in recipients if recipient.status == 'failed')
+    for template_id in sent.keys() | failed.keys():
+        WATemplateSchema.objects.filter(pk=template_id).update(
+            sent_count=F('sent_count') + sent[template_id],
+            failed_count=F('failed_count') + failed[template_id],
+        )
+    finish_broadcasts({recipient.template_id for recipient in recipients})
+
+
+def finish_broadcasts(template_ids):
+    """Mark broadcasts without outstanding recipients as sent (or failed when nothing went out)."""
+    for template in WATemplateSchema.objects.filter(pk__in=template_ids, status='sending'):
+        if template.recipients.filter(status__in=['pending', 'processing']).exists():
+            continue
+        failed = template.total_recipients > 0 and template.sent_count == 0
+        WATemplateSchema.objects.filter(pk=template.pk, status='sending').update(
+            status='failed' if failed else 'sent',
+            broadcast_completed_at=timezone.now(),
+        )
+
@@ -0,0 +1,185 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+import httpx
+from django.conf import settings
+
+# Statuses worth retrying: rate limiting and transient Graph API failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Only errors raised before the request reached Meta are retried, a read
+# timeout on a send may already have delivered the message
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)
+
+
+class WhatsAppClient:
+    """
+    Shared Graph API client. One pooled keep-alive HTTP/2 connection set is
+    kept per process for sync callers and one per event loop for async
+    callers (views, Channels consumers, workers).
+
+    Non-2xx responses are returned to the caller as-is once retries are
+    exhausted; transport errors are raised as httpx exceptions.
+    """
+
+    def __init__(self, base_url=None, timeout=None, max_retries=None, backoff=None, max_backoff=None):
+        self._base_url = base_url
+        self._timeout = timeout
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._sync_client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    # ----------------------------------------------------------------
+    # Configuration (read lazily so settings overrides apply)
+    # ----------------------------------------------------------------
+    @property
+    def base_url(self):
+        return self._base_url or getattr(settings, 'WHATSAPP_GRAPH_API_URL', 'https://graph.facebook.com')
+
+    @property
+    def version(self):
+        return getattr(settings, 'WHATSAPP_VERSION', None) or 'v17.0'
+
+    @property
+    def max_retries(self):
+        return self._max_retries if self._max_retries is not None else getattr(settings, 'WHATSAPP_API_MAX_RETRIES', 3)
+
+    @property
+    def backoff(self):
+        return self._backoff if self._backoff is not None else getattr(settings, 'WHATSAPP_API_BACKOFF', 0.5)
+
+    @property
+    def max_backoff(self):
+        return self._max_backoff if self._max_backoff is not None else 30
+
+    @property
+    def timeout(self):
+        return self._timeout if self._timeout is not None else getattr(settings, 'WHATSAPP_API_TIMEOUT', 30)
+
+    @property
+    def max_request_seconds(self):
+        """Longest a request can take through all its retries and backoffs."""
+        # The timeout bounds each of the pool wait, write and read, connect is capped lower
+        attempt = 3 * self.timeout + min(self.timeout, 10)
+        return (self.max_retries + 1) * attempt + self.max_retries * self.max_backoff
+
+    def _headers(self):
+        return {'Authorization': f'Bearer {settings.WHATSAPP_ACCESS_TOKEN}'}
+
+    def _client_options(self):
+        timeout = self.timeout
+        return {
+            'http2': True,
+            'timeout': httpx.Timeout(timeout, connect=min(timeout, 10)),
+            'limits': httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        }
+
+    def url(self, path):
+        if path.startswith(('http://', 'https://')):
+            return path
+        return f"{self.base_url.rstrip('/')}/{self.version}/{path.lstrip('/')}"
+
+    def retry_delay(self, attempt, response=None):
+        """Full-jitter exponential backoff, honouring Retry-After when Meta sends one."""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    # ----------------------------------------------------------------
+    # Connection pools
+    # ----------------------------------------------------------------
+    @property
+    def sync_client(self):
+        if self._sync_client is None:
+            with self._lock:
+                if self._sync_client is None:
+                    self._sync_client = httpx.Client(**self._client_options())
+        return self._sync_client
+
+    @property
+    def async_client(self):
+        # An AsyncClient's connections belong to the loop that opened them
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = httpx.AsyncClient(**self._client_options())
+        return client
+
+    def close(self):
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+    async def aclose(self):
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    # ----------------------------------------------------------------
+    # Sync API
+    # ----------------------------------------------------------------
+    def request(self, method, path, **kwargs):
+        headers = {**self._headers(), **kwargs.pop('headers', {})}
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self.sync_client.request(method, self.url(path), headers=headers, **kwargs)
+            except RETRY_EXCEPTIONS:
+                if last_attempt:
+                    raise
+                time.sleep(self.retry_delay(attempt))
+                continue
+            if response.status_code not in RETRY_STATUSES or last_attempt:
+                return response
+            time.sleep(self.retry_delay(attempt, response))
+
+    def send_message(self, data):
+        return self.request('POST', f"{settings.WHATSAPP_FROM_PHONE_NUMBER_ID}/messages", json=data)
+
+    def get_media_info(self, media_id):
+        return self.request('GET', media_id)
+
+    @contextmanager
+    def stream(self, url):
+        with self.sync_client.stream('GET', self.url(url), headers=self._headers()) as response:
+            yield response
+
+    # ----------------------------------------------------------------
+    # Async API
+    # ----------------------------------------------------------------
+    async def arequest(self, method, path, **kwargs):
+        headers = {**self._headers(), **kwargs.pop('headers', {})}
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = await self.async_client.request(method, self.url(path), headers=headers, **kwargs)
+            except RETRY_EXCEPTIONS:
+                if last_attempt:
+                    raise
+                await asyncio.sleep(self.retry_delay(attempt))
+                continue
+            if response.status_code not in RETRY_STATUSES or last_attempt:
+                return response
+            await asyncio.sleep(self.retry_delay(attempt, response))
+
+    async def asend_message(self, data):
+        return await self.arequest('POST', f"{settings.WHATSAPP_FROM_PHONE_NUMBER_ID}/messages", json=data)
+
+    async def aget_media_info(self, media_id):
+        return await self.arequest('GET', media_id)
+
+    @asynccontextmanager
+    async def astream(self, url):
+        async with self.async_client.stream('GET', self.url(url), headers=self._headers()) as response:
+            yield response
+
+
+# Process-wide client, import this rather than creating new clients
+whatsapp_client = WhatsAppClient()
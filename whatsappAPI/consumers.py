@@ -1,9 +1,8 @@
 
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from .models import Contact, WAMessage
-from channels.db import database_sync_to_async
-from .serializers import ContactSerializer  # Ensure you have this serializer in place
+from .seen import seen_acknowledgements
+from .fanout import MESSAGES_GROUP, conversation_group
 
 
 
@@ -12,40 +11,90 @@ class WAMessagesConsumer(AsyncWebsocketConsumer):
     # Functionality: WebSocket Connection Handling
     # ----------------------------------------------------------------
     async def connect(self):
-        self.room_group_name = f'whatsappapi_messages'
-        # Join room group
+        # Conversation groups joined by this socket, see receive(). Every
+        # conversation until the client subscribes to some, clients that
+        # never send a subscription keep receiving everything
+        self.groups_joined = {MESSAGES_GROUP}
+        self.default_subscription = True
+        await self.channel_layer.group_add(MESSAGES_GROUP, self.channel_name)
         print('connected to contacts Socket')
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
-
         await self.accept()
 
     # ----------------------------------------------------------------
     # Functionality:  disconnecting from WebSocket
     # ----------------------------------------------------------------
     async def disconnect(self, close_code):
-        # Leave room group
+        # Leave every joined group
         print('disconnected to contacts Socket')
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
-        
+        for group in self.groups_joined:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        self.groups_joined = set()
+
     # ----------------------------------------------------------------
-    # Functionality: Sending Messages to WebSocket Group
+    # Functionality: Receiving subscriptions from WebSocket
+    #   {"operation": "subscribe", "contact_ids": [1, 2]}
+    #   {"operation": "unsubscribe", "contact_ids": [1]}
+    #   {"operation": "subscribe_all"} / {"operation": "unsubscribe_all"}
     # ----------------------------------------------------------------
-    async def chat_message(self, event):
-        operation = event['operation']
-        contact = event['contact']
-        message = event['message']
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except ValueError:
+            await self.send(text_data=json.dumps({'error': 'Invalid JSON'}))
+            return
+        operation = data.get('operation')
+
+        if operation in ['subscribe_all', 'unsubscribe_all']:
+            groups = {MESSAGES_GROUP}
+        elif operation in ['subscribe', 'unsubscribe']:
+            contact_ids = data.get('contact_ids')
+            if contact_ids is None and data.get('contact_id') is not None:
+                contact_ids = [data['contact_id']]
+            if not isinstance(contact_ids, list) or not all(str(contact_id).isdigit() for contact_id in contact_ids):
+                await self.send(text_data=json.dumps({'error': 'contact_ids must be a list of contact IDs'}))
+                return
+            groups = {conversation_group(int(contact_id)) for contact_id in contact_ids}
+        else:
+            await self.send(text_data=json.dumps({'error': f'Unsupported operation: {operation}'}))
+            return
+
+        if operation == 'subscribe' and self.default_subscription:
+            # The first conversation subscription replaces the default one
+            await self.channel_layer.group_discard(MESSAGES_GROUP, self.channel_name)
+            self.groups_joined.discard(MESSAGES_GROUP)
+        self.default_subscription = False
+
+        if operation.startswith('subscribe'):
+            for group in groups - self.groups_joined:
+                await self.channel_layer.group_add(group, self.channel_name)
+            self.groups_joined |= groups
+        else:
+            for group in groups & self.groups_joined:
+                await self.channel_layer.group_discard(group, self.channel_name)
+            self.groups_joined -= groups
+
         await self.send(text_data=json.dumps({
             'operation': operation,
-            'contact': contact,
-            'message': message
+            'subscriptions': sorted(self.groups_joined)
         }))
 
+    # ----------------------------------------------------------------
+    # Functionality: Sending a batch of new messages to WebSocket
+    # ----------------------------------------------------------------
+    async def messages_batch(self, event):
+        await self.send(text_data=json.dumps({
+            'operation': 'batch_create',
+            'messages': event['messages']
+        }))
+
+    # ----------------------------------------------------------------
+    # Functionality: Sending delivery receipts (sent/delivered/read) to WebSocket
+    # ----------------------------------------------------------------
+    async def receipts_batch(self, event):
+        await self.send(text_data=json.dumps({
+            'operation': 'batch_receipts',
+            'receipts': event['receipts']
+        }))
 
 
 
@@ -75,14 +124,12 @@ class WAContactsConsumer(AsyncWebsocketConsumer):
         )
 
     # ----------------------------------------------------------------
-    # Sending a chat message to WebSocket
+    # Sending a batch of contact deltas (changed fields only) to WebSocket
     # ----------------------------------------------------------------
-    async def chat_message(self, event):
-        contact = event['contact']
-        operation = event['operation']
+    async def contacts_batch(self, event):
         await self.send(text_data=json.dumps({
-            'operation': operation,
-            'contact': contact
+            'operation': 'batch_update',
+            'contacts': event['contacts']
         }))
 
     # ----------------------------------------------------------------
@@ -95,58 +142,19 @@ class WAContactsConsumer(AsyncWebsocketConsumer):
         if operation == 'update_seen_status':
             await self.update_seen_status(contactdata)
 
-    # ----------------------------------------------------------------
-    # Helper: Fetch contact synchronously in an async context
-    # ----------------------------------------------------------------
-    @database_sync_to_async
-    def get_contact(self, contact_id):
-        try:
-            return Contact.objects.get(id=contact_id)
-        except Contact.DoesNotExist:
-            return None
-
-    # ----------------------------------------------------------------
-    # Helper: Mark all messages as seen for a contact
-    # ----------------------------------------------------------------
-    @database_sync_to_async
-    def mark_all_messages_as_seen(self, contact):
-        WAMessage.objects.filter(contact=contact, seen=False).update(seen=True)
-
-    # ----------------------------------------------------------------
-    # Helper: Serialize contact and message information
-    # ----------------------------------------------------------------
-    @database_sync_to_async
-    def serialize_contact(self, contact):
-        serializer = ContactSerializer(contact)
-        return serializer.data
-
     # ----------------------------------------------------------------
     # Functionality: Update Seen Status
+    #   {"operation": "update_seen_status", "contact": {"id": 1, "seen_up_to": 42}}
+    # Acknowledgements are debounced and written in batches, the outbox
+    # relay then sends the other WebSocket users the new unread count
     # ----------------------------------------------------------------
     async def update_seen_status(self, data):
-        contact_id = data.get('id')  # WhatsApp ID of the contact
-        contact = await self.get_contact(contact_id)
-
-        if contact:
-            # Mark all messages as seen
-            await self.mark_all_messages_as_seen(contact)
-
-            # Serialize the updated contact information
-            updated_contact_data = await self.serialize_contact(contact)
-
-            # Notify other WebSocket users about the updated seen status
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'chat_message',
-                    'operation': 'update_seen_status',
-                    'contact': updated_contact_data  # Send the updated serialized contact data
-                }
-            )
-        else:
-            await self.send(text_data=json.dumps({'error': 'Contact not found'}))
-
-
-   
-
-
+        contact_id = (data or {}).get('id')
+        seen_up_to = (data or {}).get('seen_up_to')  # Message id (pk), every message when omitted
+        if not str(contact_id).isdigit():
+            await self.send(text_data=json.dumps({'error': 'Invalid contact ID'}))
+            return
+        if seen_up_to is not None and not str(seen_up_to).isdigit():
+            await self.send(text_data=json.dumps({'error': 'seen_up_to must be a message ID'}))
+            return
+        seen_acknowledgements.acknowledge(int(contact_id), int(seen_up_to) if seen_up_to is not None else None)
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+CONTACTS_GROUP = 'whatsappapi_contacts'
+# Firehose of every conversation (supervisors), see conversation_group()
+MESSAGES_GROUP = 'whatsappapi_messages'
+# Updates published within this many seconds go out in one frame per group
+WINDOW = getattr(settings, 'WHATSAPP_FANOUT_WINDOW', 0.15)
+# Items per frame, keeps frames well under the channel layer message size
+MAX_BATCH = 100
+# Contacts whose last published state is remembered for computing deltas
+MAX_TRACKED_CONTACTS = 10000
+
+
+def contact_delta(previous, current):
+    """Fields of a serialized contact that changed since `previous` (always with its id)."""
+    if previous is None:
+        return dict(current)
+    delta = {key: value for key, value in current.items() if previous.get(key) != value}
+    if delta:
+        delta['id'] = current['id']
+    return delta
+
+
+def conversation_group(contact_id):
+    """Group of the sockets subscribed to one contact's conversation."""
+    return f'{MESSAGES_GROUP}_{contact_id}'
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class FanoutBuffer:
+    """
+    Coalesces real-time updates (relayed from the outbox). Within a window
+    only the latest state of each contact is kept, and it is sent as a delta
+    against the state this process last published; new messages are queued
+    in order. When the window closes, each group receives batched frames:
+
+    - whatsappapi_contacts: {'type': 'contacts_batch', 'contacts': [...]}
+    - whatsappapi_messages_<contact id>: {'type': 'messages_batch', 'messages': [...]}
+      with the messages of that conversation and
+      {'type': 'receipts_batch', 'receipts': [...]} with the latest delivery
+      status of its messages, and the same frames for every conversation
+      to the whatsappapi_messages firehose
+    """
+
+    def __init__(self, window=WINDOW, send=None):
+        self.window = window
+        self._send = send
+        self._lock = threading.Lock()
+        self._contacts = {}
+        self._messages = []
+        self._receipts = {}
+        self._timer = None
+        self._published = OrderedDict()
+
+    def publish(self, contacts=(), messages=(), receipts=()):
+        """
+        Queue serialized contacts (ContactSerializer, or only the id and the
+        fields that changed), messages (WAMessageSerializer) and receipts.
+        """
+        flush_now = False
+        with self._lock:
+            for contact in contacts:
+                self._contacts[contact['id']] = {**self._contacts.get(contact['id'], {}), **contact}
+            self._messages.extend(messages)
+            for receipt in receipts:
+                self._receipts[receipt['id']] = receipt
+            if self._timer is None and (self._contacts or self._messages or self._receipts):
+                self._timer = self._schedule_flush()
+                flush_now = self._timer is None
+        if flush_now:
+            self.flush()
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            # Published from async code (consumers): flush on the same loop
+            return loop.call_later(max(self.window, 0), lambda: loop.create_task(self.aflush()))
+        if self.window <= 0:
+            return None
+        timer = threading.Timer(self.window, self.flush)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def _drain(self):
+        """Take the buffered updates and return the (group, event) frames to send."""
+        with self._lock:
+            contacts, self._contacts = self._contacts, {}
+            messages, self._messages = self._messages, []
+            receipts, self._receipts = list(self._receipts.values()), {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            deltas = []
+            for contact_id, contact in contacts.items():
+                previous = self._published.get(contact_id)
+                delta = contact_delta(previous, contact)
+                self._published[contact_id] = {**previous, **contact} if previous else contact
+                self._published.move_to_end(contact_id)
+                if delta:
+                    deltas.append(delta)
+            while len(self._published) > MAX_TRACKED_CONTACTS:
+                self._published.popitem(last=False)
+
+        frames = [(CONTACTS_GROUP, {'type': 'contacts_batch', 'contacts': batch}) for batch in chunks(deltas, MAX_BATCH)]
+        frames += self._conversation_frames('messages_batch', 'messages', messages)
+        frames += self._conversation_frames('receipts_batch', 'receipts', receipts)
+        return frames
+
+    def _conversation_frames(self, event_type, key, items):
+        """Frames for each conversation group of `items` plus the firehose."""
+        conversations = {}
+        for item in items:
+            conversations.setdefault(item['contact'], []).append(item)
+        frames = []
+        for contact_id, conversation in conversations.items():
+            frames += [
+                (conversation_group(contact_id), {'type': event_type, key: batch})
+                for batch in chunks(conversation, MAX_BATCH)
+            ]
+        frames += [(MESSAGES_GROUP, {'type': event_type, key: batch}) for batch in chunks(items, MAX_BATCH)]
+        return frames
+
+    def flush(self):
+        for group, event in self._drain():
+            self.send(group, event)
+
+    async def aflush(self):
+        for group, event in self._drain():
+            if self._send is not None:
+                self._send(group, event)
+                continue
+            try:
+                await get_channel_layer().group_send(group, event)
+            except Exception as ws_error:
+                print(f"WebSocket error: {ws_error}")
+
+    def send(self, group, event):
+        if self._send is not None:
+            return self._send(group, event)
+        try:
+            channel_layer = get_channel_layer()
+            if channel_layer:
+                async_to_sync(channel_layer.group_send)(group, event)
+        except Exception as ws_error:
+            print(f"WebSocket error: {ws_error}")
+
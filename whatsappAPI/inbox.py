@@ -0,0 +1,161 @@
+from django.db import connection, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Contact, WAMessage
+
+
+SUMMARY_FIELDS = [
+    'last_message_pk',
+    'last_message_message_id',
+    'last_message_type',
+    'last_message_body',
+    'last_message_at',
+    'unread_count',
+    'last_activity_at',
+]
+
+
+# ----------------------------------------------------------------
+# Incremental update: new messages were inserted
+# ----------------------------------------------------------------
+def record_new_messages(messages):
+    """
+    Fold freshly inserted messages into their contacts' inbox summary with
+    a single bulk UPDATE: the newest message becomes the last message and
+    received messages bump the unread counter.
+    """
+    summaries = {}
+    for message in messages:
+        summary = summaries.setdefault(message.contact_id, {'last': None, 'unread': 0})
+        last = summary['last']
+        if last is None or (message.timestamp, message.pk) >= (last.timestamp, last.pk):
+            summary['last'] = message
+        if message.message_mode == 'received' and not message.seen:
+            summary['unread'] += 1
+
+    if not summaries:
+        return
+
+    contacts = []
+    for contact_id, summary in summaries.items():
+        last = summary['last']
+        contacts.append(Contact(
+            pk=contact_id,
+            last_message_pk=last.pk,
+            last_message_message_id=last.message_id,
+            last_message_type=last.message_type,
+            last_message_body=last.body,
+            last_message_at=last.timestamp,
+            unread_count=F('unread_count') + summary['unread'],
+            last_activity_at=last.timestamp,
+        ))
+    Contact.objects.bulk_update(contacts, SUMMARY_FIELDS)
+
+
+# ----------------------------------------------------------------
+# Incremental update: agents have read conversations up to a message
+# ----------------------------------------------------------------
+def unread_messages():
+    """Unread received messages per contact, correlated on the outer Contact query."""
+    return (
+        WAMessage.objects.filter(contact=OuterRef('pk'), message_mode='received', seen=False)
+        .order_by()
+        .values('contact')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+
+
+def mark_seen_sql(watermarks):
+    """
+    One statement flipping the messages and decrementing the counters: the
+    messages UPDATE ... RETURNING feeds the contacts UPDATE (data-modifying
+    CTEs), then the counters of contacts without newly seen messages.
+    """
+    conditions, params = [], []
+    for contact_id, up_to in watermarks.items():
+        if up_to:
+            conditions.append('(m.contact_id = %s AND m.id <= %s)')
+            params += [contact_id, up_to]
+        else:
+            conditions.append('m.contact_id = %s')
+            params.append(contact_id)
+    messages = connection.ops.quote_name(WAMessage._meta.db_table)
+    contacts = connection.ops.quote_name(Contact._meta.db_table)
+    sql = (
+        'WITH flipped AS ('
+        f'  UPDATE {messages} m SET seen = true'
+        '  WHERE m.seen = false AND (' + ' OR '.join(conditions) + ')'
+        '  RETURNING m.contact_id, m.message_mode'
+        '), decrements AS ('
+        '  SELECT contact_id, COUNT(*) AS seen_count FROM flipped WHERE message_mode = %s GROUP BY contact_id'
+        '), counters AS ('
+        f'  UPDATE {contacts} c SET unread_count = GREATEST(c.unread_count - d.seen_count, 0)'
+        '  FROM decrements d WHERE c.id = d.contact_id'
+        '  RETURNING c.id, c.unread_count'
+        ')'
+        ' SELECT id, unread_count FROM counters'
+        ' UNION ALL'
+        f' SELECT id, unread_count FROM {contacts}'
+        ' WHERE id = ANY(%s) AND id NOT IN (SELECT id FROM counters)'
+    )
+    return sql, [*params, 'received', list(watermarks)]
+
+
+def mark_seen(watermarks):
+    """
+    Mark messages as seen up to a watermark per contact ({contact id:
+    message pk, or None for every message}) and take them off the
+    contacts' unread counters, which keep counting what arrived after the
+    watermark. On PostgreSQL a single statement does both (mark_seen_sql).
+    SQLite (DEBUG_ENV) cannot UPDATE inside a WITH clause and runs one
+    UPDATE for the messages and one recounting the counters, in the same
+    transaction. Publishes only the new counters. Returns {contact id:
+    unread count}.
+    """
+    if not watermarks:
+        return {}
+    from .outbox import record
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as db:
+                db.execute(*mark_seen_sql(watermarks))
+                unread = dict(db.fetchall())
+        else:
+            seen = Q(pk__in=[])
+            for contact_id, up_to in watermarks.items():
+                seen |= Q(contact_id=contact_id, pk__lte=up_to) if up_to else Q(contact_id=contact_id)
+            WAMessage.objects.filter(seen, seen=False).update(seen=True)
+            contacts = Contact.objects.filter(pk__in=watermarks)
+            contacts.update(unread_count=Coalesce(Subquery(unread_messages(), output_field=IntegerField()), Value(0)))
+            unread = dict(contacts.values_list('pk', 'unread_count'))
+        record(contacts=[{'id': contact_id, 'unread_message_count': count} for contact_id, count in unread.items()])
+    return unread
+
+
+# ----------------------------------------------------------------
+# Repair: recompute the summaries from WAMessage in bulk
+# ----------------------------------------------------------------
+def recompute_inbox_summaries(batch_size=1000):
+    latest = WAMessage.objects.filter(contact=OuterRef('pk')).order_by('-timestamp', '-id')
+    unread = unread_messages()
+
+    updated = 0
+    last_pk = 0
+    while True:
+        pks = list(
+            Contact.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return updated
+        updated += Contact.objects.filter(pk__in=pks).update(
+            last_message_pk=Subquery(latest.values('id')[:1]),
+            last_message_message_id=Coalesce(Subquery(latest.values('message_id')[:1]), Value('')),
+            last_message_type=Coalesce(Subquery(latest.values('message_type')[:1]), Value('')),
+            last_message_body=Coalesce(Subquery(latest.values('body')[:1]), Value('')),
+            last_message_at=Subquery(latest.values('timestamp')[:1]),
+            unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0)),
+            last_activity_at=Coalesce(Subquery(latest.values('timestamp')[:1]), F('last_activity_at')),
+        )
+        last_pk = pks[-1]
@@ -0,0 +1,187 @@
+from django.db import transaction
+from .models import Contact, WAMessage, Status
+from .inbox import record_new_messages
+from .journal import journal_payload
+from .mediacache import enqueue_archive
+from .outbox import record_messages, record_receipts
+from .receipts import apply_receipts, parse_receipt_timestamp
+
+
+# ----------------------------------------------------------------
+# Helper: Extract the message content based on its type
+# ----------------------------------------------------------------
+def parse_message(message_data):
+    message_type = message_data.get('type')
+    fields = {
+        'message_id': message_data.get('id'),
+        'message_type': message_type,
+        'body': '',
+        'media_id': '',
+        'mime_type': '',
+        'caption': '',
+        'filename': '',
+    }
+    if message_type == 'text':
+        fields['body'] = message_data.get('text', {}).get('body', '')
+    else:
+        # For media messages
+        media_content = message_data.get(message_type, {}) or {}
+        fields['media_id'] = media_content.get('id', '')
+        fields['mime_type'] = media_content.get('mime_type', '')
+        fields['caption'] = media_content.get('caption', '')
+        fields['filename'] = media_content.get('filename', '')
+    return fields
+
+
+# ----------------------------------------------------------------
+# Helper: Flatten every entry/change of a payload into arrays
+# ----------------------------------------------------------------
+def collect_payload(payload):
+    contacts = {}   # wa_id -> profile name
+    messages = {}   # message_id -> (wa_id, fields)
+    statuses = []   # (message_id, status, timestamp)
+
+    entries = payload.get('entry', [])
+    if isinstance(entries, dict):
+        entries = [entries]
+
+    for entry in entries:
+        changes = entry.get('changes', [])
+        if isinstance(changes, dict):
+            changes = [changes]
+
+        for change in changes:
+            value = change.get('value', {}) or {}
+
+            change_wa_ids = []
+            for contact_data in value.get('contacts', []):
+                wa_id = contact_data.get('wa_id')
+                if not wa_id:
+                    print("Missing wa_id in contact data")
+                    continue
+                profile_name = (contact_data.get('profile') or {}).get('name', '')
+                contacts.setdefault(wa_id, profile_name)
+                change_wa_ids.append(wa_id)
+
+            for message_data in value.get('messages', []):
+                fields = parse_message(message_data)
+                if not fields['message_id'] or not fields['message_type']:
+                    print(f"Missing required message fields: id={fields['message_id']}, type={fields['message_type']}")
+                    continue
+                # Messages carry the sender in `from`; fall back to the
+                # contact of the change for payloads that omit it
+                wa_id = message_data.get('from') or (change_wa_ids[0] if change_wa_ids else None)
+                if not wa_id:
+                    print(f"No contact for message {fields['message_id']}, skipping")
+                    continue
+                contacts.setdefault(wa_id, '')
+                messages.setdefault(fields['message_id'], (wa_id, fields))
+
+            for status_data in value.get('statuses', []):
+                message_id = status_data.get('id')
+                status_value = status_data.get('status')
+                if not message_id or not status_value:
+                    print(f"Missing required status fields: id={message_id}, status={status_value}")
+                    continue
+                statuses.append((message_id, status_value, parse_receipt_timestamp(status_data.get('timestamp'))))
+
+    return contacts, messages, statuses
+
+
+# ----------------------------------------------------------------
+# Helper: serialize concurrent deliveries of the same conversations
+# ----------------------------------------------------------------
+def lock_contacts(contact_ids):
+    """
+    Row-lock the contacts (in id order, no deadlocks) until the transaction
+    ends. A worker ingesting the same messages waits here until the other
+    one commits, and its existence check then sees the inserted rows.
+    """
+    list(Contact.objects.select_for_update().filter(pk__in=contact_ids).order_by('pk').values_list('pk', flat=True))
+
+
+# ----------------------------------------------------------------
+# Ingest a webhook payload received from Meta
+# ----------------------------------------------------------------
+def process_webhook_payload(payload):
+    """
+    Ingest every entry/change of a payload with a fixed number of queries:
+    contacts, messages and statuses are each written with one bulk upsert
+    regardless of how many the payload carries. Ingesting a payload again
+    (Meta retries, replays) adds nothing.
+
+    Returns counts of the messages and statuses in the payload, the new
+    messages and the statuses whose message does not exist (yet).
+    """
+    contacts, messages, statuses = collect_payload(payload)
+    result = {'messages': len(messages), 'statuses': len(statuses), 'new_messages': 0, 'missing_statuses': 0}
+    if not contacts and not messages and not statuses:
+        return result
+
+    # Append the payload to the journal (once per distinct payload) on its
+    # own, so a payload that fails to ingest is still kept for replay
+    journal_payload(payload)
+
+    with transaction.atomic():
+        contact_ids = {}
+        if contacts:
+            Contact.objects.bulk_create(
+                [Contact(wa_id=wa_id, profile_name=profile_name) for wa_id, profile_name in contacts.items()],
+                ignore_conflicts=True,
+            )
+            contact_ids = dict(Contact.objects.filter(wa_id__in=contacts.keys()).values_list('wa_id', 'id'))
+
+        if messages:
+            # Only the messages inserted by this call are new, not the ones
+            # a concurrent delivery of the payload inserted first
+            lock_contacts({contact_ids[wa_id] for wa_id, _ in messages.values()})
+            existing_ids = set(
+                WAMessage.objects.filter(message_id__in=messages.keys()).values_list('message_id', flat=True)
+            )
+            WAMessage.objects.bulk_create(
+                [
+                    WAMessage(contact_id=contact_ids[wa_id], **fields)
+                    for message_id, (wa_id, fields) in messages.items()
+                    if message_id not in existing_ids
+                ],
+                ignore_conflicts=True,
+            )
+            new_ids = [message_id for message_id in messages if message_id not in existing_ids]
+            result['new_messages'] = len(new_ids)
+            if new_ids:
+                new_messages = list(
+                    WAMessage.objects.filter(message_id__in=new_ids).order_by('id')
+                )
+                record_new_messages(new_messages)
+                # Published by the outbox relay once this transaction commits
+                record_messages(new_messages)
+                # Archive media before Meta's download URLs expire
+                enqueue_archive(message.media_id for message in new_messages)
+
+        if statuses:
+            message_pks = dict(
+                WAMessage.objects.filter(message_id__in={message_id for message_id, _, _ in statuses})
+                .values_list('message_id', 'id')
+            )
+            # A message keeps one row per status it went through
+            seen_statuses = set(
+                Status.objects.filter(message_id__in=message_pks.values()).values_list('message_id', 'status')
+            )
+            status_rows = []
+            for message_id, status_value, _ in statuses:
+                if message_id not in message_pks:
+                    print(f"Message with ID {message_id} not found.")
+                    result['missing_statuses'] += 1
+                    continue
+                if (message_pks[message_id], status_value) in seen_statuses:
+                    continue
+                seen_statuses.add((message_pks[message_id], status_value))
+                status_rows.append(Status(message_id=message_pks[message_id], status=status_value))
+            Status.objects.bulk_create(status_rows)
+
+            # Latest status on the message itself, pushed to its conversation
+            receipt_ids = apply_receipts(receipt for receipt in statuses if receipt[0] in message_pks)
+            if receipt_ids:
+                record_receipts(receipt_ids)
+
+    return result
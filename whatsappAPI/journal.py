@@ -0,0 +1,99 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from django.core.files import File
+from django.core.files.storage import default_storage
+from .models import WebhookEvent
+
+ARCHIVE_PREFIX = 'webhook_archive'
+
+
+# ----------------------------------------------------------------
+# Encoding: canonical JSON, hashed and gzip-compressed
+# ----------------------------------------------------------------
+def canonical_json(payload):
+    return json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def payload_hash(payload):
+    return hashlib.sha256(canonical_json(payload)).hexdigest()
+
+
+def compress_payload(payload):
+    return gzip.compress(canonical_json(payload))
+
+
+def decompress_payload(data):
+    return json.loads(gzip.decompress(bytes(data)))
+
+
+# ----------------------------------------------------------------
+# Appending to the journal
+# ----------------------------------------------------------------
+def journal_payload(payload):
+    """
+    Append a webhook payload to the journal. Identical payloads (Meta
+    retries) share a content hash and are stored once.
+    """
+    entries = payload.get('entry') or []
+    if isinstance(entries, dict):
+        entries = [entries]
+    account_id = next((str(entry.get('id')) for entry in entries if entry.get('id')), '')
+    WebhookEvent.objects.bulk_create(
+        [WebhookEvent(content_hash=payload_hash(payload), account_id=account_id, payload_gz=compress_payload(payload))],
+        ignore_conflicts=True,
+    )
+
+
+def iter_payloads(queryset, chunk_size=500):
+    """Decompressed payloads of a journal queryset, in id order."""
+    for event in queryset.order_by('id').only('id', 'payload_gz').iterator(chunk_size=chunk_size):
+        yield event.id, decompress_payload(event.payload_gz)
+
+
+# ----------------------------------------------------------------
+# Retention: export whole days to gzipped JSONL, then delete them
+# ----------------------------------------------------------------
+def archive_name(day):
+    return f"{ARCHIVE_PREFIX}/webhook-events-{day.isoformat()}.jsonl.gz"
+
+
+def export_day(day, chunk_size=1000):
+    """Write every event of `day` to one gzipped JSONL file in default storage and return its name."""
+    events = WebhookEvent.objects.filter(day=day)
+    fd, path = tempfile.mkstemp(suffix='.jsonl.gz')
+    os.close(fd)
+    try:
+        with gzip.open(path, 'wt', encoding='utf-8') as archive:
+            for event in events.order_by('id').iterator(chunk_size=chunk_size):
+                archive.write(json.dumps({
+                    'content_hash': event.content_hash,
+                    'account_id': event.account_id,
+                    'received_at': event.received_at.isoformat(),
+                    'payload': decompress_payload(event.payload_gz),
+                }, ensure_ascii=False) + '\n')
+        name = archive_name(day)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        with open(path, 'rb') as exported:
+            return default_storage.save(name, File(exported))
+    finally:
+        os.remove(path)
+
+
+def delete_day(day, chunk_size=1000):
+    """Delete the events of `day` in chunks so no single statement locks the whole day."""
+    deleted = 0
+    while True:
+        ids = list(WebhookEvent.objects.filter(day=day).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += WebhookEvent.objects.filter(id__in=ids).delete()[0]
+
+
+def expired_days(before):
+    return list(
+        WebhookEvent.objects.filter(day__lt=before).order_by('day').values_list('day', flat=True).distinct()
+    )
@@ -0,0 +1,28 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from whatsappAPI import journal
+
+
+class Command(BaseCommand):
+    help = "Export webhook journal days older than the retention window to gzipped JSONL and delete them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=getattr(settings, 'WHATSAPP_WEBHOOK_JOURNAL_RETENTION_DAYS', 90))
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Rows per DELETE")
+        parser.add_argument('--no-export', action='store_true', help="Delete expired days without exporting them")
+
+    def handle(self, *args, **options):
+        before = timezone.now().date() - timedelta(days=options['retention_days'])
+        days = journal.expired_days(before)
+        if not days:
+            self.stdout.write(f"No webhook journal days before {before}")
+            return
+
+        for day in days:
+            if not options['no_export']:
+                name = journal.export_day(day, options['chunk_size'])
+                self.stdout.write(f"Exported {day} to {name}")
+            deleted = journal.delete_day(day, options['chunk_size'])
+            self.stdout.write(f"Deleted {deleted} webhook event(s) of {day}")
@@ -0,0 +1,50 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from whatsappAPI import mediacache
+
+
+class Command(BaseCommand):
+    help = "Download media seen by the WhatsApp webhook into the local media cache before Meta's URLs expire"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when there is nothing to archive")
+        parser.add_argument('--once', action='store_true', help="Archive the pending media once and exit")
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        workers = max(1, options['workers'])
+        self.stdout.write(f"Starting {workers} media archive worker(s)")
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(self.run_worker, f"{socket.gethostname()}:{os.getpid()}:{n}", options)
+                for n in range(workers)
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            except KeyboardInterrupt:
+                self.stop.set()
+
+    def run_worker(self, worker_name, options):
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                jobs = mediacache.claim_archive_jobs(worker_name, options['batch_size'])
+                if not jobs:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                archived = sum(1 for cached in jobs if mediacache.archive(cached))
+                self.stdout.write(f"[{worker_name}] archived {archived}/{len(jobs)} media")
+        finally:
+            connection.close()
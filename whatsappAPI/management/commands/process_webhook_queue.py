@@ -0,0 +1,68 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from whatsappAPI import webhook_queue
+from whatsappAPI.ingestion import process_webhook_payload
+
+
+class Command(BaseCommand):
+    help = "Drain the WhatsApp webhook queue with a pool of background workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'WHATSAPP_WEBHOOK_QUEUE_WORKERS', 4))
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'WHATSAPP_WEBHOOK_QUEUE_BATCH_SIZE', 50))
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit")
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        workers = max(1, options['workers'])
+        self.stdout.write(f"Starting {workers} webhook worker(s)")
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(self.run_worker, f"{socket.gethostname()}:{os.getpid()}:{n}", options)
+                for n in range(workers)
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            except KeyboardInterrupt:
+                self.stop.set()
+
+        stats = webhook_queue.queue_stats()
+        self.stdout.write(f"Webhook queue: {stats['pending']} pending, {stats['failed']} failed, lag {stats['lag_seconds']}s")
+
+    def run_worker(self, worker_name, options):
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                items = webhook_queue.claim_webhooks(worker_name, options['batch_size'])
+                if not items:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                processed = []
+                for item in items:
+                    try:
+                        process_webhook_payload(item.payload)
+                        processed.append(item)
+                    except Exception as e:
+                        print(f"Error processing webhook {item.id}: {e}")
+                        webhook_queue.fail(item, e)
+                webhook_queue.complete(processed)
+
+                stats = webhook_queue.queue_stats()
+                self.stdout.write(
+                    f"[{worker_name}] processed {len(processed)}/{len(items)}, "
+                    f"{stats['pending']} pending, lag {stats['lag_seconds']}s"
+                )
+        finally:
+            connection.close()
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from whatsappAPI.inbox import recompute_inbox_summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized last message and unread count of every WhatsApp contact"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = recompute_inbox_summaries(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt inbox summaries for {updated} contact(s)"))
@@ -0,0 +1,39 @@
+import os
+import socket
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from whatsappAPI import outbox
+from whatsappAPI.fanout import FanoutBuffer
+
+
+class Command(BaseCommand):
+    help = "Publish committed real-time events from the outbox to the channel layer in coalesced batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--poll-interval', type=float, default=getattr(settings, 'WHATSAPP_FANOUT_WINDOW', 0.15), help="Seconds to wait for more events when the outbox is drained")
+        parser.add_argument('--once', action='store_true', help="Relay the pending events once and exit")
+
+    def handle(self, *args, **options):
+        worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        # Events gathered during one poll interval are coalesced into one
+        # frame per group, deltas are computed against what this relay sent
+        buffer = FanoutBuffer(window=0)
+        self.stdout.write(f"Starting outbox relay {worker_name}")
+
+        try:
+            while True:
+                close_old_connections()
+                events = outbox.claim_events(worker_name, options['batch_size'])
+                if events:
+                    outbox.relay(events, buffer)
+                if len(events) < options['batch_size']:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
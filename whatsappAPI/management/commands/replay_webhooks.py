@@ -0,0 +1,103 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+import django
+from django.core.management.base import BaseCommand, CommandError
+from whatsappAPI import replay
+from whatsappAPI.inbox import recompute_inbox_summaries
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay stored webhook payloads (the journal or a JSONL file) through the webhook ingestion "
+        "with a pool of processes. Replaying is idempotent; reports progress and messages/sec."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help="JSONL(.gz) file of payloads or archive records instead of the journal")
+        parser.add_argument('--since', type=date.fromisoformat, help="First journal day (YYYY-MM-DD)")
+        parser.add_argument('--until', type=date.fromisoformat, help="Last journal day (YYYY-MM-DD)")
+        parser.add_argument('--account', help="Only payloads of this WhatsApp Business Account id")
+        parser.add_argument('--workers', type=int, default=4, help="Worker processes, 1 replays in this process")
+        parser.add_argument('--chunk-size', type=int, default=100, help="Payloads per task")
+        parser.add_argument('--rebuild-inbox', action='store_true', help="Recompute the inbox summaries afterwards")
+
+    def handle(self, *args, **options):
+        if options['file'] and (options['since'] or options['until'] or options['account']):
+            raise CommandError("--since, --until and --account only apply to the journal")
+        if options['file']:
+            payloads = replay.file_payloads(options['file'])
+        else:
+            payloads = replay.journal_payloads(options['since'], options['until'], options['account'])
+        chunks = replay.chunked(payloads, max(1, options['chunk_size']))
+        workers = max(1, options['workers'])
+
+        self.totals = {'payloads': 0, 'messages': 0, 'new_messages': 0, 'statuses': 0, 'errors': 0, 'seconds': 0.0}
+        self.started = time.monotonic()
+        if workers == 1:
+            retry = self.replay_inline(chunks)
+        else:
+            retry = self.replay_pool(chunks, workers)
+
+        if retry:
+            # Statuses whose message was replayed concurrently by another worker
+            stats, retry = replay.replay_chunk(retry)
+            self.totals['new_messages'] += stats['new_messages']
+            self.totals['errors'] += stats['errors']
+            self.stdout.write(f"Replayed {stats['payloads']} payload(s) again for statuses of later messages")
+
+        elapsed = time.monotonic() - self.started
+        totals = self.totals
+        per_worker = totals['messages'] / totals['seconds'] if totals['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {totals['payloads']} payload(s): {totals['messages']} message(s) "
+            f"({totals['new_messages']} new), {totals['statuses']} status(es), {totals['errors']} error(s) "
+            f"in {elapsed:.1f}s with {workers} worker(s), "
+            f"{totals['messages'] / elapsed if elapsed else 0:.0f} msg/s, {per_worker:.0f} msg/s per worker"
+        ))
+
+        if options['rebuild_inbox']:
+            updated = recompute_inbox_summaries()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt inbox summaries for {updated} contact(s)"))
+
+    def replay_inline(self, chunks):
+        retry = []
+        for chunk in chunks:
+            stats, chunk_retry = replay.replay_chunk(chunk)
+            retry += chunk_retry
+            self.report(stats)
+        return retry
+
+    def replay_pool(self, chunks, workers):
+        retry = []
+        # Spawned rather than forked so workers open their own database connections
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+            pending = set()
+            for chunk in chunks:
+                pending.add(pool.submit(replay.replay_chunk, chunk))
+                # Keep a couple of chunks per worker in flight, not the whole source
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    retry += self.collect(done)
+            retry += self.collect(pending)
+        return retry
+
+    def collect(self, futures):
+        retry = []
+        for future in futures:
+            stats, chunk_retry = future.result()
+            retry += chunk_retry
+            self.report(stats)
+        return retry
+
+    def report(self, stats):
+        for key, value in stats.items():
+            self.totals[key] += value
+        elapsed = time.monotonic() - self.started
+        rate = self.totals['messages'] / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{self.totals['payloads']} payload(s), {self.totals['messages']} message(s), "
+            f"{self.totals['errors']} error(s), {rate:.0f} msg/s"
+        )
@@ -0,0 +1,47 @@
+import os
+import socket
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from whatsappAPI import broadcast
+
+
+class Command(BaseCommand):
+    help = "Send queued WhatsApp template broadcasts with bounded concurrency under a messages-per-second ceiling"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=getattr(settings, 'WHATSAPP_BROADCAST_RATE', 20), help="Maximum messages per second for this worker")
+        parser.add_argument('--concurrency', type=int, default=getattr(settings, 'WHATSAPP_BROADCAST_CONCURRENCY', 10), help="Maximum in-flight Graph API requests")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when there is nothing to send")
+        parser.add_argument('--once', action='store_true', help="Send everything queued once and exit")
+
+    def handle(self, *args, **options):
+        if options['rate'] and options['rate'] < broadcast.min_rate():
+            raise CommandError(f"--rate must be at least {broadcast.min_rate():.4f} msg/s for the claims to be refreshed in time")
+        worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        # Shared across batches so the ceiling holds between them too
+        limiter = broadcast.RateLimiter(options['rate'])
+        self.stdout.write(f"Starting broadcast worker at {options['rate']} msg/s, concurrency {options['concurrency']}")
+
+        try:
+            while True:
+                close_old_connections()
+                for template_id in broadcast.start_queued_broadcasts():
+                    self.stdout.write(f"Started broadcast {template_id}")
+
+                recipients = broadcast.claim_recipients(worker_name, options['batch_size'])
+                if not recipients:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                broadcast.send_batch(recipients, limiter, options['concurrency'])
+                sent = sum(1 for recipient in recipients if recipient.status == 'sent')
+                self.stdout.write(f"[{worker_name}] sent {sent}/{len(recipients)}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
@@ -0,0 +1,40 @@
+import os
+import socket
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from whatsappAPI import outbound
+
+
+class Command(BaseCommand):
+    help = "Send queued agent messages to the WhatsApp API, retrying failures with backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=getattr(settings, 'WHATSAPP_OUTBOUND_CONCURRENCY', 10), help="Maximum in-flight Graph API requests")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--poll-interval', type=float, default=0.2, help="Seconds to sleep when there is nothing to send")
+        parser.add_argument('--once', action='store_true', help="Send everything due once and exit")
+
+    def handle(self, *args, **options):
+        worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Starting outbound message worker, concurrency {options['concurrency']}")
+
+        try:
+            while True:
+                close_old_connections()
+                items = outbound.claim_outbound(worker_name, options['batch_size'])
+                if not items:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                outbound.send_batch(items, options['concurrency'])
+                sent = sum(1 for item in items if item.status == 'sent')
+                retrying = sum(1 for item in items if item.status == 'pending')
+                self.stdout.write(f"[{worker_name}] sent {sent}/{len(items)}, {retrying} to retry")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
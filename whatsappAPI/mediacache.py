@@ -0,0 +1,202 @@
+import hashlib
+import tempfile
+from datetime import timedelta
+import httpx
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import InvalidStorageError, default_storage, storages
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from .client import whatsapp_client
+from .models import CachedMedia
+from utils import claim_batch
+
+# Blobs live in shared storage, every web and worker process sees them
+BLOB_PREFIX = 'whatsapp_media'
+MAX_BYTES = getattr(settings, 'WHATSAPP_MEDIA_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024)
+# Evicting down to a low-water mark keeps eviction from running on every store
+LOW_WATER_RATIO = 0.9
+# Recording every cache hit would turn reads into writes, so LRU recency
+# is only refreshed when the previous access is older than this
+TOUCH_INTERVAL = timedelta(minutes=1)
+CLAIM_TIMEOUT = timedelta(minutes=5)
+MAX_ATTEMPTS = 5
+
+
+class MediaFetchError(Exception):
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def media_storage():
+    """
+    Storage of the cached blobs: the "whatsapp_media" storage when
+    configured (private S3 objects), else the default storage.
+    """
+    try:
+        return storages['whatsapp_media']
+    except InvalidStorageError:
+        return default_storage
+
+
+def blob_name(sha256):
+    return f'{BLOB_PREFIX}/{sha256[:2]}/{sha256}'
+
+
+def store_blob(sha256, content):
+    """Save `content` (a file) as the blob of sha256 unless it is already stored."""
+    storage = media_storage()
+    name = blob_name(sha256)
+    if storage.exists(name):
+        return
+    content.seek(0)
+    saved = storage.save(name, File(content))
+    if saved != name:
+        # Another process stored the same content in the meantime
+        storage.delete(saved)
+
+
+def open_blob(sha256):
+    return media_storage().open(blob_name(sha256), 'rb')
+
+
+# ----------------------------------------------------------------
+# Download a media object from the Graph API into the cache
+# ----------------------------------------------------------------
+def fetch_and_store(media_id):
+    if not getattr(settings, 'WHATSAPP_ACCESS_TOKEN', None):
+        raise MediaFetchError('WhatsApp access token not configured')
+
+    # Step 1: Fetch media metadata (the download URL is short-lived)
+    try:
+        response = whatsapp_client.get_media_info(media_id)
+    except httpx.HTTPError as e:
+        raise MediaFetchError(f'Failed to connect to WhatsApp API: {e}')
+    if response.status_code == 404:
+        raise MediaFetchError('Media not found', 404)
+    if response.status_code == 401:
+        raise MediaFetchError('Unauthorized access to WhatsApp API', 401)
+    if response.status_code != 200:
+        raise MediaFetchError(f'WhatsApp API error: {response.status_code}')
+    try:
+        media = response.json()
+    except ValueError:
+        raise MediaFetchError('Invalid response from WhatsApp API')
+    media_url = media.get('url')
+    if not media_url:
+        raise MediaFetchError('Media URL not found in response', 404)
+
+    # Step 2: Stream the content to a temporary file, hashing as we go
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.TemporaryFile(prefix='whatsapp-media-') as tmp:
+        try:
+            with whatsapp_client.stream(media_url) as content:
+                if content.status_code != 200:
+                    raise MediaFetchError('Failed to fetch media content', 404)
+                for chunk in content.iter_bytes(chunk_size=64 * 1024):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    tmp.write(chunk)
+        except httpx.HTTPError as e:
+            raise MediaFetchError(f'Failed to fetch media content: {e}')
+        sha256 = digest.hexdigest()
+        # Identical content is stored once whatever media id it came from
+        store_blob(sha256, tmp)
+
+    cached, _ = CachedMedia.objects.update_or_create(
+        media_id=media_id,
+        defaults={
+            'sha256': sha256,
+            'mime_type': media.get('mime_type') or '',
+            'size': size,
+            'status': 'ready',
+            'claimed_by': '',
+            'claimed_at': None,
+            'last_error': '',
+            'last_accessed_at': timezone.now(),
+        },
+    )
+    evict()
+    return cached
+
+
+# ----------------------------------------------------------------
+# Cache lookups
+# ----------------------------------------------------------------
+def get_cached(media_id):
+    cached = CachedMedia.objects.filter(media_id=media_id, status='ready').first()
+    # A ready row is only written once its blob is stored
+    if not cached:
+        return None
+    now = timezone.now()
+    if now - cached.last_accessed_at > TOUCH_INTERVAL:
+        CachedMedia.objects.filter(pk=cached.pk).update(last_accessed_at=now)
+    return cached
+
+
+def get_or_fetch(media_id):
+    return get_cached(media_id) or fetch_and_store(media_id)
+
+
+# ----------------------------------------------------------------
+# Size-bounded LRU eviction
+# ----------------------------------------------------------------
+def evict(max_bytes=MAX_BYTES):
+    ready = CachedMedia.objects.filter(status='ready')
+    total = ready.aggregate(total=Sum('size'))['total'] or 0
+    if total <= max_bytes:
+        return 0
+
+    evicted = 0
+    target = max_bytes * LOW_WATER_RATIO
+    for cached in ready.order_by('last_accessed_at').only('id', 'sha256', 'size').iterator():
+        if total <= target:
+            break
+        CachedMedia.objects.filter(pk=cached.pk).delete()
+        if not CachedMedia.objects.filter(sha256=cached.sha256, status='ready').exists():
+            media_storage().delete(blob_name(cached.sha256))
+        total -= cached.size
+        evicted += 1
+    return evicted
+
+
+# ----------------------------------------------------------------
+# Eager archiving of media seen by the webhook
+# ----------------------------------------------------------------
+def enqueue_archive(media_ids):
+    media_ids = {media_id for media_id in media_ids if media_id}
+    if media_ids:
+        CachedMedia.objects.bulk_create(
+            [CachedMedia(media_id=media_id) for media_id in media_ids],
+            ignore_conflicts=True,
+        )
+
+
+def claim_archive_jobs(worker_name, batch_size):
+    now = timezone.now()
+    claimable = Q(status='pending') | Q(status='processing', claimed_at__lt=now - CLAIM_TIMEOUT)
+    return claim_batch(
+        CachedMedia.objects.filter(claimable),
+        worker_name,
+        batch_size,
+        status='processing',
+        attempts=F('attempts') + 1,
+    )
+
+
+def archive(cached):
+    try:
+        fetch_and_store(cached.media_id)
+        return True
+    except MediaFetchError as e:
+        # Missing media will not come back, anything else is retried
+        failed = e.status_code == 404 or cached.attempts >= MAX_ATTEMPTS
+        CachedMedia.objects.filter(pk=cached.pk).update(
+            status='failed' if failed else 'pending',
+            claimed_by='',
+            claimed_at=None,
+            last_error=str(e),
+        )
+        return False
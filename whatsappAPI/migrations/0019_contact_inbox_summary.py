@@ -0,0 +1,67 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:34
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_inbox_summary(apps, schema_editor):
+    Contact = apps.get_model('whatsappAPI', 'Contact')
+    WAMessage = apps.get_model('whatsappAPI', 'WAMessage')
+    latest = WAMessage.objects.filter(contact=OuterRef('pk')).order_by('-timestamp', '-id')
+    unread = (
+        WAMessage.objects.filter(contact=OuterRef('pk'), message_mode='received', seen=False)
+        .order_by()
+        .values('contact')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    Contact.objects.update(
+        last_message_pk=Subquery(latest.values('id')[:1]),
+        last_message_message_id=Coalesce(Subquery(latest.values('message_id')[:1]), Value('')),
+        last_message_type=Coalesce(Subquery(latest.values('message_type')[:1]), Value('')),
+        last_message_body=Coalesce(Subquery(latest.values('body')[:1]), Value('')),
+        last_message_at=Subquery(latest.values('timestamp')[:1]),
+        unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsappAPI', '0018_webhookqueueitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='last_message_body',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='last_message_message_id',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='last_message_pk',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='last_message_type',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_inbox_summary, migrations.RunPython.noop),
+    ]
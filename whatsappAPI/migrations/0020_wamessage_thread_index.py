@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsappAPI', '0019_contact_inbox_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='wamessage',
+            index=models.Index(fields=['contact', 'timestamp', 'id'], name='wa_message_thread_idx'),
+        ),
+    ]
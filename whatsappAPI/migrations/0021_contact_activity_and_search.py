@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:36
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Coalesce
+
+
+def backfill_last_activity(apps, schema_editor):
+    Contact = apps.get_model('whatsappAPI', 'Contact')
+    Contact.objects.update(last_activity_at=Coalesce(F('last_message_at'), F('last_activity_at')))
+
+
+# Contact search indexes: trigram (substring) on PostgreSQL, case-insensitive
+# prefix indexes on SQLite (DEBUG_ENV)
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS wa_contact_name_trgm ON "whatsappAPI_contact" '
+            'USING gin (UPPER(profile_name) gin_trgm_ops)'
+        )
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS wa_contact_waid_trgm ON "whatsappAPI_contact" '
+            'USING gin (wa_id gin_trgm_ops)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS wa_contact_name_nocase ON "whatsappAPI_contact" (profile_name COLLATE NOCASE)'
+        )
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS wa_contact_waid_nocase ON "whatsappAPI_contact" (wa_id COLLATE NOCASE)'
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    for name in ('wa_contact_name_trgm', 'wa_contact_waid_trgm', 'wa_contact_name_nocase', 'wa_contact_waid_nocase'):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsappAPI', '0020_wamessage_thread_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['last_activity_at', 'id'], name='wa_contact_activity_idx'),
+        ),
+        migrations.RunPython(backfill_last_activity, migrations.RunPython.noop),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
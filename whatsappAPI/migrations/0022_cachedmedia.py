@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsappAPI', '0021_contact_activity_and_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedMedia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('media_id', models.CharField(max_length=100, unique=True)),
+                ('sha256', models.CharField(blank=True, db_index=True, default='', max_length=64)),
+                ('mime_type', models.CharField(blank=True, default='', max_length=100)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('claimed_by', models.CharField(blank=True, default='', max_length=64)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_accessed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'last_accessed_at'], name='wa_media_lru_idx')],
+            },
+        ),
+    ]
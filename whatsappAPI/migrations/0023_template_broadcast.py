@@ -0,0 +1,78 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsappAPI', '0022_cachedmedia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watemplateschema',
+            name='audience',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='watemplateschema',
+            name='broadcast_completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='watemplateschema',
+            name='broadcast_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='watemplateschema',
+            name='failed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='watemplateschema',
+            name='language_code',
+            field=models.CharField(default='en_US', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='watemplateschema',
+            name='sent_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='watemplateschema',
+            name='template_name',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Approved Template Name'),
+        ),
+        migrations.AddField(
+            model_name='watemplateschema',
+            name='total_recipients',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='watemplateschema',
+            name='status',
+            field=models.CharField(blank=True, choices=[('pending', 'pending'), ('queued', 'queued'), ('sending', 'sending'), ('sent', 'sent'), ('failed', 'failed')], default='pending', max_length=255),
+        ),
+        migrations.CreateModel(
+            name='BroadcastRecipient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('wa_id', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('message_id', models.CharField(blank=True, default='', max_length=100)),
+                ('error', models.TextField(blank=True, default='')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('claimed_by', models.CharField(blank=True, default='', max_length=64)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('template', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='whatsappAPI.watemplateschema')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='wa_broadcast_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('template', 'wa_id'), name='wa_broadcast_recipient_unique')],
+            },
+        ),
+    ]
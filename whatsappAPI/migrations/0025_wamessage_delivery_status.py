@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:53
+
+from django.db import migrations, models
+from django.db.models import Exists, Max, OuterRef, Subquery
+
+# Mirrors whatsappAPI.receipts.DELIVERY_RANKS
+DELIVERY_RANKS = {'sent': 1, 'failed': 2, 'delivered': 3, 'read': 4}
+
+
+def backfill_delivery_status(apps, schema_editor):
+    WAMessage = apps.get_model('whatsappAPI', 'WAMessage')
+    Status = apps.get_model('whatsappAPI', 'Status')
+    # Apply the statuses from the least to the most advanced, each one
+    # overwriting the earlier ones
+    for status, _ in sorted(DELIVERY_RANKS.items(), key=lambda item: item[1]):
+        received = Status.objects.filter(message=OuterRef('pk'), status=status)
+        latest_at = received.order_by().values('message').annotate(latest=Max('timestamp')).values('latest')
+        WAMessage.objects.filter(Exists(received)).update(
+            delivery_status=status,
+            delivery_updated_at=Subquery(latest_at),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsappAPI', '0024_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wamessage',
+            name='delivery_status',
+            field=models.CharField(blank=True, choices=[('sent', 'Sent'), ('delivered', 'Delivered'), ('read', 'Read'), ('failed', 'Failed')], default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='wamessage',
+            name='delivery_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='kind',
+            field=models.CharField(choices=[('contact', 'Contact'), ('message', 'Message'), ('receipt', 'Delivery receipt')], max_length=20),
+        ),
+        migrations.RunPython(backfill_delivery_status, migrations.RunPython.noop),
+    ]
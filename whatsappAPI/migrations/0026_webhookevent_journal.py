@@ -0,0 +1,82 @@
+import gzip
+import hashlib
+import json
+
+import whatsappAPI.models
+from django.db import migrations, models
+
+
+def compress_existing_events(apps, schema_editor):
+    # Same encoding as whatsappAPI.journal
+    WebhookEvent = apps.get_model('whatsappAPI', 'WebhookEvent')
+    seen = set()
+    for event in WebhookEvent.objects.order_by('id').iterator(chunk_size=500):
+        data = json.dumps(event.payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
+        if content_hash in seen:
+            event.delete()
+            continue
+        seen.add(content_hash)
+        event.content_hash = content_hash
+        event.account_id = event.event_id
+        event.payload_gz = gzip.compress(data)
+        event.day = event.received_at.date()
+        event.save(update_fields=['content_hash', 'account_id', 'payload_gz', 'day'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsappAPI', '0025_wamessage_delivery_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookevent',
+            name='content_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='account_id',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='payload_gz',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='day',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(compress_existing_events, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='webhookevent',
+            name='event_id',
+        ),
+        migrations.RemoveField(
+            model_name='webhookevent',
+            name='payload',
+        ),
+        migrations.AlterField(
+            model_name='webhookevent',
+            name='content_hash',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='webhookevent',
+            name='payload_gz',
+            field=models.BinaryField(),
+        ),
+        migrations.AlterField(
+            model_name='webhookevent',
+            name='day',
+            field=models.DateField(default=whatsappAPI.models.journal_day),
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(fields=['day', 'id'], name='wa_webhookevent_day_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:02
+
+from django.db import migrations
+
+
+# Full-text index of WAMessage body and caption, kept up to date by the
+# database on every insert/update: a generated tsvector column with a GIN
+# index on PostgreSQL, an external-content FTS5 table maintained by
+# triggers on SQLite (DEBUG_ENV). Queried by whatsappAPI.search.search_messages
+# SQLite drops the triggers when Django rebuilds the table, a later migration
+# altering WAMessage has to run create_fulltext_index again
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE "whatsappAPI_wamessage" ADD COLUMN IF NOT EXISTS search_vector tsvector '
+            "GENERATED ALWAYS AS (to_tsvector('simple', coalesce(body, '') || ' ' || coalesce(caption, ''))) STORED"
+        )
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS wa_message_search_gin ON "whatsappAPI_wamessage" USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS wa_message_fts USING fts5('
+            "body, caption, content='whatsappAPI_wamessage', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            'CREATE TRIGGER IF NOT EXISTS wa_message_fts_insert AFTER INSERT ON "whatsappAPI_wamessage" BEGIN '
+            'INSERT INTO wa_message_fts(rowid, body, caption) VALUES (new.id, new.body, new.caption); END'
+        )
+        schema_editor.execute(
+            'CREATE TRIGGER IF NOT EXISTS wa_message_fts_delete AFTER DELETE ON "whatsappAPI_wamessage" BEGIN '
+            "INSERT INTO wa_message_fts(wa_message_fts, rowid, body, caption) VALUES ('delete', old.id, old.body, old.caption); END"
+        )
+        schema_editor.execute(
+            'CREATE TRIGGER IF NOT EXISTS wa_message_fts_update AFTER UPDATE OF body, caption ON "whatsappAPI_wamessage" BEGIN '
+            "INSERT INTO wa_message_fts(wa_message_fts, rowid, body, caption) VALUES ('delete', old.id, old.body, old.caption); "
+            'INSERT INTO wa_message_fts(rowid, body, caption) VALUES (new.id, new.body, new.caption); END'
+        )
+        # Index the existing messages
+        schema_editor.execute("INSERT INTO wa_message_fts(wa_message_fts) VALUES ('rebuild')")
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS wa_message_search_gin')
+        schema_editor.execute('ALTER TABLE "whatsappAPI_wamessage" DROP COLUMN IF EXISTS search_vector')
+    elif vendor == 'sqlite':
+        for trigger in ('wa_message_fts_insert', 'wa_message_fts_delete', 'wa_message_fts_update'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        schema_editor.execute('DROP TABLE IF EXISTS wa_message_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsappAPI', '0026_webhookevent_journal'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
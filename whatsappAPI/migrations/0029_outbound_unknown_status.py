@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsappAPI', '0028_outboundmessage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboundmessage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('sent', 'Sent'), ('failed', 'Failed'), ('unknown', 'Unknown')], default='pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='wamessage',
+            name='status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed'), ('unknown', 'Unknown')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsappAPI', '0029_outbound_unknown_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='broadcastrecipient',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('sent', 'Sent'), ('failed', 'Failed'), ('unknown', 'Unknown')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:16
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsappAPI', '0030_broadcast_unknown_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookqueueitem',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,18 +1,27 @@
-from django.db import models
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from django.utils.dateformat import DateFormat
-from django.conf import settings
-
-DEBUG_MODE = settings.DEBUG_ENV
+from django.db import models, transaction
+from django.utils import timezone
 
 class Contact(models.Model):
     wa_id = models.CharField(max_length=50, unique=True)
     profile_name = models.CharField(max_length=255, blank=True, null=True)
+    # Inbox summary, denormalized from WAMessage (see whatsappAPI.inbox)
+    last_message_pk = models.BigIntegerField(blank=True, null=True)
+    last_message_message_id = models.CharField(max_length=100, blank=True, default='')
+    last_message_type = models.CharField(max_length=20, blank=True, default='')
+    last_message_body = models.TextField(blank=True, default='')
+    last_message_at = models.DateTimeField(blank=True, null=True)
+    unread_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return self.profile_name or self.wa_id
 
+    class Meta:
+        indexes = [
+            # Inbox sidebar: most recently active contacts first
+            models.Index(fields=['last_activity_at', 'id'], name='wa_contact_activity_idx'),
+        ]
+
 
 MESSAGE_TYPES = [
         ('text', 'Text'),
@@ -28,6 +37,13 @@ MESSAGE_MODES = [
     ('sent', 'sent'),
 ]
 
+DELIVERY_STATUSES = [
+    ('sent', 'Sent'),
+    ('delivered', 'Delivered'),
+    ('read', 'Read'),
+    ('failed', 'Failed'),
+]
+
 class WAMessage(models.Model):
     message_id = models.CharField(max_length=100, unique=True)
     contact = models.ForeignKey('Contact', related_name='messages', on_delete=models.CASCADE)
@@ -41,90 +57,33 @@ class WAMessage(models.Model):
     link = models.URLField(blank=True, default='https://www.example.com')  # For sent media messages
     message_mode = models.CharField(max_length=20, choices=MESSAGE_MODES, default='received')
     seen = models.BooleanField(default=False)  # For received messages
-    status = models.CharField(max_length=20, choices=[("pending", "Pending"), ("sent", "Sent")], blank=True, default='pending')  # Only for sent messages
+    status = models.CharField(max_length=20, choices=[("pending", "Pending"), ("sent", "Sent"), ("failed", "Failed"), ("unknown", "Unknown")], blank=True, default='pending')  # Only for sent messages
+    # Latest delivery receipt, only ever moves forward (see whatsappAPI.receipts)
+    delivery_status = models.CharField(max_length=20, choices=DELIVERY_STATUSES, blank=True, default='')
+    delivery_updated_at = models.DateTimeField(blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.contact}: {self.message_type} ({self.message_mode})"
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a conversation (newest first)
+            models.Index(fields=['contact', 'timestamp', 'id'], name='wa_message_thread_idx'),
+        ]
+
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-
-        if DEBUG_MODE and self.message_mode == 'received':
-            # Get the last message (which is this current one being saved)
-            last_message = WAMessage.objects.filter(contact=self.contact, message_mode='received').order_by('-timestamp').first()
-
-            if last_message:
-                # Manually serialize the last message
-                serialized_message = {
-                    'id': last_message.pk,
-                    'message_id': last_message.message_id,
-                    'contact': last_message.contact.id,
-                    'message_type': last_message.message_type,
-                    'body': last_message.body,
-                    'media_id': last_message.media_id,
-                    'mime_type': last_message.mime_type,
-                    'filename': last_message.filename,
-                    'animated': last_message.animated,
-                    'caption': last_message.caption,
-                    'link': last_message.link,
-                    'message_mode': last_message.message_mode,
-                    'seen': last_message.seen,
-                    'status': last_message.status,
-                    'timestamp': DateFormat(last_message.timestamp).format('Y-m-d H:i:s'),
-                }
-
-
-                # Manually serialize the contact
-                serialized_contact = {
-                    'id': self.contact.id,
-                    'wa_id': self.contact.wa_id,
-                    'profile_name': self.contact.profile_name,
-                    'last_message': self.get_last_message(last_message),  # Use the last message directly
-                    'unread_message_count': self.get_unread_message_count(self.contact)
-                }
-
-                print("am working now", serialized_contact)
-
-                # Send the message to the appropriate WebSocket room
-                room_name = 'whatsappapi_messages'
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    room_name,
-                    {
-                        'type': 'chat_message',
-                        'operation': "create",
-                        'contact': serialized_contact,
-                        'message': serialized_message
-                    }
-                )
-
-                # Send an update to the general contacts room
-                general_room_name = 'whatsappapi_contacts'
-                async_to_sync(channel_layer.group_send)(
-                    general_room_name,
-                    {
-                        'type': 'chat_message',
-                        'operation': "create",
-                        'contact': serialized_contact
-                    }
-                )
-
-
-    # Utility functions for manually serializing the contact
-    def get_last_message(self, last_message):
-        if last_message:
-            return {
-                'id': last_message.id,
-                'message_id': last_message.message_id,
-                'message_type': last_message.message_type,
-                'body': last_message.body,
-                'timestamp': DateFormat(last_message.timestamp).format('Y-m-d H:i:s')
-            }
-        return None
-
-    def get_unread_message_count(self, contact):
-        return WAMessage.objects.filter(contact=contact, message_mode='received',  seen=False).count()
+        adding = self._state.adding
+        # The inbox summary and the real-time events commit (or roll back)
+        # together with the message
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if adding:
+                from .inbox import record_new_messages
+                from .outbox import record_messages
+                record_new_messages([self])
+                record_messages([self])
 
 
 class Status(models.Model):
@@ -138,15 +97,89 @@ class Status(models.Model):
     def __str__(self):
         return f"{self.contact}: {self.message_type}"
 
+def journal_day():
+    return timezone.now().date()
+
+# Append-only journal of webhook payloads (see whatsappAPI.journal), one row
+# per distinct payload, gzip-compressed and rolled by day for retention
 class WebhookEvent(models.Model):
-    event_id = models.CharField(max_length=100, unique=True)
+    content_hash = models.CharField(max_length=64, unique=True)
+    account_id = models.CharField(max_length=100, blank=True, default='')  # WABA id of the first entry
+    payload_gz = models.BinaryField()
+    day = models.DateField(default=journal_day)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.day} {self.content_hash[:12]}"
+
+    @property
+    def payload(self):
+        from .journal import decompress_payload
+        return decompress_payload(self.payload_gz)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day', 'id'], name='wa_webhookevent_day_idx'),
+        ]
+
+
+WEBHOOK_QUEUE_STATUS = [
+    ('pending', 'Pending'),
+    ('processing', 'Processing'),
+    ('failed', 'Failed'),
+]
+
+# Raw webhook payloads waiting to be ingested by the background workers
+class WebhookQueueItem(models.Model):
     payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=WEBHOOK_QUEUE_STATUS, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_by = models.CharField(max_length=64, blank=True, default='')
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+    next_attempt_at = models.DateTimeField(default=timezone.now)
     received_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return self.event_id
+        return f"Webhook {self.pk} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='wa_webhookqueue_status_idx'),
+        ]
     
 
+MEDIA_CACHE_STATUS = [
+    ('pending', 'Pending'),
+    ('processing', 'Processing'),
+    ('ready', 'Ready'),
+    ('failed', 'Failed'),
+]
+
+# Media downloaded from the Graph API into the shared content-addressed cache
+# (see whatsappAPI.mediacache). Several media ids can share one blob.
+class CachedMedia(models.Model):
+    media_id = models.CharField(max_length=100, unique=True)
+    sha256 = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    mime_type = models.CharField(max_length=100, blank=True, default='')
+    size = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=MEDIA_CACHE_STATUS, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_by = models.CharField(max_length=64, blank=True, default='')
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.media_id} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'last_accessed_at'], name='wa_media_lru_idx'),
+        ]
+
+
 # Tuple representing the message types (TEMPLATE_NAMES)
 TEMPLATE_NAMES = [
     ("textonly", "Text Only"),
@@ -157,7 +190,9 @@ TEMPLATE_NAMES = [
     ("textwithCTA", "Text with Call to Action (CTA)")
 ]
 
-MESSAGE_status = [("pending","pending"),("sent","sent"),("failed","failed")]
+MESSAGE_status = [("pending","pending"),("queued","queued"),("sending","sending"),("sent","sent"),("failed","failed")]
+
+BROADCAST_AUDIENCES = [("all","All contacts"),("list","List of WhatsApp IDs"),("query","Contact search")]
 
 
 # Model representing the template schema
@@ -168,6 +203,15 @@ class WATemplateSchema(models.Model):
     link = models.URLField(blank=True,null=True,verbose_name="Optional Link")
     status = models.CharField(max_length=255, blank=True, choices=MESSAGE_status , default="pending")
     created_at = models.DateTimeField(auto_now_add=True,verbose_name="Created At")
+    # Broadcast job (see whatsappAPI.broadcast)
+    template_name = models.CharField(max_length=255, blank=True, default='', verbose_name="Approved Template Name")
+    language_code = models.CharField(max_length=20, default="en_US")
+    audience = models.JSONField(blank=True, null=True)
+    total_recipients = models.PositiveIntegerField(default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    broadcast_started_at = models.DateTimeField(blank=True, null=True)
+    broadcast_completed_at = models.DateTimeField(blank=True, null=True)
 
     def __str__(self):
         return f"{self.template} Template"
@@ -177,3 +221,87 @@ class WATemplateSchema(models.Model):
         verbose_name_plural = "WhatsApp Templates"
 
 
+BROADCAST_RECIPIENT_STATUS = [
+    ('pending', 'Pending'),
+    ('processing', 'Processing'),
+    ('sent', 'Sent'),
+    ('failed', 'Failed'),
+    # The request went out without a response, not retried to avoid sending twice
+    ('unknown', 'Unknown'),
+]
+
+# One row per recipient of a template broadcast, claimed in batches by the
+# send_broadcasts workers
+class BroadcastRecipient(models.Model):
+    template = models.ForeignKey(WATemplateSchema, related_name='recipients', on_delete=models.CASCADE)
+    wa_id = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=BROADCAST_RECIPIENT_STATUS, default='pending')
+    message_id = models.CharField(max_length=100, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_by = models.CharField(max_length=64, blank=True, default='')
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.wa_id} ({self.status})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['template', 'wa_id'], name='wa_broadcast_recipient_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'id'], name='wa_broadcast_status_idx'),
+        ]
+
+
+OUTBOX_KINDS = [
+    ('contact', 'Contact'),
+    ('message', 'Message'),
+    ('receipt', 'Delivery receipt'),
+]
+
+# Real-time events written in the same transaction as the change they
+# describe, published to the channel layer by `manage.py relay_outbox`
+class OutboxEvent(models.Model):
+    kind = models.CharField(max_length=20, choices=OUTBOX_KINDS)
+    payload = models.JSONField()
+    claimed_by = models.CharField(max_length=64, blank=True, default='')
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} event {self.pk}"
+
+
+OUTBOUND_STATUS = [
+    ('pending', 'Pending'),
+    ('processing', 'Processing'),
+    ('sent', 'Sent'),
+    ('failed', 'Failed'),
+    # The request went out without a response, not retried to avoid sending twice
+    ('unknown', 'Unknown'),
+]
+
+# Message written by an agent, stored before it is sent to the Graph API by
+# `manage.py send_outbound_messages`. The idempotency key makes client
+# retries return the same message instead of sending it twice
+class OutboundMessage(models.Model):
+    message = models.OneToOneField(WAMessage, related_name='outbound', on_delete=models.CASCADE)
+    idempotency_key = models.CharField(max_length=100, unique=True)
+    payload = models.JSONField()  # Graph API request body
+    status = models.CharField(max_length=20, choices=OUTBOUND_STATUS, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=64, blank=True, default='')
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Outbound {self.idempotency_key} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='wa_outbound_status_idx'),
+        ]
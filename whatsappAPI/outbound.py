@@ -0,0 +1,222 @@
+import asyncio
+import random
+import uuid
+from datetime import timedelta
+import httpx
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .client import RETRY_EXCEPTIONS, RETRY_STATUSES, whatsapp_client
+from .models import Contact, OutboundMessage, WAMessage
+from .outbox import record_receipts
+from utils import claim_batch, refresh_claim
+
+MAX_ATTEMPTS = getattr(settings, 'WHATSAPP_OUTBOUND_MAX_ATTEMPTS', 5)
+# Base and ceiling (seconds) of the backoff between attempts of a message
+RETRY_BACKOFF = getattr(settings, 'WHATSAPP_OUTBOUND_BACKOFF', 2.0)
+MAX_RETRY_BACKOFF = 300.0
+# Prefix of the message_id of a message Meta has not accepted yet
+PENDING_PREFIX = 'pending.'
+
+
+# ----------------------------------------------------------------
+# Queueing a message (send endpoint)
+# ----------------------------------------------------------------
+def build_payload(wa_id, message):
+    """Graph API request body for an agent's message, raising ValueError when a required field is missing."""
+    message_type = message.get('message_type', 'text')
+    data = {
+        "messaging_product": "whatsapp",
+        "to": wa_id,
+        "type": message_type,
+    }
+    if message_type == 'text':
+        body = (message.get('body') or '').strip()
+        if not body:
+            raise ValueError('Message body is required for text messages')
+        data["text"] = {"body": body}
+    elif message_type in ['image', 'document']:
+        link = (message.get('link') or '').strip()
+        if not link:
+            raise ValueError(f'Link is required for {message_type} messages')
+        data[message_type] = {
+            "link": link,
+            "caption": message.get('caption', '')
+        }
+    else:
+        raise ValueError(f'Unsupported message type: {message_type}')
+    return data
+
+
+def queue_message(contact, message, idempotency_key=None):
+    """
+    Store an agent's message as pending together with its send request.
+    Returns (WAMessage, created); a known idempotency key returns the
+    message stored by the first request.
+    """
+    payload = build_payload(contact.wa_id, message)
+    idempotency_key = idempotency_key or uuid.uuid4().hex
+    existing = OutboundMessage.objects.filter(idempotency_key=idempotency_key).select_related('message').first()
+    if existing:
+        return existing.message, False
+    try:
+        with transaction.atomic():
+            sent_message = WAMessage.objects.create(
+                message_id=f'{PENDING_PREFIX}{uuid.uuid4().hex}',
+                contact=contact,
+                message_type=payload['type'],
+                body=message.get('body', ''),
+                caption=message.get('caption', ''),
+                link=message.get('link', ''),
+                message_mode=message.get('message_mode') or 'sent',
+                status='pending',
+            )
+            OutboundMessage.objects.create(message=sent_message, idempotency_key=idempotency_key, payload=payload)
+    except IntegrityError:
+        # A concurrent request with the same key won the race
+        existing = OutboundMessage.objects.filter(idempotency_key=idempotency_key).select_related('message').first()
+        if existing is None:
+            raise
+        return existing.message, False
+    return sent_message, True
+
+
+# ----------------------------------------------------------------
+# Sending (send_outbound_messages worker)
+# ----------------------------------------------------------------
+def claim_timeout():
+    """
+    How long a claim lasts without a refresh. Claims are refreshed as each
+    message of a batch starts sending, so this only has to outlast one send
+    with all the client's retries.
+    """
+    return timedelta(seconds=2 * whatsapp_client.max_request_seconds)
+
+
+def claim_outbound(worker_name, batch_size):
+    now = timezone.now()
+    claimable = (
+        Q(status='pending', next_attempt_at__lte=now)
+        | Q(status='processing', claimed_at__lt=now - claim_timeout())
+    )
+    return claim_batch(
+        OutboundMessage.objects.filter(claimable),
+        worker_name,
+        batch_size,
+        status='processing',
+        attempts=F('attempts') + 1,
+    )
+
+
+def retry_later(outbound, error):
+    """Schedule another attempt with full-jitter backoff, or fail the message after MAX_ATTEMPTS."""
+    outbound.last_error = error
+    if outbound.attempts >= MAX_ATTEMPTS:
+        outbound.status = 'failed'
+        return
+    delay = random.uniform(0, min(MAX_RETRY_BACKOFF, RETRY_BACKOFF * 2 ** outbound.attempts))
+    outbound.status = 'pending'
+    outbound.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+
+
+def hold_claim(outbound, waiting):
+    """
+    Refresh the claim of a message about to be sent and of those still
+    waiting in its batch. False when another worker took the message over.
+    """
+    queryset = OutboundMessage.objects.filter(status='processing')
+    if not refresh_claim(queryset, outbound.claimed_by, [outbound.pk]):
+        return False
+    refresh_claim(queryset, outbound.claimed_by, waiting)
+    return True
+
+
+async def send_outbound(items, concurrency):
+    """
+    Send claimed messages through the pooled client, storing the outcome of
+    each as soon as it is known so its wamid is in place before the first
+    delivery receipt comes in.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    waiting = {outbound.pk for outbound in items}
+
+    async def send(outbound):
+        outbound.wamid = ''
+        async with semaphore:
+            waiting.discard(outbound.pk)
+            if not await sync_to_async(hold_claim)(outbound, list(waiting)):
+                outbound.status = 'lost'
+                return
+            try:
+                response = await whatsapp_client.asend_message(outbound.payload)
+            except RETRY_EXCEPTIONS as e:
+                retry_later(outbound, f'Failed to connect to WhatsApp API: {e}')
+            except httpx.HTTPError as e:
+                # The request went out, Meta may have delivered it
+                outbound.status = 'unknown'
+                outbound.last_error = f'No response from WhatsApp API, the message may have been sent: {e!r}'
+            else:
+                read_response(outbound, response)
+        await sync_to_async(record_outcomes)([outbound])
+
+    try:
+        await asyncio.gather(*(send(outbound) for outbound in items))
+    finally:
+        await whatsapp_client.aclose()
+
+
+def read_response(outbound, response):
+    try:
+        data = response.json()
+    except ValueError:
+        data = {}
+    if response.status_code in [200, 201] and (data.get('messages') or [{}])[0].get('id'):
+        outbound.status = 'sent'
+        outbound.wamid = data['messages'][0]['id']
+        outbound.last_error = ''
+        return
+    error = (data.get('error') or {}).get('message') or f"WhatsApp API error: {response.status_code}"
+    if response.status_code in RETRY_STATUSES:
+        retry_later(outbound, error)
+    else:
+        outbound.status = 'failed'
+        outbound.last_error = error
+
+
+def send_batch(items, concurrency):
+    # Database calls of the sends run back in this thread, on its connection
+    async_to_sync(send_outbound)(items, concurrency)
+
+
+# ----------------------------------------------------------------
+# Recording outcomes
+# ----------------------------------------------------------------
+def record_outcomes(items):
+    """Store the outcome of each message and push its final status to the conversation sockets."""
+    now = timezone.now()
+    finished = []
+    items = [outbound for outbound in items if outbound.status != 'lost']
+    with transaction.atomic():
+        for outbound in items:
+            outbound.claimed_by = ''
+            outbound.claimed_at = None
+            if outbound.status == 'sent':
+                WAMessage.objects.filter(pk=outbound.message_id).update(
+                    message_id=outbound.wamid, status='sent', delivery_status='sent', delivery_updated_at=now
+                )
+                # The inbox summary kept the placeholder id
+                Contact.objects.filter(last_message_pk=outbound.message_id).update(last_message_message_id=outbound.wamid)
+                finished.append(outbound.wamid)
+            elif outbound.status == 'failed':
+                message = WAMessage.objects.filter(pk=outbound.message_id)
+                message.update(status='failed', delivery_status='failed', delivery_updated_at=now)
+                finished += message.values_list('message_id', flat=True)
+            elif outbound.status == 'unknown':
+                WAMessage.objects.filter(pk=outbound.message_id).update(status='unknown')
+        OutboundMessage.objects.bulk_update(
+            items, ['status', 'next_attempt_at', 'claimed_by', 'claimed_at', 'last_error'], batch_size=500
+        )
+        if finished:
+            record_receipts(finished)
@@ -0,0 +1,84 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .fanout import FanoutBuffer
+from .models import Contact, OutboxEvent, WAMessage
+from .serializers import ContactSerializer, WAMessageSerializer
+from utils import claim_batch
+
+CLAIM_TIMEOUT = timedelta(minutes=1)
+# Relay in the writing process right after commit instead of from the
+# relay_outbox worker: the in-memory channel layer (DEBUG_ENV) only reaches
+# sockets served by the same process
+INLINE_RELAY = getattr(settings, 'WHATSAPP_OUTBOX_INLINE_RELAY', settings.DEBUG_ENV)
+
+
+# ----------------------------------------------------------------
+# Writing events (inside the caller's transaction)
+# ----------------------------------------------------------------
+def record(contacts=(), messages=(), receipts=()):
+    """Store serialized contacts, messages and receipts to publish once the transaction commits."""
+    events = [OutboxEvent(kind='contact', payload=contact) for contact in contacts]
+    events += [OutboxEvent(kind='message', payload=message) for message in messages]
+    events += [OutboxEvent(kind='receipt', payload=receipt) for receipt in receipts]
+    if not events:
+        return
+    OutboxEvent.objects.bulk_create(events)
+    if INLINE_RELAY:
+        transaction.on_commit(relay_pending)
+
+
+def record_messages(messages):
+    """Record new messages together with their contacts' updated inbox summary."""
+    contacts = Contact.objects.filter(id__in={message.contact_id for message in messages}).order_by('id')
+    record(
+        contacts=ContactSerializer(contacts, many=True).data,
+        messages=WAMessageSerializer(messages, many=True).data,
+    )
+
+
+def record_receipts(message_ids):
+    """Record the current delivery status of messages, for their conversation sockets."""
+    messages = WAMessage.objects.filter(message_id__in=message_ids).values(
+        'id', 'message_id', 'contact', 'delivery_status', 'delivery_updated_at'
+    )
+    record(receipts=[
+        {**message, 'delivery_updated_at': message['delivery_updated_at'].isoformat() if message['delivery_updated_at'] else None}
+        for message in messages
+    ])
+
+
+# ----------------------------------------------------------------
+# Relaying events to the channel layer (after commit)
+# ----------------------------------------------------------------
+def claim_events(worker_name, batch_size):
+    now = timezone.now()
+    claimable = Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - CLAIM_TIMEOUT)
+    return claim_batch(OutboxEvent.objects.filter(claimable), worker_name, batch_size)
+
+
+def relay(events, buffer):
+    """Publish claimed events as coalesced, batched frames and remove them from the outbox."""
+    buffer.publish(
+        contacts=[event.payload for event in events if event.kind == 'contact'],
+        messages=[event.payload for event in events if event.kind == 'message'],
+        receipts=[event.payload for event in events if event.kind == 'receipt'],
+    )
+    buffer.flush()
+    OutboxEvent.objects.filter(id__in=[event.id for event in events]).delete()
+
+
+# Used for inline relaying, keeps the last published contacts for deltas
+inline_buffer = FanoutBuffer(window=0)
+
+
+def relay_pending(worker_name='inline', batch_size=500):
+    relayed = 0
+    while True:
+        events = claim_events(worker_name, batch_size)
+        if not events:
+            return relayed
+        relay(events, inline_buffer)
+        relayed += len(events)
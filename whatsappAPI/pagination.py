@@ -0,0 +1,74 @@
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class KeysetPagination:
+    """
+    Newest-first keyset (seek) pagination over a non-null (datetime, id) pair.
+
+    Clients page towards older rows with `?before=<cursor>` and poll for
+    newer rows with `?after=<cursor>`. Each page is a range scan on an index
+    ending in (datetime field, id), however deep into the history it is.
+    """
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+
+    def __init__(self, field, page_size=None):
+        self.field = field
+        if page_size:
+            self.page_size = page_size
+
+    def encode_cursor(self, obj):
+        position = [getattr(obj, self.field).isoformat(), obj.pk]
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            value = parse_datetime(value)
+            if value is None:
+                raise ValueError(cursor)
+            return value, int(pk)
+        except (TypeError, ValueError):
+            raise ValidationError('Invalid cursor')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request):
+        """Return the page (newest first) and the `before`/`after` cursors around it."""
+        size = self.get_page_size(request)
+        before = request.query_params.get('before')
+        after = request.query_params.get('after')
+
+        if after:
+            value, pk = self.decode_cursor(after)
+            rows = queryset.filter(
+                Q(**{f'{self.field}__gt': value}) | Q(**{self.field: value, 'pk__gt': pk})
+            ).order_by(self.field, 'pk')[:size]
+            page = list(reversed(rows))
+            return page, {
+                'before': self.encode_cursor(page[-1]) if page else None,
+                'after': self.encode_cursor(page[0]) if page else after,
+            }
+
+        if before:
+            value, pk = self.decode_cursor(before)
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__lt': value}) | Q(**{self.field: value, 'pk__lt': pk})
+            )
+        rows = list(queryset.order_by(f'-{self.field}', '-pk')[:size + 1])
+        page = rows[:size]
+        return page, {
+            # Only hand out a `before` cursor when there is an older page
+            'before': self.encode_cursor(page[-1]) if len(rows) > size else None,
+            'after': self.encode_cursor(page[0]) if page else None,
+        }
@@ -0,0 +1,61 @@
+from datetime import datetime, timezone as dt_timezone
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+from .models import WAMessage
+
+# Delivery receipts only move a message forward: a late `sent` never
+# overwrites `read`. `failed` replaces `sent` but not a later delivery.
+DELIVERY_RANKS = {'sent': 1, 'failed': 2, 'delivered': 3, 'read': 4}
+# Messages per UPDATE, keeps the CASE expression and its parameters small
+UPDATE_BATCH_SIZE = 200
+
+
+def parse_receipt_timestamp(value):
+    """Meta sends receipt times as unix seconds in a string."""
+    try:
+        return datetime.fromtimestamp(int(value), tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return timezone.now()
+
+
+def latest_receipts(receipts):
+    """Keep the most advanced (status, timestamp) per message id from (message_id, status, timestamp) tuples."""
+    latest = {}
+    for message_id, status, timestamp in receipts:
+        rank = DELIVERY_RANKS.get(status)
+        if rank is None:
+            continue
+        current = latest.get(message_id)
+        if current is None or (rank, timestamp) > (DELIVERY_RANKS[current[0]], current[1]):
+            latest[message_id] = (status, timestamp)
+    return latest
+
+
+def apply_receipts(receipts):
+    """
+    Fold delivery receipts into WAMessage.delivery_status with one bulk
+    UPDATE per status (per batch of messages). Returns the ids of the
+    messages the receipts refer to.
+    """
+    latest = latest_receipts(receipts)
+    by_status = {}
+    for message_id, (status, timestamp) in latest.items():
+        by_status.setdefault(status, []).append((message_id, timestamp))
+
+    for status, updates in by_status.items():
+        rank = DELIVERY_RANKS[status]
+        # Only rows still at an earlier status are touched
+        earlier = [''] + [other for other, other_rank in DELIVERY_RANKS.items() if other_rank < rank]
+        for start in range(0, len(updates), UPDATE_BATCH_SIZE):
+            batch = updates[start:start + UPDATE_BATCH_SIZE]
+            WAMessage.objects.filter(
+                message_id__in=[message_id for message_id, _ in batch],
+                delivery_status__in=earlier,
+            ).update(
+                delivery_status=status,
+                delivery_updated_at=Case(
+                    *[When(message_id=message_id, then=Value(timestamp)) for message_id, timestamp in batch],
+                    output_field=DateTimeField(),
+                ),
+            )
+    return list(latest)
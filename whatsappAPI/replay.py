@@ -0,0 +1,83 @@
+import gzip
+import json
+import time
+from django.db import close_old_connections
+from .ingestion import process_webhook_payload
+from .journal import iter_payloads
+from .models import WebhookEvent
+
+
+# ----------------------------------------------------------------
+# Sources: the webhook journal or a JSONL(.gz) file
+# ----------------------------------------------------------------
+def journal_payloads(since=None, until=None, account_id=None, chunk_size=500):
+    """Payloads of the webhook journal in the order they were received, optionally by day and account."""
+    events = WebhookEvent.objects.all()
+    if since:
+        events = events.filter(day__gte=since)
+    if until:
+        events = events.filter(day__lte=until)
+    if account_id:
+        events = events.filter(account_id=account_id)
+    for _, payload in iter_payloads(events, chunk_size):
+        yield payload
+
+
+def file_payloads(path):
+    """
+    Payloads of a JSONL file, gzipped when its name ends in .gz. Each line
+    is either a raw webhook payload or an archive_webhook_events record.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as lines:
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                print(f"Skipping line {number} of {path}: {e}")
+                continue
+            yield record['payload'] if 'payload' in record and 'entry' not in record else record
+
+
+def chunked(payloads, size):
+    chunk = []
+    for payload in payloads:
+        chunk.append(payload)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ----------------------------------------------------------------
+# Replaying (runs in the worker processes)
+# ----------------------------------------------------------------
+def replay_chunk(payloads):
+    """
+    Ingest a chunk of payloads and return its counters. Payloads whose
+    statuses refer to messages not ingested yet (they may be in a chunk
+    another worker is replaying) are returned to be replayed again.
+    """
+    close_old_connections()
+    stats = {'payloads': 0, 'messages': 0, 'new_messages': 0, 'statuses': 0, 'errors': 0, 'seconds': 0.0}
+    retry = []
+    started = time.monotonic()
+    for payload in payloads:
+        try:
+            result = process_webhook_payload(payload)
+        except Exception as e:
+            print(f"Error replaying webhook payload: {e}")
+            stats['errors'] += 1
+            continue
+        stats['payloads'] += 1
+        stats['messages'] += result['messages']
+        stats['new_messages'] += result['new_messages']
+        stats['statuses'] += result['statuses']
+        if result['missing_statuses']:
+            retry.append(payload)
+    stats['seconds'] = time.monotonic() - started
+    return stats, retry
@@ -0,0 +1,132 @@
+import base64
+import html
+import json
+import re
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+
+
+# ----------------------------------------------------------------
+# Contact search (inbox sidebar)
+# ----------------------------------------------------------------
+def search_contacts(queryset, q):
+    """
+    Filter contacts by profile name or WhatsApp ID. PostgreSQL matches
+    substrings through the pg_trgm GIN indexes; SQLite (DEBUG_ENV) matches
+    prefixes through the NOCASE indexes created in migration 0021.
+    """
+    q = (q or '').strip()
+    if not q:
+        return queryset
+    if connection.vendor == 'postgresql':
+        return queryset.filter(Q(profile_name__icontains=q) | Q(wa_id__contains=q))
+    return queryset.filter(Q(profile_name__istartswith=q) | Q(wa_id__istartswith=q))
+
+
+# ----------------------------------------------------------------
+# Message search (full-text over body and caption)
+# ----------------------------------------------------------------
+# Highlight delimiters from the private use area, swapped for <mark> after
+# the snippet is HTML-escaped so message text can never inject markup
+HIGHLIGHT_START = '\ue000'
+HIGHLIGHT_END = '\ue001'
+SNIPPET_TOKENS = 12
+
+
+def encode_search_cursor(rank, pk):
+    return base64.urlsafe_b64encode(json.dumps([rank, pk]).encode()).decode()
+
+
+def decode_search_cursor(cursor):
+    try:
+        rank, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(pk)
+    except (TypeError, ValueError):
+        raise ValidationError('Invalid cursor')
+
+
+def highlight(snippet):
+    return html.escape(snippet or '').replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+
+
+def fts5_query(q):
+    """Quote every word so user input is never parsed as FTS5 syntax; the last word matches as a prefix."""
+    words = re.findall(r'\w+', q)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def message_filters(alias, contact_id=None, since=None, until=None, message_type=None):
+    clauses, params = [], []
+    if contact_id:
+        clauses.append(f'{alias}.contact_id = %s')
+        params.append(contact_id)
+    if since:
+        clauses.append(f'{alias}.timestamp >= %s')
+        params.append(connection.ops.adapt_datetimefield_value(since))
+    if until:
+        clauses.append(f'{alias}.timestamp < %s')
+        params.append(connection.ops.adapt_datetimefield_value(until))
+    if message_type:
+        clauses.append(f'{alias}.message_type = %s')
+        params.append(message_type)
+    return ''.join(f' AND {clause}' for clause in clauses), params
+
+
+def search_messages(q, contact_id=None, since=None, until=None, message_type=None, cursor=None, page_size=50):
+    """
+    Rank messages matching `q` (best first, then newest) through the
+    full-text index of migration 0027. Returns the page as
+    (message id, rank, highlighted snippet) tuples and the cursor of the
+    next page (None on the last page).
+    """
+    q = (q or '').strip()
+    if connection.vendor != 'postgresql':
+        q = fts5_query(q)
+    if not q:
+        return [], None
+
+    filters, filter_params = message_filters('m', contact_id, since, until, message_type)
+    after = ''
+    after_params = []
+    if cursor:
+        rank, pk = decode_search_cursor(cursor)
+        after = ' WHERE ranked.rank < %s OR (ranked.rank = %s AND ranked.id < %s)'
+        after_params = [rank, rank, pk]
+
+    if connection.vendor == 'postgresql':
+        sql = (
+            'SELECT page.id, page.rank, ts_headline(\'simple\', page.body || \' \' || page.caption, page.query, %s) FROM ('
+            '  SELECT ranked.* FROM ('
+            '    SELECT m.id, m.body, m.caption, query, ts_rank_cd(m.search_vector, query)::float8 AS rank'
+            '    FROM "whatsappAPI_wamessage" m, websearch_to_tsquery(\'simple\', %s) query'
+            '    WHERE m.search_vector @@ query' + filters +
+            '  ) ranked' + after +
+            '  ORDER BY ranked.rank DESC, ranked.id DESC LIMIT %s'
+            ') page ORDER BY page.rank DESC, page.id DESC'
+        )
+        options = f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords={SNIPPET_TOKENS * 2}, MinWords=5'
+        params = [options, q, *filter_params, *after_params, page_size + 1]
+    else:
+        # bm25() is lower for better matches, negated so both backends sort the same way
+        sql = (
+            'SELECT ranked.id, ranked.rank, ranked.snippet FROM ('
+            '  SELECT m.id, -bm25(wa_message_fts) AS rank,'
+            '  snippet(wa_message_fts, -1, %s, %s, \'…\', %s) AS snippet'
+            '  FROM wa_message_fts JOIN "whatsappAPI_wamessage" m ON m.id = wa_message_fts.rowid'
+            '  WHERE wa_message_fts MATCH %s' + filters +
+            ') ranked' + after +
+            ' ORDER BY ranked.rank DESC, ranked.id DESC LIMIT %s'
+        )
+        params = [HIGHLIGHT_START, HIGHLIGHT_END, SNIPPET_TOKENS, q, *filter_params, *after_params, page_size + 1]
+
+    with connection.cursor() as db:
+        db.execute(sql, params)
+        rows = db.fetchall()
+    page = [(pk, rank, highlight(snippet)) for pk, rank, snippet in rows[:page_size]]
+    next_cursor = encode_search_cursor(page[-1][1], page[-1][0]) if len(rows) > page_size else None
+    return page, next_cursor
@@ -0,0 +1,58 @@
+import asyncio
+from channels.db import database_sync_to_async
+from django.conf import settings
+from .inbox import mark_seen
+
+# Seen acknowledgements received within this many seconds are written together
+DEBOUNCE = getattr(settings, 'WHATSAPP_SEEN_DEBOUNCE', 0.5)
+
+
+def later_watermark(current, up_to):
+    """The further of two watermarks, None (every message) being the furthest."""
+    if current is None or up_to is None:
+        return None
+    return max(current, up_to)
+
+
+class SeenAcknowledgements:
+    """
+    Buffers "seen up to" acknowledgements from the contacts sockets of this
+    process. Repeated acknowledgements of a contact collapse into its
+    furthest watermark, and a short while after the first one the whole
+    batch is written by inbox.mark_seen.
+    """
+
+    def __init__(self, debounce=DEBOUNCE):
+        self.debounce = debounce
+        self._watermarks = {}
+        self._handle = None
+
+    def acknowledge(self, contact_id, up_to=None):
+        """Queue a contact as seen up to message pk `up_to` (every message when None). Call from the event loop."""
+        if contact_id in self._watermarks:
+            up_to = later_watermark(self._watermarks[contact_id], up_to)
+        self._watermarks[contact_id] = up_to
+        if self._handle is None:
+            loop = asyncio.get_running_loop()
+            self._handle = loop.call_later(self.debounce, lambda: loop.create_task(self.flush()))
+
+    def take(self):
+        """Take the buffered {contact id: watermark} acknowledgements."""
+        watermarks, self._watermarks = self._watermarks, {}
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        return watermarks
+
+    async def flush(self):
+        watermarks = self.take()
+        if not watermarks:
+            return {}
+        try:
+            return await database_sync_to_async(mark_seen)(watermarks)
+        except Exception as e:
+            print(f"Error marking messages as seen: {e}")
+            return {}
+
+
+seen_acknowledgements = SeenAcknowledgements()
@@ -8,6 +8,19 @@ class WAMessageSerializer(serializers.ModelSerializer):
         model = WAMessage
         fields = "__all__"
 
+class PaginatedWAMessageSerializer(serializers.Serializer):
+    before = serializers.CharField(allow_null=True, help_text="Cursor of the next (older) page")
+    after = serializers.CharField(allow_null=True, help_text="Cursor to poll for newer messages")
+    results = WAMessageSerializer(many=True)
+
+class MessageSearchResultSerializer(WAMessageSerializer):
+    rank = serializers.FloatField(read_only=True, help_text="Relevance, higher is better")
+    snippet = serializers.CharField(read_only=True, help_text="HTML-escaped excerpt with the matches in <mark> tags")
+
+class PaginatedMessageSearchSerializer(serializers.Serializer):
+    next = serializers.CharField(allow_null=True, help_text="Cursor of the next (less relevant) page")
+    results = MessageSearchResultSerializer(many=True)
+
 class ContactSerializer(serializers.ModelSerializer):
     last_message = serializers.SerializerMethodField()
     unread_message_count = serializers.SerializerMethodField()
@@ -16,26 +29,29 @@ class ContactSerializer(serializers.ModelSerializer):
         model = Contact
         fields = ['id', 'wa_id', 'profile_name', 'last_message', 'unread_message_count']
 
-    # Method to get the last message for the contact
+    # Method to get the last message for the contact (denormalized on Contact)
     def get_last_message(self, obj):
-        # Get the most recent message (by timestamp) for this contact
-        last_message = WAMessage.objects.filter(contact=obj).order_by('-timestamp').first()
-        if last_message:
-            return {
-                'id': last_message.pk,
-                'message_id': last_message.message_id,
-                'message_type': last_message.message_type,
-                'body': last_message.body,
-                'timestamp': DateFormat(last_message.timestamp).format('Y-m-d H:i:s')
-            }
-        return None
+        if obj.last_message_pk is None:
+            return None
+        return {
+            'id': obj.last_message_pk,
+            'message_id': obj.last_message_message_id,
+            'message_type': obj.last_message_type,
+            'body': obj.last_message_body,
+            'timestamp': DateFormat(obj.last_message_at).format('Y-m-d H:i:s') if obj.last_message_at else None
+        }
     
 
     # Method to get the number of unread messages for the contact
     def get_unread_message_count(self, obj):
-        return WAMessage.objects.filter(contact=obj,message_mode='received', seen=False).count()
+        return obj.unread_count
 
 
+class PaginatedContactSerializer(serializers.Serializer):
+    before = serializers.CharField(allow_null=True, help_text="Cursor of the next (less recently active) page")
+    after = serializers.CharField(allow_null=True, help_text="Cursor to poll for recently active contacts")
+    results = ContactSerializer(many=True)
+
 class StatusSerializer(serializers.ModelSerializer):
     message = WAMessage()
     class Meta:
@@ -45,13 +61,20 @@ class StatusSerializer(serializers.ModelSerializer):
 class WebhookEventSerializer(serializers.ModelSerializer):
     class Meta:
         model = WebhookEvent
-        fields = ['id', 'event_id', 'payload']
+        fields = ['id', 'content_hash', 'account_id', 'day', 'received_at', 'payload']
 
 class WATemplateSchemaSerializer(serializers.ModelSerializer):
     class Meta:
         model = WATemplateSchema
-        fields = ['id', 'template', 'text', 'link', 'created_at', 'title', 'status']
-        read_only_fields = ['id', 'created_at']
+        fields = [
+            'id', 'template', 'text', 'link', 'created_at', 'title', 'status',
+            'template_name', 'language_code', 'total_recipients', 'sent_count', 'failed_count',
+            'broadcast_started_at', 'broadcast_completed_at',
+        ]
+        read_only_fields = [
+            'id', 'created_at', 'total_recipients', 'sent_count', 'failed_count',
+            'broadcast_started_at', 'broadcast_completed_at',
+        ]
 
     def create(self, validated_data):
         validated_data['status'] = 'sent' 
@@ -72,9 +95,21 @@ class SendMessageSerializer(serializers.Serializer):
     caption = serializers.CharField(required=False, help_text="Caption for media messages")
     message_mode = serializers.CharField(required=False, help_text="Message mode")
     timestamp = serializers.CharField(required=False, help_text="Message timestamp")
+    idempotency_key = serializers.CharField(required=False, max_length=100, help_text="Client-generated key, unique per message (or the Idempotency-Key header)")
     
 # Serializer for sending template messages
 class TemplateMessageSerializer(serializers.Serializer):
     to_phone_number = serializers.CharField(help_text="Recipient's phone number with country code")
     template_name = serializers.CharField(help_text="Name of the template to use")
-    language_code = serializers.CharField(default="en_US", help_text="Language code for the template")
\ No newline at end of file
+    language_code = serializers.CharField(default="en_US", help_text="Language code for the template")
+
+# Serializer for queueing a template broadcast
+class BroadcastAudienceSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=['all', 'list', 'query'], help_text="Who receives the broadcast")
+    wa_ids = serializers.ListField(child=serializers.CharField(), required=False, help_text="WhatsApp IDs for a list audience")
+    q = serializers.CharField(required=False, help_text="Contact search for a query audience")
+
+class BroadcastSerializer(serializers.Serializer):
+    template_name = serializers.CharField(help_text="Name of the approved WhatsApp template to send")
+    language_code = serializers.CharField(default="en_US", help_text="Language code for the template")
+    audience = BroadcastAudienceSerializer()
@@ -1,3 +1,1224 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date, timedelta
+from unittest import mock
+import httpx
+import django
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from channels.testing import WebsocketCommunicator
+from rest_framework.test import APIClient
+from . import broadcast, ingestion, journal, mediacache, outbound, outbox, webhook_queue
+from .client import WhatsAppClient, whatsapp_client
+from .consumers import WAMessagesConsumer
+from .fanout import FanoutBuffer
+from .inbox import mark_seen, mark_seen_sql
+from .search import search_contacts
+from .seen import SeenAcknowledgements
+from .ingestion import process_webhook_payload
+from .management.commands import process_webhook_queue, replay_webhooks
+from .models import BroadcastRecipient, CachedMedia, Contact, OutboundMessage, OutboxEvent, Status, WAMessage, WATemplateSchema, WebhookEvent, WebhookQueueItem
 
-# Create your tests here.
+MEDIA_CONTENT = b'fake image bytes' * 1000
+
+
+class FakeGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        self.server.requests.append({
+            'method': self.command,
+            'path': self.path,
+            'port': self.client_address[1],
+            'authorization': self.headers.get('Authorization'),
+            'body': body,
+        })
+        status, headers, content = self.server.responses.pop(0) if self.server.responses else self.server.default(self)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGraphServer(ThreadingHTTPServer):
+    """Local stand-in for graph.facebook.com serving queued or default responses."""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeGraphHandler)
+        self.requests = []
+        self.responses = []
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def queue(self, status, data=None, headers=None, content=None):
+        if content is None:
+            content = json.dumps(data or {}).encode()
+            headers = {'Content-Type': 'application/json', **(headers or {})}
+        self.responses.append((status, headers or {}, content))
+
+    def default(self, handler):
+        if handler.path.endswith('/messages'):
+            return 200, {'Content-Type': 'application/json'}, json.dumps({'messages': [{'id': 'wamid.sent'}]}).encode()
+        if handler.path == '/cdn/media':
+            return 200, {'Content-Type': 'image/jpeg'}, MEDIA_CONTENT
+        return 200, {'Content-Type': 'application/json'}, json.dumps({'url': f'{self.url}/cdn/media', 'mime_type': 'image/jpeg'}).encode()
+
+
+class FakeGraphMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeGraphServer()
+        cls.server.thread.start()
+        cls.settings_override = override_settings(
+            WHATSAPP_GRAPH_API_URL=cls.server.url,
+            WHATSAPP_VERSION='v20.0',
+            WHATSAPP_FROM_PHONE_NUMBER_ID='12345',
+            WHATSAPP_ACCESS_TOKEN='test-token',
+            WHATSAPP_API_BACKOFF=0,
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        whatsapp_client.close()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.server.requests.clear()
+        self.server.responses.clear()
+
+
+class WhatsAppClientTests(FakeGraphMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = WhatsAppClient()
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_send_message_posts_to_phone_number_endpoint(self):
+        response = self.client.send_message({'to': '2348000000000', 'type': 'text'})
+        self.assertEqual(response.status_code, 200)
+        request = self.server.requests[0]
+        self.assertEqual(request['path'], '/v20.0/12345/messages')
+        self.assertEqual(request['authorization'], 'Bearer test-token')
+        self.assertEqual(request['body']['to'], '2348000000000')
+
+    def test_retries_rate_limited_and_server_errors(self):
+        self.server.queue(429, {'error': {'message': 'rate limited'}}, headers={'Retry-After': '0'})
+        self.server.queue(503)
+        response = self.client.send_message({'to': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_returns_last_response_when_retries_are_exhausted(self):
+        client = WhatsAppClient(max_retries=2)
+        for _ in range(3):
+            self.server.queue(500)
+        response = client.get_media_info('media-1')
+        client.close()
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.queue(400, {'error': {'message': 'bad request'}})
+        response = self.client.send_message({'to': '1'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_connections_are_kept_alive(self):
+        for _ in range(3):
+            self.client.get_media_info('media-1')
+        self.assertEqual(len({request['port'] for request in self.server.requests}), 1)
+
+    def test_backoff_is_jittered_and_capped(self):
+        client = WhatsAppClient(backoff=1, max_backoff=4)
+        delays = [client.retry_delay(10) for _ in range(50)]
+        self.assertTrue(all(0 <= delay <= 4 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+    def test_async_requests_retry_and_reuse_connections(self):
+        self.server.queue(502)
+
+        async def run():
+            first = await self.client.asend_message({'to': '1'})
+            second = await self.client.aget_media_info('media-1')
+            async with self.client.astream(second.json()['url']) as content:
+                body = await content.aread()
+            await self.client.aclose()
+            return first, body
+
+        first, body = asyncio.run(run())
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(body, MEDIA_CONTENT)
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(len({request['port'] for request in self.server.requests}), 1)
+
+
+class WhatsAppOutboundTests(FakeGraphMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.api = APIClient()
+        self.api.force_authenticate(get_user_model().objects.create(username='agent', email='agent@example.com'))
+
+    def test_media_is_downloaded_through_the_client(self):
+        cached = mediacache.fetch_and_store('media-1')
+        self.assertEqual(cached.sha256, hashlib.sha256(MEDIA_CONTENT).hexdigest())
+        self.assertEqual(cached.size, len(MEDIA_CONTENT))
+        self.assertEqual([request['path'] for request in self.server.requests], ['/v20.0/media-1', '/cdn/media'])
+
+    def test_missing_media_returns_404(self):
+        self.server.queue(404, {'error': {'message': 'not found'}})
+        response = self.api.get('/whatsappAPI/media/missing/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CachedMedia.objects.exists())
+
+    def send(self, contact, key, **data):
+        return self.api.post(
+            f'/whatsappAPI/{contact.id}/send_message/',
+            {'message_type': 'text', 'body': 'Hello', **data},
+            format='json',
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_send_to_whatsapp_api_queues_once_per_idempotency_key(self):
+        contact = Contact.objects.create(wa_id='2348000000000', profile_name='Ada')
+        response = self.send(contact, 'key-1')
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertEqual(self.server.requests, [])
+
+        retry = self.send(contact, 'key-1')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.data['id'], response.data['id'])
+        self.assertEqual(self.send(Contact.objects.create(wa_id='2348000000001'), 'key-1').status_code, 409)
+
+        self.server.queue(429, headers={'Retry-After': '0'})
+        items = outbound.claim_outbound('test-worker', 10)
+        outbound.send_batch(items, concurrency=2)
+        self.assertEqual(len(self.server.requests), 2)
+        message = WAMessage.objects.get(pk=response.data['id'])
+        self.assertEqual((message.message_id, message.status, message.delivery_status), ('wamid.sent', 'sent', 'sent'))
+        self.assertEqual(Contact.objects.get(pk=contact.pk).last_message_message_id, 'wamid.sent')
+        self.assertEqual(self.send(contact, 'key-1').data['message_id'], 'wamid.sent')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_outbound_failures_are_retried_with_backoff(self):
+        contact = Contact.objects.create(wa_id='2348000000000', profile_name='Ada')
+        message_pk = self.send(contact, 'key-1').data['id']
+        for _ in range(4):
+            self.server.queue(503)
+        outbound.send_batch(outbound.claim_outbound('test-worker', 10), concurrency=1)
+        item = OutboundMessage.objects.get()
+        self.assertEqual((item.status, item.attempts), ('pending', 1))
+        self.assertEqual(item.last_error, 'WhatsApp API error: 503')
+        self.assertEqual(WAMessage.objects.get(pk=message_pk).status, 'pending')
+
+        OutboundMessage.objects.update(next_attempt_at=timezone.now())
+        self.server.queue(400, {'error': {'message': 'Invalid parameter'}})
+        outbound.send_batch(outbound.claim_outbound('test-worker', 10), concurrency=1)
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.attempts, item.last_error), ('failed', 2, 'Invalid parameter'))
+        self.assertEqual(WAMessage.objects.get(pk=message_pk).delivery_status, 'failed')
+        self.assertEqual(OutboxEvent.objects.filter(kind='receipt').count(), 1)
+
+    def test_outbound_timeouts_after_sending_are_not_retried(self):
+        contact = Contact.objects.create(wa_id='2348000000000', profile_name='Ada')
+        unknown_pk = self.send(contact, 'key-1').data['id']
+        retried_pk = self.send(contact, 'key-2').data['id']
+        errors = [httpx.ReadTimeout('read timed out'), httpx.ConnectError('connection refused')]
+
+        async def failing_send(payload):
+            raise errors.pop(0)
+
+        with mock.patch.object(whatsapp_client, 'asend_message', failing_send):
+            outbound.send_batch(outbound.claim_outbound('test-worker', 10), concurrency=1)
+        unknown = OutboundMessage.objects.get(message_id=unknown_pk)
+        self.assertEqual(unknown.status, 'unknown')
+        self.assertIn('may have been sent', unknown.last_error)
+        self.assertEqual(WAMessage.objects.get(pk=unknown_pk).status, 'unknown')
+        self.assertEqual(OutboundMessage.objects.get(message_id=retried_pk).status, 'pending')
+
+        OutboundMessage.objects.update(next_attempt_at=timezone.now(), claimed_at=timezone.now() - timedelta(days=1))
+        self.assertEqual([item.message_id for item in outbound.claim_outbound('test-worker', 10)], [retried_pk])
+
+    def test_outbound_wamid_is_stored_as_each_send_completes(self):
+        contact = Contact.objects.create(wa_id='2348000000000', profile_name='Ada')
+        first_pk = self.send(contact, 'key-1').data['id']
+        self.send(contact, 'key-2')
+        self.server.queue(200, {'messages': [{'id': 'wamid.first'}]})
+        seen = []
+        send_message = whatsapp_client.asend_message
+
+        async def send_and_look(payload):
+            seen.append(await sync_to_async(lambda: WAMessage.objects.get(pk=first_pk).message_id)())
+            return await send_message(payload)
+
+        with mock.patch.object(whatsapp_client, 'asend_message', send_and_look):
+            outbound.send_batch(outbound.claim_outbound('test-worker', 10), concurrency=1)
+        # A receipt arriving while the second message is in flight finds the first one
+        self.assertEqual(seen[1], 'wamid.first')
+
+    def test_outbound_claims_are_held_while_the_batch_sends(self):
+        contact = Contact.objects.create(wa_id='2348000000000', profile_name='Ada')
+        for key in ('key-1', 'key-2', 'key-3'):
+            self.send(contact, key)
+        items = outbound.claim_outbound('test-worker', 10)
+        # Claimed long ago, the third one since taken over by another worker
+        OutboundMessage.objects.update(claimed_at=timezone.now() - outbound.claim_timeout() - timedelta(seconds=1))
+        OutboundMessage.objects.filter(pk=items[2].pk).update(claimed_by='other-worker', claimed_at=timezone.now())
+        for n in range(2):
+            self.server.queue(200, {'messages': [{'id': f'wamid.{n}'}]})
+        reclaimed = []
+        send_message = whatsapp_client.asend_message
+
+        async def send_and_reclaim(payload):
+            reclaimed.extend(await sync_to_async(outbound.claim_outbound)('other-worker', 10))
+            return await send_message(payload)
+
+        with mock.patch.object(whatsapp_client, 'asend_message', send_and_reclaim):
+            outbound.send_batch(items, concurrency=1)
+        self.assertEqual(reclaimed, [])
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(list(OutboundMessage.objects.order_by('pk').values_list('status', 'claimed_by')), [
+            ('sent', ''), ('sent', ''), ('processing', 'other-worker'),
+        ])
+
+    def test_broadcast_sends_to_audience_and_counts_outcomes(self):
+        for n in range(5):
+            Contact.objects.create(wa_id=f'23480000000{n}', profile_name=f'Contact {n}')
+        template = WATemplateSchema.objects.create(title='Promo', template='textwithimage', link='https://example.com/a.jpg')
+        response = self.api.post(
+            f'/whatsappAPI/templates/{template.id}/broadcast/',
+            {'template_name': 'Weekly Promo', 'audience': {'type': 'all'}},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual(response.data['status'], 'queued')
+
+        # The first recipient is rejected by the Graph API, the rest go out
+        self.server.queue(400, {'error': {'message': 'Invalid parameter'}})
+        self.assertEqual(broadcast.start_queued_broadcasts(), [template.id])
+        recipients = broadcast.claim_recipients('test-worker', 100)
+        broadcast.send_batch(recipients, broadcast.RateLimiter(1000), concurrency=1)
+
+        template.refresh_from_db()
+        self.assertEqual(template.status, 'sent')
+        self.assertEqual((template.total_recipients, template.sent_count, template.failed_count), (5, 4, 1))
+        self.assertEqual(BroadcastRecipient.objects.get(status='failed').error, 'Invalid parameter')
+        payload = self.server.requests[0]['body']
+        self.assertEqual(payload['template']['name'], 'weekly_promo')
+        self.assertEqual(payload['template']['components'][0]['parameters'][0]['image']['link'], 'https://example.com/a.jpg')
+
+        response = self.api.get(f'/whatsappAPI/templates/{template.id}/broadcast/')
+        self.assertEqual(response.data['sent_count'], 4)
+
+    def test_broadcast_abandoned_halfway_is_expanded_again(self):
+        for n in range(5):
+            Contact.objects.create(wa_id=f'23480000000{n}', profile_name=f'Contact {n}')
+        template = broadcast.queue_broadcast(WATemplateSchema.objects.create(title='Promo'), {'type': 'all'}, 'promo')
+
+        def crashing_audience(audience):
+            yield from ['234800000000', '234800000001']
+            raise RuntimeError('worker killed')
+
+        # The worker dies after inserting the first batch
+        with mock.patch.object(broadcast, 'EXPAND_BATCH_SIZE', 2), \
+                mock.patch.object(broadcast, 'audience_wa_ids', crashing_audience):
+            with self.assertRaises(RuntimeError):
+                broadcast.start_queued_broadcasts()
+        template.refresh_from_db()
+        self.assertEqual(template.status, 'queued')
+        self.assertIsNotNone(template.broadcast_started_at)
+        self.assertEqual(broadcast.start_queued_broadcasts(), [])
+
+        WATemplateSchema.objects.filter(pk=template.pk).update(
+            broadcast_started_at=timezone.now() - broadcast.EXPAND_TIMEOUT - timedelta(seconds=1)
+        )
+        self.assertEqual(broadcast.start_queued_broadcasts(), [template.id])
+        template.refresh_from_db()
+        self.assertEqual((template.status, template.total_recipients), ('sending', 5))
+        self.assertEqual(template.recipients.count(), 5)
+
+    def sending_broadcast(self, count):
+        for n in range(count):
+            Contact.objects.create(wa_id=f'23480000000{n}', profile_name=f'Contact {n}')
+        template = broadcast.queue_broadcast(WATemplateSchema.objects.create(title='Promo'), {'type': 'all'}, 'promo')
+        broadcast.start_queued_broadcasts()
+        return template
+
+    def test_broadcast_outcomes_are_recorded_per_recipient(self):
+        template = self.sending_broadcast(4)
+        send_message = whatsapp_client.asend_message
+        errors = {
+            '234800000000': httpx.ReadTimeout('read timed out'),
+            '234800000001': httpx.ConnectError('connection refused'),
+            '234800000002': RuntimeError('unexpected'),
+        }
+
+        async def flaky_send(payload):
+            if payload['to'] in errors:
+                raise errors[payload['to']]
+            return await send_message(payload)
+
+        with mock.patch.object(whatsapp_client, 'asend_message', flaky_send):
+            broadcast.send_batch(broadcast.claim_recipients('test-worker', 100), broadcast.RateLimiter(1000), concurrency=2)
+        self.assertEqual(dict(template.recipients.values_list('wa_id', 'status')), {
+            # May have gone out, never sent again
+            '234800000000': 'unknown',
+            '234800000001': 'pending',
+            # Left to its claim running out
+            '234800000002': 'processing',
+            '234800000003': 'sent',
+        })
+        template.refresh_from_db()
+        self.assertEqual(template.sent_count, 1)
+
+    def test_broadcast_claims_are_held_while_the_batch_sends(self):
+        self.sending_broadcast(3)
+        recipients = broadcast.claim_recipients('test-worker', 100)
+        BroadcastRecipient.objects.update(claimed_at=timezone.now() - broadcast.claim_timeout() - timedelta(seconds=1))
+        BroadcastRecipient.objects.filter(pk=recipients[2].pk).update(claimed_by='other-worker', claimed_at=timezone.now())
+        reclaimed = []
+        send_message = whatsapp_client.asend_message
+
+        async def send_and_reclaim(payload):
+            reclaimed.extend(await sync_to_async(broadcast.claim_recipients)('other-worker', 100))
+            return await send_message(payload)
+
+        with mock.patch.object(whatsapp_client, 'asend_message', send_and_reclaim):
+            broadcast.send_batch(recipients, broadcast.RateLimiter(1000), concurrency=1)
+        self.assertEqual(reclaimed, [])
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(list(BroadcastRecipient.objects.order_by('pk').values_list('status', 'claimed_by')), [
+            ('sent', ''), ('sent', ''), ('processing', 'other-worker'),
+        ])
+
+    def test_broadcast_worker_refuses_a_rate_below_the_claim_timeout(self):
+        with self.assertRaises(CommandError):
+            call_command('send_broadcasts', '--once', '--rate', str(broadcast.min_rate() / 2))
+
+    def test_rate_limiter_spaces_calls(self):
+        limiter = broadcast.RateLimiter(50)
+
+        async def run():
+            start = time.monotonic()
+            await asyncio.gather(*(limiter.wait() for _ in range(6)))
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.09)
+
+
+class MediaCacheTests(FakeGraphMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.api = APIClient()
+        self.api.force_authenticate(get_user_model().objects.create(username='agent', email='agent@example.com'))
+
+    def store(self, media_id, content, minutes_ago):
+        sha256 = hashlib.sha256(content).hexdigest()
+        mediacache.store_blob(sha256, io.BytesIO(content))
+        return CachedMedia.objects.create(
+            media_id=media_id, sha256=sha256, size=len(content), status='ready',
+            last_accessed_at=timezone.now() - timedelta(minutes=minutes_ago),
+        )
+
+    def blobs(self):
+        return sorted(name for _, _, names in os.walk(self.media_root) for name in names)
+
+    def get(self, media_id, **headers):
+        response = self.api.get(f'/whatsappAPI/media/{media_id}/', headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_identical_content_is_stored_once(self):
+        first = mediacache.fetch_and_store('media-1')
+        second = mediacache.fetch_and_store('media-2')
+        self.assertEqual(first.sha256, second.sha256)
+        self.assertEqual(self.blobs(), [first.sha256])
+        self.assertEqual(CachedMedia.objects.count(), 2)
+
+    def test_blobs_go_to_the_shared_media_storage(self):
+        shared_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, shared_root, True)
+        media_storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'whatsapp_media': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': shared_root}},
+        }
+        with override_settings(STORAGES=media_storages):
+            cached = mediacache.fetch_and_store('media-1')
+            self.assertEqual(self.blobs(), [])
+            self.assertTrue(os.path.exists(os.path.join(shared_root, mediacache.blob_name(cached.sha256))))
+            # Another process finds the blob through the shared row
+            self.assertEqual(self.get('media-1')[1], MEDIA_CONTENT)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_least_recently_used_media_is_evicted_first(self):
+        oldest = self.store('oldest', b'a' * 100, minutes_ago=30)
+        middle = self.store('middle', b'b' * 100, minutes_ago=20)
+        self.store('newest', b'c' * 100, minutes_ago=10)
+        # Reading the oldest one makes it the most recently used
+        self.assertEqual(mediacache.get_cached('oldest'), oldest)
+
+        # 300 bytes over a 250 byte cache, evicted down to the 225 byte low-water mark
+        self.assertEqual(mediacache.evict(max_bytes=250), 1)
+        self.assertEqual(sorted(CachedMedia.objects.values_list('media_id', flat=True)), ['newest', 'oldest'])
+        self.assertNotIn(middle.sha256, self.blobs())
+        self.assertEqual(mediacache.evict(max_bytes=250), 0)
+
+    def test_evicting_a_shared_blob_keeps_it_for_other_media(self):
+        shared = self.store('first', MEDIA_CONTENT, minutes_ago=30)
+        self.store('second', MEDIA_CONTENT, minutes_ago=10)
+        self.assertEqual(mediacache.evict(max_bytes=len(MEDIA_CONTENT) * 2 - 1), 1)
+        self.assertEqual(list(CachedMedia.objects.values_list('media_id', flat=True)), ['second'])
+        self.assertEqual(self.blobs(), [shared.sha256])
+
+    def test_media_is_served_with_range_and_etag_support(self):
+        response, body = self.get('media-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, MEDIA_CONTENT)
+        etag = response['ETag']
+        self.assertEqual(etag, f'"{hashlib.sha256(MEDIA_CONTENT).hexdigest()}"')
+
+        response, body = self.get('media-1', Range='bytes=0-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{len(MEDIA_CONTENT)}')
+        self.assertEqual(body, MEDIA_CONTENT[:10])
+
+        self.assertEqual(self.get('media-1', If_None_Match=etag)[0].status_code, 304)
+        # A range of another version of the file is ignored
+        response, body = self.get('media-1', Range='bytes=0-9', If_Range='"stale"')
+        self.assertEqual((response.status_code, body), (200, MEDIA_CONTENT))
+        self.assertEqual(self.get('media-1', Range=f'bytes={len(MEDIA_CONTENT)}-')[0].status_code, 416)
+        # Downloaded once, every later request was served from the cache
+        self.assertEqual(len(self.server.requests), 2)
+
+
+class FanoutBufferTests(SimpleTestCase):
+    def setUp(self):
+        self.frames = []
+        self.buffer = FanoutBuffer(window=60, send=lambda group, event: self.frames.append((group, event)))
+
+    def contact(self, contact_id, unread, body='hi'):
+        return {
+            'id': contact_id,
+            'wa_id': f'234{contact_id}',
+            'profile_name': f'Contact {contact_id}',
+            'last_message': {'id': unread, 'body': body},
+            'unread_message_count': unread,
+        }
+
+    def tearDown(self):
+        self.buffer.flush()
+
+    def test_updates_within_a_window_are_coalesced_into_one_frame(self):
+        for unread in range(1, 4):
+            self.buffer.publish(contacts=[self.contact(1, unread), self.contact(2, unread)], messages=[{'id': unread, 'contact': 1}])
+        self.assertEqual(self.frames, [])
+
+        self.buffer.flush()
+        self.assertEqual(
+            [group for group, _ in self.frames],
+            ['whatsappapi_contacts', 'whatsappapi_messages_1', 'whatsappapi_messages'],
+        )
+        contacts = self.frames[0][1]['contacts']
+        self.assertEqual([contact['unread_message_count'] for contact in contacts], [3, 3])
+        self.assertEqual([message['id'] for message in self.frames[1][1]['messages']], [1, 2, 3])
+        self.assertEqual(self.frames[1][1], self.frames[2][1])
+
+    def test_only_changed_fields_are_sent_after_the_first_frame(self):
+        self.buffer.publish(contacts=[self.contact(1, 1)])
+        self.buffer.flush()
+        self.buffer.publish(contacts=[self.contact(1, 0, body='hi')])
+        self.buffer.publish(contacts=[self.contact(2, 5)])
+        self.buffer.flush()
+
+        delta, new_contact = self.frames[-1][1]['contacts']
+        self.assertEqual(delta, {'id': 1, 'last_message': {'id': 0, 'body': 'hi'}, 'unread_message_count': 0})
+        self.assertEqual(new_contact, self.contact(2, 5))
+
+    def test_unchanged_contacts_are_not_sent(self):
+        self.buffer.publish(contacts=[self.contact(1, 1)])
+        self.buffer.flush()
+        self.buffer.publish(contacts=[self.contact(1, 1)])
+        self.buffer.flush()
+        self.assertEqual(len(self.frames), 1)
+
+    def test_window_timer_flushes_automatically(self):
+        buffer = FanoutBuffer(window=0.05, send=lambda group, event: self.frames.append((group, event)))
+        buffer.publish(messages=[{'id': 1, 'contact': 7}])
+        time.sleep(0.3)
+        self.assertEqual([group for group, _ in self.frames], ['whatsappapi_messages_7', 'whatsappapi_messages'])
+
+
+class ConversationSubscriptionTests(SimpleTestCase):
+    def test_sockets_only_receive_subscribed_conversations(self):
+        buffer = FanoutBuffer(window=0)
+
+        async def run():
+            agent = WebsocketCommunicator(WAMessagesConsumer.as_asgi(), '/ws/whatsappapiSocket/messages/')
+            supervisor = WebsocketCommunicator(WAMessagesConsumer.as_asgi(), '/ws/whatsappapiSocket/messages/')
+            await agent.connect()
+            await supervisor.connect()
+
+            await agent.send_json_to({'operation': 'subscribe', 'contact_ids': [1, 2]})
+            self.assertEqual((await agent.receive_json_from())['subscriptions'], ['whatsappapi_messages_1', 'whatsappapi_messages_2'])
+            await agent.send_json_to({'operation': 'unsubscribe', 'contact_id': 2})
+            await agent.receive_json_from()
+            await supervisor.send_json_to({'operation': 'subscribe_all'})
+            await supervisor.receive_json_from()
+
+            buffer.publish(messages=[{'id': 10, 'contact': 1}, {'id': 11, 'contact': 2}, {'id': 12, 'contact': 3}])
+            agent_frame = await agent.receive_json_from()
+            supervisor_frame = await supervisor.receive_json_from()
+            agent_idle = await agent.receive_nothing()
+
+            await agent.disconnect()
+            await supervisor.disconnect()
+            return agent_frame, supervisor_frame, agent_idle
+
+        agent_frame, supervisor_frame, agent_idle = asyncio.run(run())
+        self.assertEqual([message['id'] for message in agent_frame['messages']], [10])
+        self.assertEqual([message['id'] for message in supervisor_frame['messages']], [10, 11, 12])
+        self.assertTrue(agent_idle)
+
+    def test_sockets_without_subscriptions_receive_every_conversation(self):
+        buffer = FanoutBuffer(window=0)
+
+        async def run():
+            legacy = WebsocketCommunicator(WAMessagesConsumer.as_asgi(), '/ws/whatsappapiSocket/messages/')
+            await legacy.connect()
+            buffer.publish(messages=[{'id': 10, 'contact': 1}, {'id': 11, 'contact': 2}])
+            frame = await legacy.receive_json_from()
+            await legacy.disconnect()
+            return frame
+
+        frame = asyncio.run(run())
+        self.assertEqual(frame['operation'], 'batch_create')
+        self.assertEqual([message['id'] for message in frame['messages']], [10, 11])
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.frames = []
+        self.buffer = FanoutBuffer(window=0, send=lambda group, event: self.frames.append((group, event)))
+        self.contact = Contact.objects.create(wa_id='2348000000000', profile_name='Ada')
+
+    def relay(self):
+        outbox.relay(outbox.claim_events('test-relay', 100), self.buffer)
+
+    def test_saved_messages_are_published_after_relay(self):
+        WAMessage.objects.create(message_id='wamid.1', contact=self.contact, body='Hello', message_mode='received')
+        self.assertEqual(
+            sorted(OutboxEvent.objects.values_list('kind', flat=True)), ['contact', 'message']
+        )
+        self.assertEqual(self.frames, [])
+
+        self.relay()
+        groups = [group for group, _ in self.frames]
+        self.assertEqual(groups, ['whatsappapi_contacts', f'whatsappapi_messages_{self.contact.id}', 'whatsappapi_messages'])
+        self.assertEqual(self.frames[0][1]['contacts'][0]['unread_message_count'], 1)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_rolled_back_writes_publish_nothing(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                WAMessage.objects.create(message_id='wamid.1', contact=self.contact, body='Hello')
+                raise RuntimeError('rollback')
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_ingested_payload_is_coalesced_per_contact(self):
+        process_webhook_payload({'entry': [{'id': 'W1', 'changes': [{'value': {
+            'contacts': [{'wa_id': '2348000000000', 'profile': {'name': 'Ada'}}],
+            'messages': [
+                {'from': '2348000000000', 'id': f'wamid.{n}', 'type': 'text', 'text': {'body': f'Message {n}'}}
+                for n in range(3)
+            ],
+        }}]}]})
+        self.relay()
+        contacts_frame = self.frames[0][1]
+        self.assertEqual(len(contacts_frame['contacts']), 1)
+        self.assertEqual(contacts_frame['contacts'][0]['unread_message_count'], 3)
+        self.assertEqual(len(self.frames[1][1]['messages']), 3)
+
+    def test_receipts_only_move_forward_and_reach_the_conversation(self):
+        message = WAMessage.objects.create(message_id='wamid.out', contact=self.contact, message_mode='sent')
+        OutboxEvent.objects.all().delete()
+
+        def receipt(status, timestamp):
+            return {'entry': [{'id': f'W-{status}', 'changes': [{'value': {
+                'statuses': [{'id': 'wamid.out', 'status': status, 'timestamp': str(timestamp)}],
+            }}]}]}
+
+        process_webhook_payload(receipt('read', 1700000200))
+        process_webhook_payload(receipt('delivered', 1700000100))
+        message.refresh_from_db()
+        self.assertEqual(message.delivery_status, 'read')
+        self.assertEqual(int(message.delivery_updated_at.timestamp()), 1700000200)
+        self.assertEqual(message.statuses.count(), 2)
+
+        self.relay()
+        receipts = [event for group, event in self.frames if group == f'whatsappapi_messages_{self.contact.id}']
+        self.assertEqual(receipts[0]['type'], 'receipts_batch')
+        self.assertEqual(receipts[0]['receipts'][0]['delivery_status'], 'read')
+
+    def test_seen_acknowledgements_are_batched_up_to_a_watermark(self):
+        messages = [
+            WAMessage.objects.create(message_id=f'wamid.{n}', contact=self.contact, body='Hi', message_mode='received')
+            for n in range(4)
+        ]
+        self.relay()
+        self.frames.clear()
+
+        acknowledgements = SeenAcknowledgements(debounce=60)
+
+        async def acknowledge():
+            acknowledgements.acknowledge(self.contact.id, messages[0].pk)
+            acknowledgements.acknowledge(self.contact.id, messages[2].pk)
+            acknowledgements.acknowledge(self.contact.id, messages[1].pk)
+            return acknowledgements.take()
+
+        watermarks = asyncio.run(acknowledge())
+        self.assertEqual(watermarks, {self.contact.id: messages[2].pk})
+        # Savepoint, messages, counters, read back, outbox, release
+        with self.assertNumQueries(6):
+            unread = mark_seen(watermarks)
+        self.assertEqual(unread, {self.contact.id: 1})
+        self.assertEqual(list(WAMessage.objects.filter(seen=False).values_list('pk', flat=True)), [messages[3].pk])
+
+        self.relay()
+        self.assertEqual(self.frames, [('whatsappapi_contacts', {
+            'type': 'contacts_batch', 'contacts': [{'unread_message_count': 1, 'id': self.contact.id}],
+        })])
+
+
+    def test_postgres_mark_seen_is_a_single_statement(self):
+        sql, params = mark_seen_sql({7: 120, 9: None})
+        self.assertEqual(sql.count('%s'), len(params))
+        self.assertEqual(params, [7, 120, 9, 'received', [7, 9]])
+        self.assertEqual(sql.count('UPDATE'), 2)
+        self.assertTrue(sql.startswith('WITH flipped AS ('))
+
+
+class InlineProcessPool:
+    """
+    Stands in for the replay ProcessPoolExecutor: runs each task at once in
+    this process (spawned workers would not see the test database), after a
+    pickle round trip like a spawned worker's.
+    """
+    created = []
+
+    def __init__(self, max_workers, mp_context, initializer):
+        self.created.append((max_workers, mp_context.get_start_method(), initializer))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, fn, *args):
+        fn, args = pickle.loads(pickle.dumps((fn, args)))
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def webhook_payload(message_id):
+    return {'entry': [{'id': 'WABA-1', 'changes': [{'value': {
+        'contacts': [{'wa_id': '2348000000000', 'profile': {'name': 'Ada'}}],
+        'messages': [{'from': '2348000000000', 'id': message_id, 'type': 'text', 'text': {'body': 'Hi'}}],
+    }}]}]}
+
+
+class WebhookJournalTests(TestCase):
+    def test_every_distinct_payload_is_journaled_once(self):
+        process_webhook_payload(webhook_payload('wamid.1'))
+        process_webhook_payload(webhook_payload('wamid.1'))
+        process_webhook_payload(webhook_payload('wamid.2'))
+
+        self.assertEqual(WebhookEvent.objects.count(), 2)
+        event = WebhookEvent.objects.order_by('id').first()
+        self.assertEqual(event.account_id, 'WABA-1')
+        self.assertEqual(event.payload, webhook_payload('wamid.1'))
+        self.assertEqual(event.content_hash, journal.payload_hash(webhook_payload('wamid.1')))
+
+    def test_a_payload_that_fails_to_ingest_stays_journaled(self):
+        with mock.patch.object(ingestion, 'record_new_messages', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                process_webhook_payload(webhook_payload('wamid.1'))
+
+        self.assertFalse(WAMessage.objects.exists())
+        self.assertEqual(WebhookEvent.objects.get().content_hash, journal.payload_hash(webhook_payload('wamid.1')))
+
+    def test_payloads_without_contacts_messages_or_statuses_are_skipped(self):
+        with self.assertNumQueries(0):
+            result = process_webhook_payload({'entry': [{'id': 'WABA-1', 'changes': [{'value': {}}]}]})
+        self.assertEqual(result['messages'], 0)
+
+    def test_query_count_does_not_grow_with_the_payload(self):
+        def payload(prefix, count):
+            return {'entry': [{'id': 'WABA-1', 'changes': [{'value': {
+                'contacts': [{'wa_id': f'{prefix}{i}', 'profile': {'name': 'Ada'}} for i in range(count)],
+                'messages': [
+                    {'from': f'{prefix}{i}', 'id': f'wamid.{prefix}{i}', 'type': 'text', 'text': {'body': 'Hi'}}
+                    for i in range(count)
+                ],
+                'statuses': [
+                    {'id': f'wamid.{prefix}{i}', 'status': 'read', 'timestamp': '1700000000'} for i in range(count)
+                ],
+            }}]}]}
+
+        with CaptureQueriesContext(connection) as single:
+            process_webhook_payload(payload('1', 1))
+        with self.assertNumQueries(len(single)):
+            result = process_webhook_payload(payload('2', 25))
+
+        self.assertEqual((result['new_messages'], result['missing_statuses']), (25, 0))
+        self.assertEqual(Status.objects.count(), 26)
+
+    def test_redelivered_payload_is_counted_once(self):
+        process_webhook_payload(webhook_payload('wamid.1'))
+        self.assertEqual(process_webhook_payload(webhook_payload('wamid.1'))['new_messages'], 0)
+
+        # A concurrent delivery of wamid.2 commits while this one waits for the contact lock
+        lock_contacts = ingestion.lock_contacts
+
+        def racing_lock(contact_ids):
+            lock_contacts(contact_ids)
+            with mock.patch.object(ingestion, 'lock_contacts', lock_contacts):
+                process_webhook_payload(webhook_payload('wamid.2'))
+
+        with mock.patch.object(ingestion, 'lock_contacts', racing_lock):
+            self.assertEqual(process_webhook_payload(webhook_payload('wamid.2'))['new_messages'], 0)
+
+        contact = Contact.objects.get()
+        self.assertEqual(contact.unread_count, 2)
+        self.assertEqual(contact.last_message_message_id, 'wamid.2')
+        self.assertEqual(WAMessage.objects.count(), 2)
+
+    def test_expired_days_are_exported_and_deleted(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, True)
+        process_webhook_payload(webhook_payload('wamid.1'))
+        process_webhook_payload(webhook_payload('wamid.2'))
+        WebhookEvent.objects.update(day=date(2020, 1, 1))
+        process_webhook_payload(webhook_payload('wamid.3'))
+
+        with override_settings(MEDIA_ROOT=media_root):
+            call_command('archive_webhook_events', retention_days=30, chunk_size=1, stdout=open(os.devnull, 'w'))
+            with default_storage.open(journal.archive_name(date(2020, 1, 1))) as exported:
+                lines = gzip.decompress(exported.read()).decode().splitlines()
+
+        self.assertEqual([json.loads(line)['payload'] for line in lines], [webhook_payload('wamid.1'), webhook_payload('wamid.2')])
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+    def test_replaying_the_journal_is_idempotent(self):
+        process_webhook_payload(webhook_payload('wamid.1'))
+        receipt = {'entry': [{'id': 'WABA-1', 'changes': [{'value': {
+            'statuses': [{'id': 'wamid.1', 'status': 'read', 'timestamp': '1700000000'}],
+        }}]}]}
+        path = os.path.join(tempfile.mkdtemp(), 'payloads.jsonl.gz')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), True)
+        with gzip.open(path, 'wt') as archive:
+            archive.write(json.dumps(receipt) + '\n' + json.dumps(webhook_payload('wamid.2')) + '\n')
+
+        for _ in range(2):
+            call_command('replay_webhooks', file=path, workers=1, stdout=open(os.devnull, 'w'))
+            call_command('replay_webhooks', workers=1, rebuild_inbox=True, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(WAMessage.objects.count(), 2)
+        self.assertEqual(Status.objects.count(), 1)
+        self.assertEqual(WebhookEvent.objects.count(), 3)
+        self.assertEqual(WAMessage.objects.get(message_id='wamid.1').delivery_status, 'read')
+        self.assertEqual(Contact.objects.get().unread_count, 2)
+
+
+    def test_replaying_with_a_process_pool(self):
+        receipt = {'entry': [{'id': 'WABA-1', 'changes': [{'value': {
+            'statuses': [{'id': 'wamid.1', 'status': 'read', 'timestamp': '1700000000'}],
+        }}]}]}
+        # The receipt is journaled before its message, its chunk is replayed again at the end
+        journal.journal_payload(receipt)
+        for i in range(1, 6):
+            journal.journal_payload(webhook_payload(f'wamid.{i}'))
+        InlineProcessPool.created.clear()
+        out = io.StringIO()
+
+        with mock.patch.object(replay_webhooks, 'ProcessPoolExecutor', InlineProcessPool):
+            call_command('replay_webhooks', workers=2, chunk_size=1, rebuild_inbox=True, stdout=out)
+
+        self.assertEqual(InlineProcessPool.created, [(2, 'spawn', django.setup)])
+        self.assertIn('Replayed 1 payload(s) again', out.getvalue())
+        self.assertIn('Replayed 6 payload(s): 5 message(s) (5 new), 1 status(es), 0 error(s)', out.getvalue())
+        self.assertEqual(WAMessage.objects.count(), 5)
+        self.assertEqual(WAMessage.objects.get(message_id='wamid.1').delivery_status, 'read')
+        self.assertEqual(Contact.objects.get().unread_count, 5)
+
+class WebhookQueueTests(TestCase):
+    def expire_claims(self):
+        WebhookQueueItem.objects.update(claimed_at=timezone.now() - webhook_queue.CLAIM_TIMEOUT - timedelta(seconds=1))
+
+    def test_claims_oldest_first_and_counts_attempts(self):
+        items = [webhook_queue.enqueue_webhook(webhook_payload(f'wamid.{i}')) for i in range(3)]
+
+        claimed = webhook_queue.claim_webhooks('worker-a', 2)
+
+        self.assertEqual([item.id for item in claimed], [items[0].id, items[1].id])
+        self.assertTrue(all(item.status == 'processing' and item.attempts == 1 for item in claimed))
+        self.assertTrue(all(item.claimed_by == 'worker-a' for item in claimed))
+        self.assertEqual([item.id for item in webhook_queue.claim_webhooks('worker-b', 2)], [items[2].id])
+        self.assertEqual(webhook_queue.claim_webhooks('worker-c', 2), [])
+
+    def test_claim_locks_rows_with_skip_locked(self):
+        item = webhook_queue.enqueue_webhook(webhook_payload('wamid.1'))
+        statements = []
+
+        def strip_lock(execute, sql, params, many, context):
+            # SQLite cannot run the lock clause, record that it was asked for and run the rest
+            statements.append(sql)
+            return execute(sql.replace(' FOR UPDATE SKIP LOCKED', ''), params, many, context)
+
+        with mock.patch.object(connection.features, 'has_select_for_update', True), \
+                mock.patch.object(connection.features, 'has_select_for_update_skip_locked', True), \
+                connection.execute_wrapper(strip_lock):
+            claimed = webhook_queue.claim_webhooks('worker-a', 10)
+
+        self.assertEqual([i.id for i in claimed], [item.id])
+        self.assertTrue(any(sql.endswith('FOR UPDATE SKIP LOCKED') for sql in statements))
+
+    def test_a_row_is_never_claimed_twice(self):
+        item = webhook_queue.enqueue_webhook(webhook_payload('wamid.1'))
+        raced = []
+
+        def race(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            # worker-b claims the rows worker-a has just selected, before worker-a's UPDATE
+            if not raced and sql.startswith('SELECT') and 'ORDER BY' in sql:
+                raced.append(None)
+                raced.extend(webhook_queue.claim_webhooks('worker-b', 10))
+            return result
+
+        with connection.execute_wrapper(race):
+            self.assertEqual(webhook_queue.claim_webhooks('worker-a', 10), [])
+
+        self.assertEqual([i.id for i in raced[1:]], [item.id])
+        item.refresh_from_db()
+        self.assertEqual((item.claimed_by, item.attempts), ('worker-b', 1))
+
+    def test_abandoned_claims_are_taken_over(self):
+        item = webhook_queue.enqueue_webhook(webhook_payload('wamid.1'))
+        webhook_queue.claim_webhooks('worker-a', 10)
+        self.assertEqual(webhook_queue.claim_webhooks('worker-b', 10), [])
+
+        self.expire_claims()
+
+        self.assertEqual([i.id for i in webhook_queue.claim_webhooks('worker-b', 10)], [item.id])
+        item.refresh_from_db()
+        self.assertEqual((item.claimed_by, item.attempts), ('worker-b', 2))
+
+    def test_failed_items_are_retried_after_a_backoff(self):
+        item = webhook_queue.enqueue_webhook(webhook_payload('wamid.1'))
+        [claimed] = webhook_queue.claim_webhooks('worker-a', 10)
+
+        with mock.patch.object(webhook_queue.random, 'uniform', side_effect=lambda low, high: high):
+            webhook_queue.fail(claimed, ValueError('boom'))
+
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.claimed_by, item.last_error), ('pending', '', 'boom'))
+        delay = (item.next_attempt_at - timezone.now()).total_seconds()
+        self.assertAlmostEqual(delay, webhook_queue.RETRY_BACKOFF * 2, delta=1)
+        self.assertEqual(webhook_queue.claim_webhooks('worker-a', 10), [])
+
+        WebhookQueueItem.objects.update(next_attempt_at=timezone.now())
+        [claimed] = webhook_queue.claim_webhooks('worker-a', 10)
+        self.assertEqual(claimed.attempts, 2)
+
+    def test_items_fail_after_max_attempts(self):
+        item = webhook_queue.enqueue_webhook(webhook_payload('wamid.1'))
+        WebhookQueueItem.objects.update(attempts=webhook_queue.MAX_ATTEMPTS - 1)
+        [claimed] = webhook_queue.claim_webhooks('worker-a', 10)
+
+        webhook_queue.fail(claimed, ValueError('boom'))
+
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.last_error), ('failed', 'boom'))
+        WebhookQueueItem.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(webhook_queue.claim_webhooks('worker-a', 10), [])
+
+    def test_payloads_that_kill_their_worker_fail_on_claim(self):
+        item = webhook_queue.enqueue_webhook(webhook_payload('wamid.1'))
+        for _ in range(webhook_queue.MAX_ATTEMPTS):
+            self.assertEqual(len(webhook_queue.claim_webhooks('worker-a', 10)), 1)
+            self.expire_claims()
+
+        self.assertEqual(webhook_queue.claim_webhooks('worker-a', 10), [])
+
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.claimed_by, item.claimed_at), ('failed', '', None))
+        self.assertIn('Abandoned', item.last_error)
+
+    def test_queue_stats_and_metrics_view(self):
+        items = [webhook_queue.enqueue_webhook(webhook_payload(f'wamid.{i}')) for i in range(4)]
+        WebhookQueueItem.objects.filter(id=items[0].id).update(status='failed', received_at=timezone.now() - timedelta(hours=1))
+        WebhookQueueItem.objects.filter(id=items[1].id).update(received_at=timezone.now() - timedelta(seconds=60))
+        webhook_queue.claim_webhooks('worker-a', 1)
+
+        stats = webhook_queue.queue_stats()
+        self.assertEqual((stats['pending'], stats['processing'], stats['failed']), (2, 1, 1))
+        self.assertAlmostEqual(stats['lag_seconds'], 60, delta=5)
+
+        api = APIClient()
+        api.force_authenticate(get_user_model().objects.create(username='agent', email='agent@example.com'))
+        response = api.get('/whatsappAPI/webhook-queue/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({key: response.data[key] for key in ('pending', 'processing', 'failed')}, {'pending': 2, 'processing': 1, 'failed': 1})
+
+
+class WebhookQueueWorkerTests(TransactionTestCase):
+    # The command's workers run on their own threads and connections
+
+    def test_once_drains_the_queue(self):
+        good = webhook_queue.enqueue_webhook(webhook_payload('wamid.1'))
+        bad = webhook_queue.enqueue_webhook({'entry': 'bad'})
+        process = process_webhook_queue.process_webhook_payload
+
+        def process_or_raise(payload):
+            if payload == {'entry': 'bad'}:
+                raise ValueError('bad payload')
+            return process(payload)
+
+        with mock.patch.object(process_webhook_queue, 'process_webhook_payload', side_effect=process_or_raise), \
+                mock.patch.object(webhook_queue.random, 'uniform', side_effect=lambda low, high: high):
+            call_command('process_webhook_queue', once=True, workers=1, batch_size=1, stdout=open(os.devnull, 'w'))
+
+        self.assertFalse(WebhookQueueItem.objects.filter(id=good.id).exists())
+        self.assertTrue(WAMessage.objects.filter(message_id='wamid.1').exists())
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts, bad.last_error), ('pending', 1, 'bad payload'))
+
+
+class InboxSummaryRebuildTests(TestCase):
+    def test_rebuild_restores_corrupted_summaries(self):
+        ada = Contact.objects.create(wa_id='2348000000000', profile_name='Ada')
+        bob = Contact.objects.create(wa_id='2348000000001', profile_name='Bob')
+        WAMessage.objects.create(contact=ada, message_id='wamid.1', body='Hi', seen=True)
+        WAMessage.objects.create(contact=ada, message_id='wamid.2', body='Still there?')
+        WAMessage.objects.create(contact=ada, message_id='wamid.3', body='Yes', message_mode='sent')
+        last = WAMessage.objects.create(contact=ada, message_id='wamid.4', message_type='image', media_id='media-1')
+        expected = list(Contact.objects.order_by('pk').values(
+            'last_message_pk', 'last_message_message_id', 'last_message_type', 'last_message_body', 'unread_count',
+        ))
+        self.assertEqual(expected[0]['last_message_pk'], last.pk)
+        self.assertEqual(expected[0]['unread_count'], 2)
+
+        Contact.objects.update(
+            last_message_pk=999, last_message_message_id='wamid.stale', last_message_type='text',
+            last_message_body='stale', last_message_at=timezone.now(), unread_count=40,
+        )
+        call_command('rebuild_inbox_summaries', batch_size=1, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(list(Contact.objects.order_by('pk').values(*expected[0])), expected)
+        ada.refresh_from_db()
+        bob.refresh_from_db()
+        self.assertEqual(ada.last_message_at, last.timestamp)
+        self.assertEqual((bob.last_message_pk, bob.last_message_message_id, bob.last_message_at, bob.unread_count), (None, '', None, 0))
+
+
+class MessageSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create(username='agent', email='agent@example.com'))
+        self.ada = Contact.objects.create(wa_id='2348000000001', profile_name='Ada')
+        self.bola = Contact.objects.create(wa_id='2348000000002', profile_name='Bola')
+
+    def message(self, contact, message_id, body='', **fields):
+        return WAMessage.objects.create(contact=contact, message_id=message_id, body=body, **fields)
+
+    def search(self, **params):
+        response = self.client.get('/whatsappAPI/messages/search/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_ranked_filtered_and_paginated(self):
+        self.message(self.ada, 'wamid.1', 'Where is my refund? I asked for the refund last week')
+        self.message(self.ada, 'wamid.2', 'Thanks for the refund')
+        self.message(self.bola, 'wamid.3', 'Refund please')
+        self.message(self.bola, 'wamid.4', message_type='image', caption='receipt for the refund')
+        self.message(self.bola, 'wamid.5', 'Hello')
+
+        data = self.search(q='refund')
+        self.assertEqual(len(data['results']), 4)
+        ranks = [m['rank'] for m in data['results']]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+        self.assertIn('<mark>refund</mark>', data['results'][0]['snippet'].lower())
+
+        self.assertEqual(sorted(m['message_id'] for m in self.search(q='refund', contact=self.bola.id)['results']), ['wamid.3', 'wamid.4'])
+        self.assertEqual([m['message_id'] for m in self.search(q='refund', message_type='image')['results']], ['wamid.4'])
+        self.assertEqual(self.search(q='refund', since='2999-01-01')['results'], [])
+
+        seen, cursor = [], None
+        while True:
+            data = self.search(q='refund', page_size=3, **({'cursor': cursor} if cursor else {}))
+            seen += [m['message_id'] for m in data['results']]
+            cursor = data['next']
+            if not cursor:
+                break
+        self.assertEqual(sorted(seen), ['wamid.1', 'wamid.2', 'wamid.3', 'wamid.4'])
+
+    def test_index_follows_edits_and_escapes_snippets(self):
+        message = self.message(self.ada, 'wamid.1', '<b>invoice</b> attached')
+        self.assertEqual(self.search(q='invoice')['results'][0]['snippet'], '&lt;b&gt;<mark>invoice</mark>&lt;/b&gt; attached')
+
+        message.body = 'nothing to see'
+        message.save()
+        self.assertEqual(self.search(q='invoice')['results'], [])
+        self.assertEqual(len(self.search(q='noth')['results']), 1)
+        message.delete()
+        self.assertEqual(self.search(q='nothing')['results'], [])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.contact = Contact.objects.create(wa_id='2348000000001', profile_name='Ada')
+        self.start = timezone.now() - timedelta(days=1)
+        self.messages = [
+            WAMessage.objects.create(contact=self.contact, message_id=f'wamid.{n}', body=f'Message {n}')
+            for n in range(7)
+        ]
+        # Messages 2, 3 and 4 share a timestamp, the id breaks the tie
+        for n, message in enumerate(self.messages):
+            minutes = 3 if 2 <= n <= 4 else n
+            WAMessage.objects.filter(pk=message.pk).update(timestamp=self.start + timedelta(minutes=minutes))
+
+    def page(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def ids(self, page):
+        return [message['id'] for message in page['results']]
+
+    def test_walking_back_with_before_visits_every_message_once(self):
+        url = f'/whatsappAPI/messages/{self.contact.id}/'
+        pages = [self.page(url, page_size=3)]
+        while pages[-1]['before']:
+            pages.append(self.page(url, page_size=3, before=pages[-1]['before']))
+
+        expected = [m.pk for m in reversed(self.messages)]
+        self.assertEqual([self.ids(page) for page in pages], [expected[:3], expected[3:6], expected[6:]])
+        self.assertIsNone(pages[-1]['before'])
+
+    def test_polling_with_after_returns_only_newer_messages(self):
+        url = f'/whatsappAPI/messages/{self.contact.id}/'
+        after = self.page(url, page_size=3)['after']
+        self.assertEqual(self.page(url, after=after), {'before': None, 'after': after, 'results': []})
+
+        newer = [
+            WAMessage.objects.create(contact=self.contact, message_id=f'wamid.new{n}', body='New')
+            for n in range(2)
+        ]
+        page = self.page(url, after=after)
+        self.assertEqual(self.ids(page), [newer[1].pk, newer[0].pk])
+        self.assertEqual(self.ids(self.page(url, after=page['after'])), [])
+        # The `before` cursor of a polled page continues into the older messages
+        self.assertEqual(self.ids(self.page(url, page_size=1, before=page['before'])), [self.messages[-1].pk])
+
+    def test_invalid_cursors_return_400(self):
+        url = f'/whatsappAPI/messages/{self.contact.id}/'
+        not_a_datetime = base64.urlsafe_b64encode(json.dumps(['yesterday', 1]).encode()).decode()
+        for params in ({'before': 'garbage'}, {'after': 'garbage'}, {'before': not_a_datetime}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertEqual(response.data['error'], 'Validation error')
+        self.assertEqual(self.client.get('/whatsappAPI/contacts/', {'before': 'garbage'}).status_code, 400)
+
+    def test_page_size_is_clamped(self):
+        Contact.objects.bulk_create([Contact(wa_id=f'23490{n:08d}') for n in range(205)])
+        self.assertEqual(len(self.page('/whatsappAPI/contacts/', page_size=1000)['results']), 200)
+        self.assertEqual(len(self.page('/whatsappAPI/contacts/', page_size=0)['results']), 1)
+        self.assertEqual(len(self.page('/whatsappAPI/contacts/', page_size='many')['results']), 50)
+
+
+class ContactSearchTests(TestCase):
+    def setUp(self):
+        self.ada = Contact.objects.create(wa_id='2348011112222', profile_name='Ada Lovelace')
+        self.bola = Contact.objects.create(wa_id='2347033334444', profile_name='Bola')
+        self.unnamed = Contact.objects.create(wa_id='4915055556666')
+
+    def search(self, q):
+        return set(search_contacts(Contact.objects.all(), q))
+
+    def test_sqlite_matches_prefixes_of_the_name_or_wa_id(self):
+        self.assertEqual(self.search('ada'), {self.ada})
+        self.assertEqual(self.search('  BOLA '), {self.bola})
+        self.assertEqual(self.search('23470'), {self.bola})
+        self.assertEqual(self.search('491'), {self.unnamed})
+        self.assertEqual(self.search('234'), {self.ada, self.bola})
+        # Prefixes only: no substrings of either field
+        self.assertEqual(self.search('love'), set())
+        self.assertEqual(self.search('4444'), set())
+        self.assertEqual(self.search(''), {self.ada, self.bola, self.unnamed})
+
+    def test_sqlite_search_uses_the_nocase_indexes(self):
+        plan = search_contacts(Contact.objects.all(), 'ada').explain()
+        self.assertIn('wa_contact_name_nocase', plan)
+        self.assertIn('wa_contact_waid_nocase', plan)
+
+    def test_postgres_matches_substrings_of_the_name_or_wa_id(self):
+        with mock.patch('whatsappAPI.search.connection', mock.Mock(vendor='postgresql')):
+            self.assertEqual(self.search('LOVE'), {self.ada})
+            self.assertEqual(self.search('4444'), {self.bola})
+            self.assertEqual(self.search('5555'), {self.unnamed})
+
+    def test_contact_list_filters_by_q(self):
+        response = APIClient().get('/whatsappAPI/contacts/', {'q': 'bo'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([contact['id'] for contact in response.data['results']], [self.bola.id])
@@ -5,8 +5,11 @@ from .views.views import *
 
 urlpatterns = [
     path('templates/', template_list_create, name='template-list-create'),
+    path('templates/<int:template_id>/broadcast/', template_broadcast, name='template_broadcast'),
     path('send-template-message/', send_whatsapp_message, name='send_message'),
     path('whatsapp-webhook/', whatsapp_webhook, name='whatsapp_webhook'),
+    path('webhook-queue/metrics/', webhook_queue_metrics, name='webhook_queue_metrics'),
+    path('messages/search/', message_search, name='message_search'),
     path('messages/<int:contact_id>/', message_list, name='message_list'),
     path('contacts/', contact_list, name='contact_list'),
     path('media/<str:media_id>/', get_media, name='get_media'),
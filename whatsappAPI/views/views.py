@@ -2,16 +2,28 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from django.core.exceptions import ValidationError
-from ..models import Contact, WAMessage, WATemplateSchema
-from ..serializers import WAMessageSerializer, ContactSerializer, WATemplateSchemaSerializer
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time
+from ..models import Contact, WAMessage, WATemplateSchema, MESSAGE_TYPES
+from ..pagination import KeysetPagination
+from ..search import search_contacts, search_messages
+from ..broadcast import queue_broadcast
+from ..serializers import WAMessageSerializer, PaginatedWAMessageSerializer, ContactSerializer, PaginatedContactSerializer, WATemplateSchemaSerializer, BroadcastSerializer, MessageSearchResultSerializer, PaginatedMessageSearchSerializer
 from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
 
 
 @swagger_auto_schema(
     method='get',
-    operation_description="Get all WhatsApp messages for a specific contact",
+    operation_description="Get the WhatsApp messages of a specific contact, newest first, with cursor pagination",
+    manual_parameters=[
+        openapi.Parameter('before', openapi.IN_QUERY, description="Cursor: return messages older than this position", type=openapi.TYPE_STRING),
+        openapi.Parameter('after', openapi.IN_QUERY, description="Cursor: return messages newer than this position", type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Number of messages per page (max 200)", type=openapi.TYPE_INTEGER),
+    ],
     responses={
-        200: WAMessageSerializer(many=True),
+        200: PaginatedWAMessageSerializer,
         404: "Contact not found",
         400: "Bad request"
     }
@@ -25,23 +37,111 @@ def message_list(request, contact_id):
             return Response({'error': 'Invalid contact ID'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Validate contact exists
-        try:
-            contact = Contact.objects.get(id=contact_id)
-        except Contact.DoesNotExist:
+        if not Contact.objects.filter(id=contact_id).exists():
             return Response({'error': 'Contact not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        WAmessages = WAMessage.objects.filter(contact_id=contact_id)
+        paginator = KeysetPagination('timestamp')
+        WAmessages, cursors = paginator.paginate_queryset(WAMessage.objects.filter(contact_id=contact_id), request)
         WAmessages_serializer = WAMessageSerializer(WAmessages, many=True)
-        return Response(WAmessages_serializer.data, status=status.HTTP_200_OK)
+        return Response({**cursors, 'results': WAmessages_serializer.data}, status=status.HTTP_200_OK)
+    except ValidationError as e:
+        return Response({'error': 'Validation error', 'details': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         print(f"Error in message_list: {e}")
         return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# ----------------------------------------------------------------
+# Full-text search over the message history
+# ----------------------------------------------------------------
+def parse_search_bound(value, name):
+    """A date or datetime query parameter; dates are taken as midnight in the current time zone."""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError(f'{name} must be a date or datetime')
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="Search the body and caption of WhatsApp messages, best matches first, with highlighted snippets and cursor pagination",
+    manual_parameters=[
+        openapi.Parameter('q', openapi.IN_QUERY, description="Words to search for", type=openapi.TYPE_STRING, required=True),
+        openapi.Parameter('contact', openapi.IN_QUERY, description="Only messages of this contact id", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('since', openapi.IN_QUERY, description="Only messages sent at or after this date/datetime", type=openapi.TYPE_STRING),
+        openapi.Parameter('until', openapi.IN_QUERY, description="Only messages sent before this date/datetime", type=openapi.TYPE_STRING),
+        openapi.Parameter('message_type', openapi.IN_QUERY, description="Only messages of this type", type=openapi.TYPE_STRING),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Cursor of the page to return", type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Number of messages per page (max 100)", type=openapi.TYPE_INTEGER),
+    ],
+    responses={
+        200: PaginatedMessageSearchSerializer,
+        400: "Bad request",
+        500: "Internal server error"
+    }
+)
+@api_view(['GET'])
+def message_search(request):
+    try:
+        params = request.query_params
+        q = (params.get('q') or '').strip()
+        if not q:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        contact_id = params.get('contact')
+        if contact_id and not contact_id.isdigit():
+            return Response({'error': 'Invalid contact ID'}, status=status.HTTP_400_BAD_REQUEST)
+        message_type = params.get('message_type')
+        if message_type and message_type not in dict(MESSAGE_TYPES):
+            return Response({'error': 'Invalid message type'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page_size = max(1, min(int(params.get('page_size', 20)), 100))
+        except ValueError:
+            page_size = 20
+
+        page, next_cursor = search_messages(
+            q,
+            contact_id=int(contact_id) if contact_id else None,
+            since=parse_search_bound(params.get('since'), 'since'),
+            until=parse_search_bound(params.get('until'), 'until'),
+            message_type=message_type,
+            cursor=params.get('cursor'),
+            page_size=page_size,
+        )
+        messages = WAMessage.objects.in_bulk([pk for pk, _, _ in page])
+        results = []
+        for pk, rank, snippet in page:
+            if pk not in messages:
+                continue
+            message = messages[pk]
+            message.rank = rank
+            message.snippet = snippet
+            results.append(message)
+        serializer = MessageSearchResultSerializer(results, many=True)
+        return Response({'next': next_cursor, 'results': serializer.data}, status=status.HTTP_200_OK)
+    except ValidationError as e:
+        return Response({'error': 'Validation error', 'details': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        print(f"Error in message_search: {e}")
+        return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @swagger_auto_schema(
     method='get',
-    operation_description="Get all WhatsApp contacts",
+    operation_description="Get the WhatsApp contacts, most recently active first, with cursor pagination and search",
+    manual_parameters=[
+        openapi.Parameter('q', openapi.IN_QUERY, description="Search by profile name or WhatsApp ID", type=openapi.TYPE_STRING),
+        openapi.Parameter('before', openapi.IN_QUERY, description="Cursor: return contacts less recently active than this position", type=openapi.TYPE_STRING),
+        openapi.Parameter('after', openapi.IN_QUERY, description="Cursor: return contacts more recently active than this position", type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Number of contacts per page (max 200)", type=openapi.TYPE_INTEGER),
+    ],
     responses={
-        200: ContactSerializer(many=True),
+        200: PaginatedContactSerializer,
+        400: "Bad request",
         500: "Internal server error"
     }
 )
@@ -49,9 +149,13 @@ def message_list(request, contact_id):
 @permission_classes([])
 def contact_list(request):
     try:
-        contacts = Contact.objects.all()
+        contacts = search_contacts(Contact.objects.all(), request.query_params.get('q'))
+        paginator = KeysetPagination('last_activity_at')
+        contacts, cursors = paginator.paginate_queryset(contacts, request)
         serializer = ContactSerializer(contacts, many=True) 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response({**cursors, 'results': serializer.data}, status=status.HTTP_200_OK)
+    except ValidationError as e:
+        return Response({'error': 'Validation error', 'details': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         print(f"Error in contact_list: {e}")
         return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -107,3 +211,59 @@ def template_list_create(request):
         print(f"Error in template_list_create: {e}")
         return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+# ----------------------------------------------------------------
+# Broadcast a template to an audience (sent by `manage.py send_broadcasts`)
+# ----------------------------------------------------------------
+@swagger_auto_schema(
+    method='get',
+    operation_description="Get the progress of a template broadcast",
+    responses={
+        200: WATemplateSchemaSerializer,
+        404: "Template not found"
+    }
+)
+@swagger_auto_schema(
+    method='post',
+    operation_description="Queue a broadcast of a template to all contacts, a list of WhatsApp IDs or a contact search",
+    request_body=BroadcastSerializer,
+    responses={
+        202: WATemplateSchemaSerializer,
+        400: "Bad request",
+        404: "Template not found",
+        409: "Broadcast already in progress"
+    }
+)
+@api_view(['GET', 'POST'])
+def template_broadcast(request, template_id):
+    try:
+        try:
+            template = WATemplateSchema.objects.get(id=template_id)
+        except WATemplateSchema.DoesNotExist:
+            return Response({'error': 'Template not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.method == 'GET':
+            return Response(WATemplateSchemaSerializer(template).data, status=status.HTTP_200_OK)
+
+        serializer = BroadcastSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'error': 'Invalid data', 'details': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        if template.status in ['queued', 'sending']:
+            return Response({'error': 'Broadcast already in progress'}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            queue_broadcast(
+                template,
+                serializer.validated_data['audience'],
+                serializer.validated_data['template_name'],
+                serializer.validated_data['language_code'],
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(WATemplateSchemaSerializer(template).data, status=status.HTTP_202_ACCEPTED)
+    except ValidationError as e:
+        return Response({'error': 'Validation error', 'details': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        print(f"Error in template_broadcast: {e}")
+        return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
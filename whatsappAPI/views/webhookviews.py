@@ -1,16 +1,14 @@
-from django.db import transaction
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django.core.exceptions import ValidationError
-from ..models import Contact, WAMessage, Status, WebhookEvent
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from django.utils.dateparse import parse_datetime
+from ..models import Contact, WAMessage
+from ..webhook_queue import enqueue_webhook, queue_stats
+from ..client import whatsapp_client
+from ..outbound import queue_message
 from django.conf import settings
-import requests
+import httpx
 from rest_framework import status
-from ..serializers import WAMessageSerializer, ContactSerializer
-from datetime import datetime
+from ..serializers import WAMessageSerializer
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from ..serializers import WebhookPayloadSerializer, SendMessageSerializer, TemplateMessageSerializer
@@ -41,153 +39,10 @@ def whatsapp_webhook(request):
         entry = payload.get('entry', [])
         if not entry:
             return Response({'error': 'Invalid webhook payload: missing entry'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        entry = entry[0] if isinstance(entry, list) else entry
-        event_id = entry.get('id')
-        
-        if not event_id:
-            return Response({'error': 'Invalid webhook payload: missing event ID'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Store the entire payload for reference
-        WebhookEvent.objects.get_or_create(event_id=event_id, defaults={'payload': payload})
-        
-        # Start a database transaction
-        with transaction.atomic():
-            changes = entry.get('changes', [])
-            if not changes:
-                return Response({"status": "success", "message": "No changes to process"})
-            
-            changes = changes[0] if isinstance(changes, list) else changes
-            value = changes.get('value', {})
-
-            # Handle contacts
-            for contact_data in value.get('contacts', []):
-                try:
-                    # Validate contact data
-                    wa_id = contact_data.get('wa_id')
-                    if not wa_id:
-                        print("Missing wa_id in contact data")
-                        continue
-                    
-                    profile_name = contact_data.get('profile', {}).get('name', '') if contact_data.get('profile') else ''
-                    
-                    contact, created = Contact.objects.get_or_create(
-                        wa_id=wa_id,
-                        defaults={'profile_name': profile_name}
-                    )
-                    
-                    # Handle messages
-                    for message_data in value.get('messages', []):
-                        try:
-                            # Validate message data
-                            message_id = message_data.get('id')
-                            message_type = message_data.get('type')
-                            
-                            if not message_id or not message_type:
-                                print(f"Missing required message fields: id={message_id}, type={message_type}")
-                                continue
-                            
-                            # Extract message content based on type
-                            body = ''
-                            media_id = ''
-                            mime_type = ''
-                            caption = ''
-                            filename = ''
-                            
-                            if message_type == 'text':
-                                body = message_data.get('text', {}).get('body', '')
-                            else:
-                                # For media messages
-                                media_content = message_data.get(message_type, {})
-                                media_id = media_content.get('id', '')
-                                mime_type = media_content.get('mime_type', '')
-                                caption = media_content.get('caption', '')
-                                filename = media_content.get('filename', '')
-                            
-                            # Check if message already exists
-                            if WAMessage.objects.filter(message_id=message_id).exists():
-                                print(f"Message {message_id} already exists, skipping")
-                                continue
-                            
-                            recieved_message = WAMessage.objects.create(
-                                message_id=message_id,
-                                contact=contact,
-                                message_type=message_type,
-                                body=body,
-                                media_id=media_id,
-                                mime_type=mime_type,
-                                caption=caption,
-                                filename=filename,
-                            )
-                            serialized_message = WAMessageSerializer(recieved_message).data
 
-                            # Send the message to the appropriate WebSocket room
-                            try:
-                                room_name = f'whatsappapi_messages'
-                                channel_layer = get_channel_layer()
-                                if channel_layer:
-                                    async_to_sync(channel_layer.group_send)(
-                                        room_name,
-                                        {
-                                            'type': 'chat_message',
-                                            'operation': "create",
-                                            'contact': ContactSerializer(contact).data,
-                                            'message': serialized_message
-                                        }
-                                    )
-                            except Exception as ws_error:
-                                print(f"WebSocket error: {ws_error}")
-                                # Continue processing even if WebSocket fails
-                                
-                        except Exception as e:
-                            print(f"Error processing message: {e}")
-                            continue
-
-                    # Serialize the contact for WebSocket broadcast
-                    try:
-                        serialized_contact = ContactSerializer(contact).data
-                        general_room_name = 'whatsappapi_contacts'
-                        channel_layer = get_channel_layer()
-                        if channel_layer:
-                            async_to_sync(channel_layer.group_send)(
-                                general_room_name,
-                                {
-                                    'type': 'chat_message',
-                                    'operation': "create",
-                                    'contact': serialized_contact
-                                }
-                            )
-                    except Exception as ws_error:
-                        print(f"WebSocket error for contacts: {ws_error}")
-                        # Continue processing
-                        
-                except Exception as e:
-                    print(f"Error processing contact: {e}")
-                    continue
-            # Handle statuses
-            for status_data in value.get('statuses', []):
-                try:
-                    # Validate status data
-                    message_id = status_data.get('id')
-                    status_value = status_data.get('status')
-                    
-                    if not message_id or not status_value:
-                        print(f"Missing required status fields: id={message_id}, status={status_value}")
-                        continue
-                    
-                    try:
-                        message = WAMessage.objects.get(message_id=message_id)
-                        Status.objects.create(
-                            message=message,
-                            status=status_value
-                        )
-                    except WAMessage.DoesNotExist:
-                        print(f"Message with ID {message_id} not found.")
-                        continue
-                        
-                except Exception as e:
-                    print(f"Error processing status: {e}")
-                    continue
+        # Persist the raw payload and acknowledge right away, the
+        # process_webhook_queue workers take care of the ingestion
+        enqueue_webhook(payload)
 
         return Response({"status": "success"})
     except ValidationError as e:
@@ -196,18 +51,54 @@ def whatsapp_webhook(request):
         print(f"Error in whatsapp_webhook: {e}")
         return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="Depth and lag of the webhook ingestion queue",
+    responses={
+        200: openapi.Response(
+            description="Queue metrics",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'pending': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    'processing': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    'failed': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    'lag_seconds': openapi.Schema(type=openapi.TYPE_NUMBER),
+                }
+            )
+        ),
+        500: "Internal server error"
+    }
+)
+@api_view(['GET'])
+def webhook_queue_metrics(request):
+    try:
+        return Response(queue_stats(), status=status.HTTP_200_OK)
+    except Exception as e:
+        print(f"Error in webhook_queue_metrics: {e}")
+        return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 # ----------------------------------------------------------------
-# send messages to whatsapp api
+# send messages to whatsapp api (queued, sent by `manage.py send_outbound_messages`)
 # ----------------------------------------------------------------
 @swagger_auto_schema(
     method='post',
-    operation_description="Send a message to a contact via WhatsApp API",
+    operation_description=(
+        "Queue a message to a contact. The message is stored as pending and sent to the WhatsApp API "
+        "by a background worker; its final status is pushed to the conversation socket. Retrying a "
+        "request with the same Idempotency-Key returns the same message instead of sending it twice."
+    ),
     request_body=SendMessageSerializer,
+    manual_parameters=[
+        openapi.Parameter('Idempotency-Key', openapi.IN_HEADER, description="Client-generated key, unique per message", type=openapi.TYPE_STRING),
+    ],
     responses={
-        200: openapi.Response(description="Message sent successfully"),
+        200: openapi.Response(description="Message already queued with this idempotency key", schema=WAMessageSerializer),
+        202: openapi.Response(description="Message queued", schema=WAMessageSerializer),
         404: "Contact not found",
         400: "Bad request",
-        500: "Error from WhatsApp API"
+        409: "Idempotency key already used for another contact"
     }
 )
 @api_view(['POST'])
@@ -231,112 +122,20 @@ def send_to_whatsapp_api(request, contact_id):
         serializer = SendMessageSerializer(data=request.data)
         if not serializer.is_valid():
             return Response({'error': 'Invalid data', 'details': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Validate WhatsApp configuration
-        required_settings = ['WHATSAPP_VERSION', 'WHATSAPP_FROM_PHONE_NUMBER_ID', 'WHATSAPP_ACCESS_TOKEN']
-        for setting in required_settings:
-            if not hasattr(settings, setting) or not getattr(settings, setting):
-                return Response({'error': f'WhatsApp configuration missing: {setting}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        url = f"https://graph.facebook.com/{settings.WHATSAPP_VERSION}/{settings.WHATSAPP_FROM_PHONE_NUMBER_ID}/messages"
-        headers = {
-            'Authorization': f'Bearer {settings.WHATSAPP_ACCESS_TOKEN}',
-            'Content-Type': 'application/json'
-        }
 
-        # Extracting the message data from the request
-        message = request.data
-        message['to'] = contact.wa_id
-        print(message)
+        idempotency_key = (request.headers.get('Idempotency-Key') or serializer.validated_data.get('idempotency_key') or '').strip()
+        if len(idempotency_key) > 100:
+            return Response({'error': 'Idempotency key must be at most 100 characters'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Validate message type and required fields
-        message_type = message.get('message_type', 'text')
-        
-        # Constructing the payload based on the message type
-        data = {
-            "messaging_product": "whatsapp",
-            "to": message.get('to'),
-            "type": message_type,
-        }
-
-        if message_type == 'text':
-            body = message.get('body', '').strip()
-            if not body:
-                return Response({'error': 'Message body is required for text messages'}, status=status.HTTP_400_BAD_REQUEST)
-            data["text"] = {"body": body}
-        elif message_type == 'image':
-            link = message.get('link', '').strip()
-            if not link:
-                return Response({'error': 'Link is required for image messages'}, status=status.HTTP_400_BAD_REQUEST)
-            data["image"] = {
-                "link": link,
-                "caption": message.get('caption', '')
-            }
-        elif message_type == 'document':
-            link = message.get('link', '').strip()
-            if not link:
-                return Response({'error': 'Link is required for document messages'}, status=status.HTTP_400_BAD_REQUEST)
-            data["document"] = {
-                "link": link,
-                "caption": message.get('caption', '') 
-            }
-        else:
-            return Response({'error': f'Unsupported message type: {message_type}'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        print(data)
-
-        # Sending the POST request to WhatsApp API
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            
-            # Return the response from WhatsApp API to the client
-            if response.status_code in [200, 201]:
-                try:
-                    response_data = response.json()
-                    message_id = response_data.get('messages', [{}])[0].get('id')
-                    
-                    if not message_id:
-                        return Response({'error': 'No message ID returned from WhatsApp API'}, status=status.HTTP_400_BAD_REQUEST)
-                    
-                    # Convert the ISO string to a datetime object
-                    timestamp_str = message.get('timestamp')
-                    timestamp = None
-                    if timestamp_str:
-                        try:
-                            timestamp_str = timestamp_str.replace('Z', '+00:00')
-                            timestamp = datetime.fromisoformat(timestamp_str)
-                        except ValueError as e:
-                            print(f"Error parsing timestamp: {e}")
-                    
-                    sentmessage = WAMessage.objects.create(
-                        message_id=message_id,
-                        contact=contact,
-                        message_type=message_type,
-                        body=message.get('body', ''),
-                        link=message.get('link', ''),
-                        status='sent',
-                        message_mode=message.get('message_mode', ''),
-                        timestamp=timestamp
-                    )
-                    serialized_message = WAMessageSerializer(sentmessage).data
-                    return Response(serialized_message, status=status.HTTP_200_OK)
-                except (ValueError, KeyError) as e:
-                    print(f"Error processing WhatsApp API response: {e}")
-                    return Response({'error': 'Invalid response from WhatsApp API'}, status=status.HTTP_400_BAD_REQUEST)
-            else:
-                error_message = f"WhatsApp API error: {response.status_code}"
-                try:
-                    error_data = response.json()
-                    error_message += f" - {error_data}"
-                except:
-                    pass
-                return Response({'error': error_message}, status=status.HTTP_400_BAD_REQUEST)
-
-        except requests.exceptions.Timeout:
-            return Response({'error': 'Request timeout to WhatsApp API'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        except requests.exceptions.RequestException as e:
-            print(f"Request error: {e}")
-            return Response({'error': 'Failed to connect to WhatsApp API'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            sent_message, created = queue_message(contact, request.data, idempotency_key)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if sent_message.contact_id != contact.id:
+            return Response({'error': 'Idempotency key already used for another contact'}, status=status.HTTP_409_CONFLICT)
+
+        serialized_message = WAMessageSerializer(sent_message).data
+        return Response(serialized_message, status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK)
     except ValidationError as e:
         return Response({'error': 'Validation error', 'details': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
@@ -390,12 +189,6 @@ def send_whatsapp_message(request):
         # Format template name
         template_name = template_name.replace(' ', '_').lower()
         
-        url = f"https://graph.facebook.com/{settings.WHATSAPP_VERSION}/{settings.WHATSAPP_FROM_PHONE_NUMBER_ID}/messages"
-        headers = {
-            'Authorization': f'Bearer {settings.WHATSAPP_ACCESS_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        
         data = {
             "messaging_product": "whatsapp",
             "to": to_phone_number,
@@ -409,7 +202,7 @@ def send_whatsapp_message(request):
         }
 
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=30)
+            response = whatsapp_client.send_message(data)
             
             if response.status_code == 200:
                 return Response({
@@ -427,9 +220,9 @@ def send_whatsapp_message(request):
                     'status': 'error', 
                     'message': error_message
                 }, status=status.HTTP_400_BAD_REQUEST)
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             return Response({'error': 'Request timeout to WhatsApp API'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Request error: {e}")
             return Response({'error': 'Failed to connect to WhatsApp API'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     except ValidationError as e:
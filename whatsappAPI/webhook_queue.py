@@ -0,0 +1,81 @@
+import random
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from .models import WebhookQueueItem
+from utils import claim_batch
+
+# A claimed item whose worker has not reported back within this window is
+# considered abandoned (crashed worker) and becomes claimable again.
+CLAIM_TIMEOUT = timedelta(seconds=getattr(settings, 'WHATSAPP_WEBHOOK_QUEUE_CLAIM_TIMEOUT', 300))
+MAX_ATTEMPTS = getattr(settings, 'WHATSAPP_WEBHOOK_QUEUE_MAX_ATTEMPTS', 5)
+RETRY_BACKOFF = getattr(settings, 'WHATSAPP_WEBHOOK_QUEUE_BACKOFF', 2.0)
+MAX_RETRY_BACKOFF = 300.0
+
+
+def enqueue_webhook(payload):
+    return WebhookQueueItem.objects.create(payload=payload)
+
+
+def claim_webhooks(worker_name, batch_size):
+    """
+    Claim up to batch_size queued payloads, oldest first, for worker_name.
+
+    Attempts are counted here rather than in fail(): a payload that crashes
+    its worker never gets there and would otherwise be reclaimed after every
+    claim timeout. Items claimed beyond MAX_ATTEMPTS are failed, not returned.
+    """
+    now = timezone.now()
+    claimable = (
+        Q(status='pending', next_attempt_at__lte=now)
+        | Q(status='processing', claimed_at__lt=now - CLAIM_TIMEOUT)
+    )
+    items = claim_batch(
+        WebhookQueueItem.objects.filter(claimable),
+        worker_name,
+        batch_size,
+        status='processing',
+        attempts=F('attempts') + 1,
+    )
+    exhausted = [item.id for item in items if item.attempts > MAX_ATTEMPTS]
+    if exhausted:
+        WebhookQueueItem.objects.filter(id__in=exhausted, claimed_by=worker_name).update(
+            status='failed',
+            claimed_by='',
+            claimed_at=None,
+            last_error=f"Abandoned by its worker after {MAX_ATTEMPTS} attempts",
+        )
+    return [item for item in items if item.attempts <= MAX_ATTEMPTS]
+
+
+def complete(items):
+    WebhookQueueItem.objects.filter(id__in=[item.id for item in items]).delete()
+
+
+def fail(item, error):
+    """Retry the payload later with full-jitter backoff, or fail it after MAX_ATTEMPTS."""
+    status = 'failed' if item.attempts >= MAX_ATTEMPTS else 'pending'
+    delay = random.uniform(0, min(MAX_RETRY_BACKOFF, RETRY_BACKOFF * 2 ** item.attempts))
+    WebhookQueueItem.objects.filter(id=item.id).update(
+        status=status,
+        claimed_by='',
+        claimed_at=None,
+        next_attempt_at=timezone.now() + timedelta(seconds=delay),
+        last_error=str(error),
+    )
+
+
+def queue_stats():
+    """Queue depth per status plus the lag (age of the oldest unprocessed payload)."""
+    counts = dict(
+        WebhookQueueItem.objects.values_list('status').annotate(total=Count('id')).order_by()
+    )
+    oldest = WebhookQueueItem.objects.exclude(status='failed').aggregate(oldest=Min('received_at'))['oldest']
+    lag = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    return {
+        'pending': counts.get('pending', 0),
+        'processing': counts.get('processing', 0),
+        'failed': counts.get('failed', 0),
+        'lag_seconds': round(lag, 3),
+    }